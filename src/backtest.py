@@ -0,0 +1,172 @@
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from execucao import adicionar_argumento_workers
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, cronometrado
+from painel import carregar_fechamentos
+from walk_forward import PASSO_WALK_FORWARD, MIN_TREINO, gerar_previsoes, painel_probabilidades
+
+OHLCV_DIR = "data/ohlcv"
+BACKTEST_DIR = "data/backtest"
+
+# Custos por lado: taxa de corretagem da Binance (0,1%) e slippage estimado
+TAXA = 0.001
+SLIPPAGE = 0.0005
+
+
+def carregar_precos(tickers: list[str], ohlcv_dir: str = OHLCV_DIR) -> pd.DataFrame:
+    """
+    Painel de fechamentos (datas × tickers), do painel mapeado (data/painel) quando ele está em
+    dia com as features; tickers sem preço ficam com NaN.
+    """
+    return carregar_fechamentos(tickers, ohlcv_dir).reindex(columns=tickers)
+
+
+def executar_backtest(close: np.ndarray, proba: np.ndarray, threshold: float = 0.5, rebalanceamento: int = 5,
+                      taxa: float = TAXA, slippage: float = SLIPPAGE, atraso: int = 1, preencher: bool = True) -> dict:
+    """
+    Backtest vetorizado da regra de simulate_purchase_from_csv: em cada data de rebalanceamento o
+    capital é dividido igualmente entre os ativos com probabilidade >= threshold (sem sinais, fica
+    em caixa) e as quantidades ficam fixas até o próximo rebalanceamento.
+
+    close e proba são matrizes (datas × ativos); NaN marca ativos sem preço ou sem previsão.
+    A decisão tomada no fechamento t é executada no fechamento t + atraso.
+    Com preencher=False, close já deve vir com o último preço carregado para frente (ex: painel
+    memory-mapped da varredura, usado sem cópia).
+    Retorna arrays de patrimônio (base 1), drawdown, turnover e custos por rebalanceamento.
+    """
+    T, N = close.shape
+    # Preço carregado para frente (ativo sem negociação mantém o último valor)
+    preco = pd.DataFrame(close).ffill().to_numpy() if preencher else close
+
+    reb = np.arange(atraso, T, rebalanceamento)
+    decisao = reb - atraso
+    elegivel = (proba[decisao] >= threshold) & ~np.isnan(preco[reb]) & (preco[reb] > 0)
+    contagem = elegivel.sum(axis=1, keepdims=True)
+    pesos = np.divide(elegivel, contagem, out=np.zeros((len(reb), N)), where=contagem > 0)
+
+    # Para cada data, o índice do último rebalanceamento (antes do primeiro: -1 = caixa)
+    ultimo = np.searchsorted(reb, np.arange(T), side="right") - 1
+    investido = ultimo >= 0
+    idx = np.maximum(ultimo, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crescimento = np.where(pesos[idx] > 0, preco / preco[reb[idx]], 0.0)
+    # Multiplicador do patrimônio desde o último rebalanceamento (parte em caixa rende 0)
+    caixa = 1.0 - pesos.sum(axis=1)
+    mult = np.where(investido, np.nansum(pesos[idx] * crescimento, axis=1) + caixa[idx], 1.0)
+
+    # Fim de cada período: pesos já movidos pelos preços, comparados aos novos pesos-alvo
+    antes = np.zeros_like(pesos)
+    ganho_periodo = np.ones(len(reb))
+    if len(reb) > 1:
+        ini, fim = reb[:-1], reb[1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cresc_fim = np.where(pesos[:-1] > 0, preco[fim] / preco[ini], 0.0)
+        ganho_periodo[1:] = np.nansum(pesos[:-1] * cresc_fim, axis=1) + caixa[:-1]
+        antes[1:] = np.nan_to_num(pesos[:-1] * cresc_fim) / ganho_periodo[1:, None]
+    turnover = np.abs(pesos - antes).sum(axis=1)
+    custo = turnover * (taxa + slippage)
+
+    # Patrimônio logo após cada rebalanceamento: produto dos períodos anteriores e dos custos
+    base = np.cumprod(ganho_periodo * (1 - custo))
+    patrimonio = np.where(investido, base[idx] * mult, 1.0)
+
+    drawdown = patrimonio / np.maximum.accumulate(patrimonio) - 1
+    return {
+        "patrimonio": patrimonio,
+        "drawdown": drawdown,
+        "datas_rebalanceamento": reb,
+        "turnover": turnover,
+        "custo": custo,
+        "pesos": pesos,
+    }
+
+
+def resumir(resultado: dict, periodos_por_ano: int = 365) -> dict:
+    patrimonio = resultado["patrimonio"]
+    retornos = np.diff(patrimonio) / patrimonio[:-1]
+    anos = len(patrimonio) / periodos_por_ano
+    desvio = retornos.std()
+    return {
+        "retorno_total_pct": round(100 * float(patrimonio[-1] - 1), 2),
+        "cagr_pct": round(100 * float(patrimonio[-1] ** (1 / anos) - 1), 2) if anos > 0 and patrimonio[-1] > 0 else None,
+        "max_drawdown_pct": round(100 * float(resultado["drawdown"].min()), 2),
+        "sharpe": round(float(np.sqrt(periodos_por_ano) * retornos.mean() / desvio), 3) if desvio > 0 else None,
+        "turnover_medio": round(float(resultado["turnover"].mean()), 4),
+        "custo_total_pct": round(100 * float(resultado["custo"].sum()), 2),
+        "rebalanceamentos": int(len(resultado["datas_rebalanceamento"])),
+        "exposicao_media": round(float(resultado["pesos"].sum(axis=1).mean()), 4),
+    }
+
+
+@cronometrado("backtest")
+def rodar_backtest(nome: str, threshold: float, rebalanceamento: int, taxa: float, slippage: float,
+                   atraso: int, ohlcv_dir: str = OHLCV_DIR, output_dir: str = BACKTEST_DIR) -> dict:
+    """
+    Backtest com as previsões fora da amostra já gravadas pelo walk-forward (sem retreino).
+    """
+    proba = painel_probabilidades(nome)
+    close = carregar_precos(list(proba.columns), ohlcv_dir)
+    proba = proba.reindex(index=close.index, columns=close.columns)
+    # Começa na primeira data com alguma previsão
+    inicio = proba.notna().any(axis=1).to_numpy().argmax()
+    close, proba = close.iloc[inicio:], proba.iloc[inicio:]
+
+    t0 = time.perf_counter()
+    resultado = executar_backtest(close.to_numpy(dtype=float), proba.to_numpy(dtype=float), threshold,
+                                  rebalanceamento, taxa, slippage, atraso)
+    duracao = time.perf_counter() - t0
+
+    curva = pd.DataFrame({"patrimonio": resultado["patrimonio"], "drawdown": resultado["drawdown"]}, index=close.index)
+    os.makedirs(output_dir, exist_ok=True)
+    base = nome.replace("previsoes", "curva")
+    out_path = os.path.join(output_dir, f"{base}_th{threshold}_r{rebalanceamento}.csv")
+    curva.to_csv(out_path)
+
+    resumo = resumir(resultado)
+    print(f"\n📊 Backtest ({close.shape[1]} ativos, {close.shape[0]} datas, {duracao * 1000:.1f} ms):")
+    for chave, valor in resumo.items():
+        print(f"- {chave}: {valor}")
+    print(f"[✅ SALVO] Curva de patrimônio em: {out_path}")
+    return resumo
+
+
+def benchmark(T: int, N: int, rebalanceamento: int) -> None:
+    """
+    Mede o motor com preços e probabilidades aleatórios (T datas × N ativos).
+    """
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, (T, N)), axis=0))
+    proba = rng.random((T, N))
+    inicio = time.perf_counter()
+    resultado = executar_backtest(close, proba, 0.9, rebalanceamento)
+    print(f"⏱️  {T} datas × {N} ativos: {time.perf_counter() - inicio:.3f}s — {resumir(resultado)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest vetorizado com previsões walk-forward")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Probabilidade mínima para comprar o ativo")
+    parser.add_argument("--rebalanceamento", type=int, default=5, help="Candles entre rebalanceamentos")
+    parser.add_argument("--taxa", type=float, default=TAXA, help="Taxa por lado (fração)")
+    parser.add_argument("--slippage", type=float, default=SLIPPAGE, help="Slippage por lado (fração)")
+    parser.add_argument("--atraso", type=int, default=1, help="Candles entre a decisão e a execução")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte do label usado no walk-forward")
+    parser.add_argument("--passo", type=int, default=PASSO_WALK_FORWARD, help="Candles entre retreinos do walk-forward")
+    parser.add_argument("--min_treino", type=int, default=MIN_TREINO, help="Candles mínimos do primeiro treino")
+    parser.add_argument("--janela", type=int, default=None, help="Treino em janela móvel com N candles (padrão: janela crescente)")
+    parser.add_argument("--benchmark", type=int, nargs=2, metavar=("DATAS", "ATIVOS"), help="Mede o motor com dados aleatórios")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    if args.benchmark:
+        benchmark(*args.benchmark, args.rebalanceamento)
+    else:
+        nome = gerar_previsoes(horizon=args.horizon, passo=args.passo, min_treino=args.min_treino,
+                               janela=args.janela, workers=args.workers)
+        rodar_backtest(nome, args.threshold, args.rebalanceamento, args.taxa, args.slippage, args.atraso)
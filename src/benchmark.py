@@ -0,0 +1,291 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import argparse
+import tracemalloc
+import subprocess
+import contextlib
+from datetime import datetime
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+BENCHMARK_DIR = os.path.join(ROOT_DIR, "data", "benchmarks")
+
+# Parâmetros do movimento browniano geométrico (por ano) e do candle sintético
+DRIFT_ANUAL = 0.2
+VOL_ANUAL = 0.8
+VOL_INTRADAY = 0.3
+PERIODOS_POR_ANO = {"1d": 365, "4h": 365 * 6, "1h": 365 * 24}
+
+ETAPAS = ["features", "labels", "merge", "train", "inference", "simulation"]
+
+
+def gerar_ohlcv(n_simbolos: int, n_barras: int, intervalo: str = "1d", semente: int = 0,
+                inicio: str = "2020-01-01") -> dict[str, pd.DataFrame]:
+    """
+    OHLCV sintético: fechamento por movimento browniano geométrico, abertura no fechamento
+    anterior com um pequeno gap, máxima/mínima envolvendo abertura e fechamento, volume log-normal.
+    """
+    rng = np.random.default_rng(semente)
+    dt = 1 / PERIODOS_POR_ANO[intervalo]
+    datas = pd.date_range(inicio, periods=n_barras, freq=intervalo.replace("d", "D"), name=storage.INDEX_COL)
+
+    choques = rng.normal((DRIFT_ANUAL - VOL_ANUAL ** 2 / 2) * dt, VOL_ANUAL * np.sqrt(dt), (n_barras, n_simbolos))
+    preco_inicial = np.exp(rng.uniform(np.log(0.01), np.log(50000), n_simbolos))
+    close = preco_inicial * np.exp(np.cumsum(choques, axis=0))
+    open_ = np.vstack([preco_inicial, close[:-1]]) * np.exp(rng.normal(0, 0.1 * VOL_ANUAL * np.sqrt(dt), close.shape))
+    amplitude = np.abs(rng.normal(0, VOL_INTRADAY * VOL_ANUAL * np.sqrt(dt), (2, *close.shape)))
+    high = np.maximum(open_, close) * np.exp(amplitude[0])
+    low = np.minimum(open_, close) * np.exp(-amplitude[1])
+    volume = rng.lognormal(10, 1, close.shape)
+
+    return {
+        f"SIM{j:04d}USDT": pd.DataFrame({"open": open_[:, j], "high": high[:, j], "low": low[:, j],
+                                         "close": close[:, j], "volume": volume[:, j]}, index=datas)
+        for j in range(n_simbolos)
+    }
+
+
+def _medir(func: Callable[[], None], memoria: bool) -> tuple[float, Optional[float]]:
+    """
+    Tempo de parede da função e, com 'memoria', o pico de alocações rastreadas pelo tracemalloc
+    (Python, pandas e NumPy; memória nativa do XGBoost não entra). O pico é medido em uma
+    segunda execução, para o rastreamento não distorcer o tempo.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        func()
+        duracao = time.perf_counter() - inicio
+        if not memoria:
+            return duracao, None
+        tracemalloc.start()
+        try:
+            func()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return duracao, pico / 2**20
+
+
+def _etapas(tickers: list[str], busca: str) -> dict[str, Callable[[], None]]:
+    """
+    Cada etapa do pipeline executada em sequência para todos os tickers, com os diretórios
+    relativos ao diretório de trabalho do benchmark.
+    """
+    from features_completo import processar_arquivo_ohlcv
+    from label_completo import gerar_labels_para_arquivo
+    from merge_features_labels import merge_features_labels
+    from model_xgb_grid_refinado import treinar_ticker
+    from inference_xgb_refinado import MotorInferencia, prever_e_rankear
+    from simulation_xgb_refinado import simulate_purchase_from_csv
+
+    sinais = os.path.join("data", "signals")
+
+    def inferencia():
+        prever_e_rankear(threshold=0.0, motor=MotorInferencia("data/processed", "data/models"), signals_dir=sinais)
+
+    def simulacao():
+        arquivos = sorted(os.listdir(sinais))
+        simulate_purchase_from_csv(10000, os.path.join(sinais, arquivos[-1]), offline=True)
+
+    return {
+        "features": lambda: [processar_arquivo_ohlcv(t, "data/ohlcv", "data/features") for t in tickers],
+        "labels": lambda: [gerar_labels_para_arquivo(t, "data/features", "data/labels", [3, 5, 10], "binary", 0.02,
+                                                     use_dynamic=True) for t in tickers],
+        "merge": lambda: [merge_features_labels(t, "5d") for t in tickers],
+        "train": lambda: [treinar_ticker(t, "data/processed", "data/models", horizon=5, busca=busca) for t in tickers],
+        "inference": inferencia,
+        "simulation": simulacao,
+    }
+
+
+def medir_configuracao(n_simbolos: int, n_barras: int, intervalo: str, busca: str, etapas: list[str],
+                       memoria: bool) -> list[dict]:
+    """
+    Gera os dados sintéticos em um diretório temporário e mede cada etapa na ordem do pipeline.
+    """
+    trabalho = tempfile.mkdtemp(prefix="benchmark_")
+    original = os.getcwd()
+    try:
+        os.chdir(trabalho)
+        dados = gerar_ohlcv(n_simbolos, n_barras, intervalo)
+        for ticker, df in dados.items():
+            storage.salvar(df, "data/ohlcv", ticker)
+        os.makedirs("data/models", exist_ok=True)
+
+        funcoes = _etapas(list(dados), busca)
+        resultados = []
+        for etapa in ETAPAS:
+            if etapa not in etapas:
+                continue
+            duracao, pico = _medir(funcoes[etapa], memoria)
+            resultados.append({
+                "simbolos": n_simbolos, "barras": n_barras, "etapa": etapa,
+                "segundos": round(duracao, 4),
+                "ms_por_simbolo": round(1000 * duracao / n_simbolos, 3),
+                "pico_memoria_mb": None if pico is None else round(pico, 2),
+            })
+            print(f"⏱️  {n_simbolos} símbolos × {n_barras} barras — {etapa}: {duracao:.3f}s"
+                  + ("" if pico is None else f", pico {pico:.1f} MB"))
+        return resultados
+    finally:
+        os.chdir(original)
+        shutil.rmtree(trabalho, ignore_errors=True)
+
+
+def _ler_importtime(stderr: str) -> list[tuple[int, str, float]]:
+    """
+    Linhas do -X importtime como (profundidade, módulo, segundos acumulados), na ordem da saída:
+    cada módulo aparece depois dos que ele importou.
+    """
+    linhas = []
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha.split("|")
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        linhas.append((profundidade, nome.strip(), int(acumulado) / 1e6))
+    return linhas
+
+
+def medir_importacao(comandos: Optional[list[str]] = None, repeticoes: int = 3) -> list[dict]:
+    """
+    Tempo de importação do módulo de cada comando do cripto.py, em um processo novo com
+    python -X importtime (menor de 'repeticoes' execuções), e as importações diretas que mais pesam.
+    """
+    from cripto import COMANDOS
+
+    resultados = []
+    for comando in ["cripto", *(comandos or COMANDOS)]:
+        modulo = "cripto" if comando == "cripto" else COMANDOS[comando][0]
+        melhor = None
+        for _ in range(repeticoes):
+            saida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"], cwd=SRC_DIR,
+                                   capture_output=True, text=True)
+            linhas = _ler_importtime(saida.stderr)
+            fim = max((i for i, (p, nome, _) in enumerate(linhas) if p == 0 and nome == modulo), default=None)
+            if fim is None:
+                raise RuntimeError(f"Falha ao importar {modulo}: {saida.stderr.strip().splitlines()[-1:]}")
+            if melhor is None or linhas[fim][2] < melhor[fim][2]:
+                melhor, indice = linhas, fim
+        linhas, fim = melhor, indice
+
+        # Importações diretas do módulo: profundidade 1, entre a linha anterior de profundidade 0 e a dele
+        diretas = []
+        for profundidade, nome, segundos in reversed(linhas[:fim]):
+            if profundidade == 0:
+                break
+            if profundidade == 1:
+                diretas.append((segundos, nome))
+        resultados.append({
+            "comando": comando, "modulo": modulo,
+            "importacao_s": round(linhas[fim][2], 4),
+            "maiores": ", ".join(f"{nome} {segundos:.2f}s" for segundos, nome in sorted(diretas, reverse=True)[:3]),
+        })
+        print(f"⏱️  {comando}: {linhas[fim][2]:.3f}s")
+    return resultados
+
+
+def _commit_atual() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadados(args) -> dict:
+    import xgboost
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "xgboost": xgboost.__version__,
+        "cpus": os.cpu_count(),
+        "intervalo": args.intervalo,
+        "busca": args.busca,
+    }
+
+
+def comparar(resultados: list[dict], referencia_path: str) -> None:
+    """
+    Razão de tempo e memória em relação a um JSON anterior (> 1 = mais lento / maior).
+    """
+    with open(referencia_path, "r", encoding="utf-8") as f:
+        referencia = json.load(f)
+    if "importacao" in referencia:
+        atual = pd.DataFrame(resultados).set_index("comando")["importacao_s"]
+        anterior = pd.DataFrame(referencia["importacao"]).set_index("comando")["importacao_s"]
+        print(f"\n📊 Importação em relação a {referencia['meta'].get('commit')} ({referencia_path}):")
+        print((atual / anterior).dropna().round(2).to_string())
+        return
+    chave = ["simbolos", "barras", "etapa"]
+    atual = pd.DataFrame(resultados).set_index(chave)
+    anterior = pd.DataFrame(referencia["resultados"]).set_index(chave)
+    razao = (atual[["segundos", "pico_memoria_mb"]] / anterior[["segundos", "pico_memoria_mb"]]).dropna(how="all")
+    print(f"\n📊 Comparação com {referencia['meta'].get('commit')} ({referencia_path}):")
+    print(razao.round(2).to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do pipeline com OHLCV sintético")
+    parser.add_argument("--simbolos", type=int, nargs="+", default=[5, 10, 20], help="Quantidades de símbolos (curva de escala)")
+    parser.add_argument("--barras", type=int, nargs="+", default=[500, 1000, 2000], help="Tamanhos do histórico (curva de escala)")
+    parser.add_argument("--intervalo", type=str, choices=list(PERIODOS_POR_ANO), default="1d", help="Intervalo dos candles sintéticos")
+    parser.add_argument("--busca", type=str, choices=["grid", "halving"], default="grid", help="Busca de hiperparâmetros do treino")
+    parser.add_argument("--etapas", type=str, nargs="+", choices=ETAPAS, default=ETAPAS, help="Etapas a medir")
+    parser.add_argument("--sem_memoria", action="store_true", help="Mede só o tempo (sem a segunda execução com tracemalloc)")
+    parser.add_argument("--comparar", type=str, default=None, help="JSON de um benchmark anterior para comparação")
+    parser.add_argument("--importacao", action="store_true", help="Mede só o tempo de inicialização dos comandos (python -X importtime)")
+    args = parser.parse_args()
+
+    if args.importacao:
+        importacao = medir_importacao()
+        meta = metadados(args)
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        out_path = os.path.join(BENCHMARK_DIR, f"importacao_{meta['commit'] or 'sem_commit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "importacao": importacao}, f, indent=1)
+        print("\n📈 Tempo de importação por comando:")
+        print(pd.DataFrame(importacao).set_index("comando").to_string())
+        if args.comparar:
+            comparar(importacao, args.comparar)
+        print(f"[✅ SALVO] Benchmark em: {out_path}")
+        sys.exit(0)
+
+    # Logs das etapas não interessam ao benchmark
+    logging.disable(logging.INFO)
+
+    resultados = []
+    for n_simbolos in args.simbolos:
+        for n_barras in args.barras:
+            resultados += medir_configuracao(n_simbolos, n_barras, args.intervalo, args.busca, args.etapas,
+                                             not args.sem_memoria)
+
+    meta = metadados(args)
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    out_path = os.path.join(BENCHMARK_DIR, f"benchmark_{meta['commit'] or 'sem_commit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "resultados": resultados}, f, indent=1)
+
+    tabela = pd.DataFrame(resultados)
+    print("\n📈 Segundos por etapa (curvas de escala):")
+    print(tabela.pivot_table(index=["simbolos", "barras"], columns="etapa", values="segundos")[
+        [e for e in ETAPAS if e in args.etapas]].to_string())
+    if args.comparar:
+        comparar(resultados, args.comparar)
+    print(f"[✅ SALVO] Benchmark em: {out_path}")
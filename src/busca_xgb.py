@@ -0,0 +1,182 @@
+import math
+import itertools
+from typing import Dict, List, Optional
+
+import numpy as np
+import xgboost as xgb
+from xgboost import XGBClassifier
+from sklearn.metrics import f1_score
+
+from instrumentacao import contar
+
+# Successive halving: todos os candidatos começam com poucas rodadas de boosting e, a cada
+# etapa, só a melhor fração (1/FATOR_ELIMINACAO) continua, com o dobro de rodadas
+RODADAS_INICIAIS = 25
+FATOR_ELIMINACAO = 2
+# Rodadas sem melhora do logloss de validação antes de parar um fold
+EARLY_STOPPING = 20
+
+# Nomes do XGBClassifier que têm outro nome (ou não existem) na API nativa
+_NOMES_NATIVOS = {"random_state": "seed", "n_jobs": "nthread"}
+_FORA_DA_API_NATIVA = {"n_estimators", "use_label_encoder", "early_stopping_rounds"}
+
+
+def expandir_grade(param_grid: Dict[str, list]) -> List[dict]:
+    """
+    Todas as combinações da grade. n_estimators sai da grade: no halving o número de rodadas
+    é o recurso disputado pelos candidatos e o valor final vem do early stopping.
+    """
+    grade = {k: v for k, v in param_grid.items() if k != "n_estimators"}
+    chaves = list(grade)
+    return [dict(zip(chaves, valores)) for valores in itertools.product(*grade.values())]
+
+
+def params_nativos(params: dict) -> dict:
+    nativos = {}
+    for nome, valor in params.items():
+        if nome in _FORA_DA_API_NATIVA or valor is None:
+            continue
+        nativos[_NOMES_NATIVOS.get(nome, nome)] = valor
+    return nativos
+
+
+class _Candidato:
+
+    def __init__(self, params: dict, n_folds: int):
+        self.params = params
+        self.boosters = [None] * n_folds
+        self.melhor_iteracao = [0] * n_folds
+        self.parado = [False] * n_folds
+        self.f1_folds = [0.0] * n_folds
+
+    @property
+    def score(self) -> float:
+        return float(np.mean(self.f1_folds))
+
+
+def _treinar_fold(candidato: _Candidato, k: int, params_base: dict, dtrain: xgb.DMatrix,
+                  dval: xgb.DMatrix, y_val: np.ndarray, rodadas: int) -> None:
+    """
+    Continua o booster do fold até 'rodadas' (reaproveitando as árvores da etapa anterior)
+    e atualiza o F1 de validação na melhor iteração.
+    """
+    booster = candidato.boosters[k]
+    feitas = booster.num_boosted_rounds() if booster is not None else 0
+    if not candidato.parado[k] and feitas < rodadas:
+        booster = xgb.train(
+            {**params_base, **params_nativos(candidato.params)}, dtrain,
+            num_boost_round=rodadas - feitas, evals=[(dval, "val")],
+            early_stopping_rounds=EARLY_STOPPING, xgb_model=booster, verbose_eval=False,
+        )
+        contar("ajustes")
+        melhor = getattr(booster, "best_iteration", booster.num_boosted_rounds() - 1)
+        candidato.parado[k] = booster.num_boosted_rounds() < rodadas
+        candidato.melhor_iteracao[k] = melhor
+        candidato.boosters[k] = booster
+
+    proba = candidato.boosters[k].predict(dval, iteration_range=(0, candidato.melhor_iteracao[k] + 1))
+    candidato.f1_folds[k] = f1_score(y_val, proba >= 0.5, zero_division=0)
+
+
+def halving_em_folds(folds: list, params_base: dict, param_grid: Dict[str, list],
+                     sementes: Optional[List[dict]] = None):
+    """
+    Núcleo do successive halving sobre folds já montados [(dtrain, dval, y_val), ...].
+    Retorna (melhores parâmetros com n_estimators, F1 médio de validação).
+    """
+    max_rodadas = max(param_grid.get("n_estimators", [200]))
+    nativos_base = {**params_nativos(params_base), "eval_metric": "logloss"}
+
+    grade = expandir_grade(param_grid)
+    for semente in sementes or []:
+        semente = {k: v for k, v in semente.items() if k != "n_estimators"}
+        if semente not in grade:
+            grade.insert(0, semente)
+    vivos = [_Candidato(p, len(folds)) for p in grade]
+    rodadas = min(RODADAS_INICIAIS, max_rodadas)
+    while True:
+        for candidato in vivos:
+            for k, (dtrain, dval, y_val) in enumerate(folds):
+                _treinar_fold(candidato, k, nativos_base, dtrain, dval, y_val, rodadas)
+        if len(vivos) == 1 or rodadas >= max_rodadas:
+            break
+        vivos = sorted(vivos, key=lambda c: c.score, reverse=True)[:math.ceil(len(vivos) / FATOR_ELIMINACAO)]
+        rodadas = min(rodadas * FATOR_ELIMINACAO, max_rodadas)
+
+    melhor = max(vivos, key=lambda c: c.score)
+    n_estimators = int(round(np.mean(melhor.melhor_iteracao))) + 1
+    return {**melhor.params, "n_estimators": n_estimators}, melhor.score
+
+
+def buscar_grade(folds: list, params_base: dict, param_grid: Dict[str, list],
+                 sementes: Optional[List[dict]] = None):
+    """
+    Busca exaustiva (mesmas combinações e desempate do GridSearchCV) sobre folds já montados
+    [(dtrain, dval, y_val), ...], com F1 no limiar 0.5. Para cada combinação dos demais
+    parâmetros, um único booster com o maior n_estimators é treinado por fold e os valores
+    menores de n_estimators são avaliados pelas suas primeiras árvores.
+    'sementes' (ex: melhores parâmetros do treino anterior) entram como candidatos extras quando
+    não fazem parte da grade e vencem os empates, evitando trocar de modelo sem ganho.
+    Retorna (melhores parâmetros, F1 médio de validação).
+    """
+    nativos_base = params_nativos(params_base)
+    estimadores_grade = sorted(param_grid.get("n_estimators", [100]))
+    outros = sorted(k for k in param_grid if k != "n_estimators")
+    chaves = sorted([*outros, "n_estimators"])
+
+    combinacoes = {valores: set(estimadores_grade)
+                   for valores in itertools.product(*(param_grid[k] for k in outros))}
+    preferidos = []
+    for semente in sementes or []:
+        if not set(outros) <= set(semente):
+            continue
+        valores = tuple(semente[k] for k in outros)
+        n = int(semente.get("n_estimators", estimadores_grade[-1]))
+        combinacoes.setdefault(valores, set()).add(n)
+        preferidos.append(tuple({**dict(zip(outros, valores)), "n_estimators": n}[k] for k in chaves))
+
+    scores = {}
+    for valores, estimadores in combinacoes.items():
+        params = dict(zip(outros, valores))
+        estimadores = sorted(estimadores)
+        f1_folds = {n: [] for n in estimadores}
+        for dtrain, dval, y_val in folds:
+            booster = xgb.train({**nativos_base, **params_nativos(params)}, dtrain, num_boost_round=estimadores[-1])
+            contar("ajustes")
+            for n in estimadores:
+                proba = booster.predict(dval, iteration_range=(0, n))
+                f1_folds[n].append(f1_score(y_val, proba >= 0.5, zero_division=0))
+        for n in estimadores:
+            candidato = {**params, "n_estimators": n}
+            scores[tuple(candidato[k] for k in chaves)] = float(np.mean(f1_folds[n]))
+
+    # Empate: vencem as sementes e depois a primeira combinação na ordem do ParameterGrid
+    # (chaves em ordem alfabética)
+    melhor = max(preferidos + sorted(scores), key=lambda c: scores[c])
+    return dict(zip(chaves, melhor)), scores[melhor]
+
+
+def modelo_final(matriz, params_base: dict, melhores_parametros: dict) -> XGBClassifier:
+    """
+    Treina os melhores parâmetros em todas as linhas (QuantileDMatrix completa da matriz) e
+    devolve um XGBClassifier, formato usado pela inferência e pelo retreino incremental.
+    """
+    booster = xgb.train(params_nativos({**params_base, **melhores_parametros}), matriz.completa(),
+                        num_boost_round=melhores_parametros["n_estimators"])
+    contar("ajustes")
+    modelo = XGBClassifier(**{**params_base, **melhores_parametros})
+    modelo.load_model(bytearray(booster.save_raw("json")))
+    return modelo
+
+
+def buscar_halving(matriz, params_base: dict, param_grid: Dict[str, list],
+                   n_splits: int = 5, sementes: Optional[List[dict]] = None):
+    """
+    Successive halving sobre a grade com xgb.train e early stopping no trecho de validação de
+    cada fold do TimeSeriesSplit. Os folds vêm da matriz de treino (matriz_features), montados
+    uma vez e reaproveitados por todos os candidatos. 'sementes' (ex: melhores parâmetros do
+    treino anterior) entram como candidatos extras quando não fazem parte da grade.
+    Retorna (modelo final treinado em todas as linhas, melhores parâmetros, F1 médio de validação).
+    """
+    melhores_parametros, score = halving_em_folds(matriz.folds(n_splits), params_base, param_grid, sementes)
+    return modelo_final(matriz, params_base, melhores_parametros), melhores_parametros, score
@@ -0,0 +1,64 @@
+"""
+Ponto de entrada único dos scripts: python src/cripto.py <comando> [argumentos do script].
+Só o módulo do comando escolhido é importado, então a ajuda geral não carrega pandas,
+XGBoost, scikit-learn nem o python-binance, e clientes da exchange só são criados pelos
+comandos que acessam a rede.
+"""
+
+import sys
+import runpy
+import argparse
+
+# comando: (módulo em src/, descrição)
+COMANDOS = {
+    "fetch": ("fetch_all_ohlcv_salva_todos", "Coleta OHLCV da Binance (--incremental para só os candles novos)"),
+    "fetch-async": ("fetch_async", "Coleta assíncrona de OHLCV com controle de peso"),
+    "features": ("features_completo", "Gera os indicadores técnicos"),
+    "labels": ("label_completo", "Gera os labels por horizonte"),
+    "merge": ("merge_features_labels", "Junta features e labels no dataset de treino"),
+    "train": ("model_xgb_grid_refinado", "Treina os modelos XGBoost por ativo"),
+    "infer": ("inference_xgb_refinado", "Gera o ranking de sinais do dia"),
+    "simulate": ("simulation_xgb_refinado", "Simula as compras a partir dos sinais"),
+    "evaluate": ("evaluate_simulation", "Avalia uma simulação (ou todas, com --historico) a preço de mercado"),
+    "pipeline": ("pipeline", "Executa o pipeline completo, refazendo só o que está desatualizado"),
+    "walk-forward": ("walk_forward", "Gera previsões fora da amostra em janelas walk-forward"),
+    "backtest": ("backtest", "Backtest das previsões walk-forward"),
+    "painel": ("painel", "Monta o painel float32 mapeado em memória"),
+    "matrizes": ("matriz_features", "Monta as matrizes float32 de treino (feature store)"),
+    "streaming": ("streaming", "Ingestão contínua de candles via WebSocket"),
+    "benchmark": ("benchmark", "Benchmark das etapas e do tempo de inicialização"),
+}
+
+
+def executar(comando: str, argumentos: list[str]) -> None:
+    """
+    Executa o módulo do comando como script (__main__), com os argumentos repassados.
+    """
+    modulo = COMANDOS[comando][0]
+    sys.argv = [modulo, *argumentos]
+    # alter_sys: o módulo passa a ser o __main__, então funções definidas nele continuam
+    # serializáveis para os workers de executar_por_ticker
+    runpy.run_module(modulo, run_name="__main__", alter_sys=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    largura = max(len(c) for c in COMANDOS)
+    parser = argparse.ArgumentParser(
+        prog="cripto",
+        usage="python src/cripto.py <comando> [argumentos]",
+        description="Pipeline de sinais de criptomoedas",
+        epilog="comandos:\n" + "\n".join(f"  {c:<{largura}}  {d}" for c, (_, d) in COMANDOS.items())
+               + "\n\nAjuda de um comando: python src/cripto.py <comando> --help",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    if not argv or argv[0] in ("-h", "--help"):
+        parser.print_help()
+        return
+    if argv[0] not in COMANDOS:
+        parser.error(f"comando inválido: '{argv[0]}' (opções: {', '.join(COMANDOS)})")
+    executar(argv[0], argv[1:])
+
+
+if __name__ == "__main__":
+    main()
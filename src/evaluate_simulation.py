@@ -1,39 +1,22 @@
+import numpy as np
 import pandas as pd
-import yfinance as yf
 import argparse
+import glob
 import os
-from binance.client import Client
+from datetime import timezone
+import storage
+from painel import carregar_fechamentos as fechamentos_painel
+from precos import OHLCV_DIR, obter_precos
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, contar, cronometrado
 
-# Configurações da Binance API (substituir por suas chaves ou variáveis de ambiente)
-# Recomenda-se usar variáveis de ambiente para segurança
-API_KEY = os.environ.get('BINANCE_API_KEY', 'UdABeqMnq7OY0qKmNTEg5RbnndIAXrRivBHU1odwOlMoB9rVHfN1SpbxgN1CnFvO')
-API_SECRET = os.environ.get('BINANCE_API_SECRET', 'HhkJCzPKdh9s8RURD4wL0nbkMZxJQYTWGhsnOEB7xBjJxDidueevvYjOwonaCPDv')
-
-# Inicializa o cliente da Binance
-client = Client(API_KEY, API_SECRET)
-
-def get_current_price_binance(symbol: str) -> float | None:
-    """
-    Busca o preço atual de um par de criptomoedas na Binance.
-    Retorna None em caso de erro.
-    """
-    # Certifique-se de configurar suas chaves de API da Binance
-    if 'SUA_API_KEY' in API_KEY or 'SUA_API_SECRET' in API_SECRET:
-        print("\n[AVISO] Chaves de API da Binance não configuradas. Não será possível obter preços reais para avaliação.\n")
-        return None
-        
-    try:
-        ticker_info = client.get_symbol_ticker(symbol=symbol)
-        return float(ticker_info["price"])
-    except Exception as e:
-        print(f"[ERRO] Falha ao obter preço de {symbol} da Binance: {e}")
-        return None
+SIMULATIONS_DIR = "data/simulations"
+AVALIACOES_DIR = "data/avaliacoes"
 
 def format_currency(value):
     """
     Formata um valor numérico como moeda brasileira (R$), tratando valores None.
     """
-    if value is None:
+    if value is None or pd.isna(value):
         return "N/A"
     # Garantir que o valor é numérico antes de formatar
     try:
@@ -47,7 +30,7 @@ def format_percent(value):
     """
     Formata um valor numérico como porcentagem, tratando valores None.
     """
-    if value is None:
+    if value is None or pd.isna(value):
         return "N/A"
     # Garantir que o valor é numérico antes de formatar
     try:
@@ -57,31 +40,30 @@ def format_percent(value):
         
     return f"{value:.2f}%".replace(".", ",")
 
-def evaluate_simulation(input_file):
+def avaliar_posicoes(df, precos):
+    """
+    Valor atual, lucro e rentabilidade de cada linha (vetorizado). Linhas sem preço ficam com NaN;
+    símbolos repetidos (várias compras do mesmo ativo) são avaliados linha a linha.
+    """
+    preco = df["symbol"].map(precos).to_numpy(dtype=float)
+    custo = df["total_cost"].to_numpy(dtype=float)
+    valor = df["quantity"].to_numpy(dtype=float) * preco
+    lucro = valor - custo
+    df = df.assign(current_price=preco, current_value=valor, profit=lucro)
+    df["profit_pct"] = np.divide(100 * lucro, custo, out=np.full_like(lucro, np.nan), where=custo != 0)
+    return df
+
+@cronometrado("evaluate")
+def evaluate_simulation(input_file, offline=False):
     df = pd.read_csv(input_file)
     
-    # Usar a função que busca preço na Binance
-    df["current_price"] = df["symbol"].apply(get_current_price_binance)
-    
-    # Calcular valores e lucros apenas para linhas onde o current_price não é None
-    df_calculo = df.dropna(subset=["current_price"]).copy()
-    df_calculo["current_value"] = df_calculo["quantity"] * df_calculo["current_price"]
-    df_calculo["profit"] = df_calculo["current_value"] - df_calculo["total_cost"]
-    # Evitar divisão por zero se total_cost for 0
-    total_cost_sum = df_calculo["total_cost"].sum()
-    df_calculo["profit_pct"] = 100 * df_calculo["profit"] / df_calculo["total_cost"] if total_cost_sum != 0 else 0
-
-    # Mesclar os resultados calculados de volta ao DataFrame original para manter todas as linhas
-    df = df.merge(df_calculo[["symbol", "current_value", "profit", "profit_pct"]], on="symbol", how="left")
-
-    # Aplicar formatações, agora tratando Nones
-    df_fmt = df[["symbol", "quantity", "purchase_price", "total_cost", "current_price", "current_value", "profit", "profit_pct"]].copy()
-    df_fmt["purchase_price"] = df_fmt["purchase_price"].apply(format_currency)
-    df_fmt["total_cost"] = df_fmt["total_cost"].apply(format_currency)
-    df_fmt["current_price"] = df_fmt["current_price"].apply(format_currency)
-    df_fmt["current_value"] = df_fmt["current_value"].apply(format_currency)
-    df_fmt["profit"] = df_fmt["profit"].apply(format_currency)
-    df_fmt["profit_pct"] = df_fmt["profit_pct"].apply(format_percent)
+    # Preços de todos os ativos da carteira em uma única requisição (ou do OHLCV salvo, offline)
+    try:
+        precos = obter_precos(df["symbol"].unique(), offline=offline)
+    except Exception as e:
+        print(f"[ERRO] Falha ao obter preços: {e}")
+        precos = {}
+    df = avaliar_posicoes(df, precos)
 
     # Redefinir largura das colunas com alinhamento
     print("\n📊 Resultado da Simulação:\n")
@@ -90,14 +72,18 @@ def evaluate_simulation(input_file):
     print(header)
     print("-" * len(header))
 
-    for _, row in df_fmt.iterrows():
-        # Ajustar formatação da quantidade para permitir decimais e alinhar
-        quantity_str = f"{row['quantity']:.8f}".rstrip('0').rstrip('.') if pd.notna(row['quantity']) else "N/A"
-        print(f"{row['symbol']:<8} {quantity_str:>15} {row['purchase_price']:>15} {row['total_cost']:>15} {row['current_price']:>15} {row['current_value']:>15} {row['profit']:>12} {row['profit_pct']:>10}")
+    colunas_moeda = [[format_currency(v) for v in df[c].to_numpy()]
+                     for c in ("purchase_price", "total_cost", "current_price", "current_value", "profit")]
+    rentab = [format_percent(v) for v in df["profit_pct"].to_numpy()]
+    # Ajustar formatação da quantidade para permitir decimais e alinhar
+    quantidades = [f"{q:.8f}".rstrip('0').rstrip('.') if pd.notna(q) else "N/A" for q in df["quantity"].to_numpy()]
+    for symbol, quantity_str, (compra, total, atual, valor, lucro), pct in zip(df["symbol"], quantidades, zip(*colunas_moeda), rentab):
+        print(f"{symbol:<8} {quantity_str:>15} {compra:>15} {total:>15} {atual:>15} {valor:>15} {lucro:>12} {pct:>10}")
 
-    # Totais (calcular apenas com valores não None)
-    total_cost = df_calculo["total_cost"].sum() if not df_calculo.empty else 0
-    total_value = df_calculo["current_value"].sum() if not df_calculo.empty else 0
+    # Totais (calcular apenas com linhas que têm preço)
+    com_preco = df["current_price"].notna()
+    total_cost = df.loc[com_preco, "total_cost"].sum()
+    total_value = df.loc[com_preco, "current_value"].sum()
     total_profit = total_value - total_cost
     total_profit_pct = 100 * total_profit / total_cost if total_cost != 0 else 0
 
@@ -107,8 +93,190 @@ def evaluate_simulation(input_file):
     print(f"- Lucro Total:     {format_currency(total_profit)}")
     print(f"- Rentabilidade:   {format_percent(total_profit_pct)}")
 
+# ---------------------------------------------------------------------------
+# Histórico da carteira: todas as simulações avaliadas de uma vez
+# ---------------------------------------------------------------------------
+
+def _local_para_utc(data):
+    # O datetime sem fuso é interpretado no horário local da máquina (com horário de verão)
+    return pd.Timestamp(data.to_pydatetime().astimezone(timezone.utc)).tz_localize(None)
+
+def carregar_simulacoes(simulations_dir=SIMULATIONS_DIR):
+    """
+    Todas as compras simuladas (purchase_*.csv) em um único DataFrame, com o arquivo de origem
+    e a data da compra em UTC, como os candles (do nome do arquivo, gravado no horário local;
+    sem data no nome, a data de modificação).
+    """
+    quadros = []
+    for path in sorted(glob.glob(os.path.join(simulations_dir, "purchase_*.csv"))):
+        nome = os.path.basename(path)
+        data = pd.to_datetime(nome[len("purchase_"):-len(".csv")], format="%Y-%m-%d_%H%M%S", errors="coerce")
+        if pd.isna(data):
+            data = pd.to_datetime(nome[len("purchase_"):-len(".csv")], format="%Y-%m-%d", errors="coerce")
+        if pd.isna(data):
+            data = pd.Timestamp(os.path.getmtime(path), unit="s")
+        else:
+            data = _local_para_utc(data)
+        quadros.append(pd.read_csv(path).assign(arquivo=nome, data_compra=data))
+    if not quadros:
+        return pd.DataFrame(columns=["symbol", "quantity", "purchase_price", "total_cost", "arquivo", "data_compra"])
+    return pd.concat(quadros, ignore_index=True)
+
+def carregar_fechamentos(symbols, ohlcv_dir=OHLCV_DIR):
+    """
+    Fechamentos salvos (datas × símbolos), com o último preço carregado para frente.
+    Vêm do painel mapeado quando ele está em dia; senão, das tabelas OHLCV.
+    """
+    close = fechamentos_painel(list(symbols), ohlcv_dir)
+    for symbol in symbols:
+        if symbol not in close.columns:
+            print(f"[AVISO] Sem OHLCV salvo para {symbol}")
+    return close.ffill()
+
+def avaliar_historico(posicoes, close, precos_atuais=None, horizonte=5):
+    """
+    Avalia todas as posições em uma passada, com aritmética de arrays sobre a matriz de fechamentos.
+    Cada posição entra na carteira na barra em andamento na hora da compra e é marcada a mercado
+    pelos fechamentos seguintes. Compras anteriores ao primeiro fechamento salvo do ativo ficam
+    marcadas em 'sem_historico' e fora da série e do retorno após 'horizonte' barras.
+
+    Retorna (historico, sinais):
+    - historico: por data, valor investido, valor de mercado, P&L, P&L %, posições e taxa de acerto
+      (fração das posições com lucro);
+    - sinais: as posições com o retorno após 'horizonte' barras e o retorno atual (último fechamento
+      ou, com precos_atuais, o snapshot de preços).
+    """
+    datas = close.index.to_numpy()
+    # Coluna extra de NaN para símbolos sem OHLCV
+    C = np.column_stack([close.to_numpy(dtype=float), np.full(len(close), np.nan)])
+    col = close.columns.get_indexer(posicoes["symbol"])
+    col[col < 0] = C.shape[1] - 1
+
+    qtd = posicoes["quantity"].to_numpy(dtype=float)
+    custo = posicoes["total_cost"].to_numpy(dtype=float)
+    inicio = np.searchsorted(datas, posicoes["data_compra"].to_numpy(dtype="datetime64[ns]"), side="right") - 1
+    # Primeira barra com preço de cada ativo (len(datas) se nunca tem)
+    primeira = np.where(np.isnan(C).all(axis=0), len(datas), np.isnan(C).argmin(axis=0))
+    sem_historico = inicio < primeira[col]
+    inicio[sem_historico] = len(datas)
+
+    # Retorno de cada sinal após 'horizonte' barras e no preço atual
+    alvo = inicio + horizonte
+    dentro = alvo < len(datas)
+    preco_h = np.full(len(posicoes), np.nan)
+    preco_h[dentro] = C[alvo[dentro], col[dentro]]
+    if precos_atuais is not None:
+        preco_atual = posicoes["symbol"].map(precos_atuais).to_numpy(dtype=float)
+    else:
+        preco_atual = C[-1, col] if len(datas) else np.full(len(posicoes), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sinais = posicoes.assign(
+            sem_historico=sem_historico,
+            **{f"retorno_{horizonte}b": qtd * preco_h / custo - 1},
+            current_price=preco_atual,
+            current_value=qtd * preco_atual,
+            profit=qtd * preco_atual - custo,
+            retorno_atual=qtd * preco_atual / custo - 1,
+        )
+
+    # Série da carteira: matriz (datas × posições) a partir da primeira compra
+    t0 = int(inicio.min()) if len(inicio) and len(datas) else len(datas)
+    valores = C[t0:, col] * qtd
+    ativas = (np.arange(t0, len(datas))[:, None] >= inicio) & ~np.isnan(valores)
+    n_ativas = ativas.sum(axis=1)
+    investido = np.where(ativas, custo, 0.0).sum(axis=1)
+    valor = np.where(ativas, valores, 0.0).sum(axis=1)
+    acertos = (ativas & (valores > custo)).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        historico = pd.DataFrame({
+            "investido": investido,
+            "valor": valor,
+            "pnl": valor - investido,
+            "pnl_pct": 100 * (valor - investido) / investido,
+            "posicoes": n_ativas,
+            "taxa_acerto": acertos / n_ativas,
+        }, index=pd.DatetimeIndex(datas[t0:], name=storage.INDEX_COL))
+    return historico[n_ativas > 0], sinais
+
+@cronometrado("evaluate_historico")
+def evaluate_historico(simulations_dir=SIMULATIONS_DIR, snapshot=False, offline=False, horizonte=5,
+                       ohlcv_dir=OHLCV_DIR, destino=AVALIACOES_DIR):
+    posicoes = carregar_simulacoes(simulations_dir)
+    if posicoes.empty:
+        print(f"[ERRO] Nenhuma simulação encontrada em {simulations_dir}")
+        return None
+    symbols = sorted(posicoes["symbol"].unique())
+    contar("posicoes", len(posicoes))
+
+    close = carregar_fechamentos(symbols, ohlcv_dir)
+    precos_atuais = None
+    if snapshot:
+        # Um único snapshot de preços para todos os ativos (ou o último fechamento salvo, offline)
+        try:
+            precos_atuais = obter_precos(symbols, offline=offline, ohlcv_dir=ohlcv_dir)
+        except Exception as e:
+            print(f"[ERRO] Falha ao obter preços: {e}")
+            precos_atuais = {}
+    historico, sinais = avaliar_historico(posicoes, close, precos_atuais, horizonte)
+
+    os.makedirs(destino, exist_ok=True)
+    historico.to_csv(os.path.join(destino, "carteira_historico.csv"))
+    sinais.to_csv(os.path.join(destino, "retornos_sinais.csv"), index=False)
+
+    coluna_h = f"retorno_{horizonte}b"
+    avaliadas = sinais["current_price"].notna()
+    total_cost = sinais.loc[avaliadas, "total_cost"].sum()
+    total_value = sinais.loc[avaliadas, "current_value"].sum()
+    total_profit = total_value - total_cost
+
+    print(f"\n📂 {len(posicoes)} compras em {posicoes['arquivo'].nunique()} simulações "
+          f"({posicoes['data_compra'].min():%Y-%m-%d} a {posicoes['data_compra'].max():%Y-%m-%d})")
+    if sinais["sem_historico"].any():
+        print(f"⚠️  {int(sinais['sem_historico'].sum())} compra(s) sem fechamento salvo do ativo na data da compra: "
+              f"fora da série de P&L e do retorno em {horizonte} barras")
+    print("\n📈 Resumo da Carteira:")
+    print(f"- Valor Investido: {format_currency(total_cost)}")
+    print(f"- Valor Atual:     {format_currency(total_value)}")
+    print(f"- Lucro Total:     {format_currency(total_profit)}")
+    print(f"- Rentabilidade:   {format_percent(100 * total_profit / total_cost if total_cost != 0 else 0)}")
+    print(f"- Taxa de acerto:  {format_percent(100 * (sinais.loc[avaliadas, 'profit'] > 0).mean())}")
+    if sinais[coluna_h].notna().any():
+        print(f"- Acerto em {horizonte} barras: {format_percent(100 * (sinais[coluna_h].dropna() > 0).mean())} "
+              f"(retorno médio {format_percent(100 * sinais[coluna_h].mean())})")
+
+    # Posições sem preço ficam fora do lucro e do acerto (NaN), mas contam em compras e investido
+    acerto = np.where(avaliadas, sinais["profit"] > 0, np.nan)
+    por_ativo = sinais.assign(acerto=acerto, lucro=sinais["profit"]).groupby("symbol").agg(
+        compras=("symbol", "size"),
+        investido=("total_cost", "sum"),
+        lucro=("lucro", lambda x: x.sum(min_count=1)),
+        retorno_medio=("retorno_atual", "mean"),
+        acerto=("acerto", "mean"),
+    ).sort_values("lucro", ascending=False)
+    print("\n📊 Por ativo:")
+    print(por_ativo.round(4).to_string())
+
+    if not historico.empty:
+        print(f"\n📉 P&L da carteira: {len(historico)} datas, máximo {format_currency(historico['pnl'].max())}, "
+              f"mínimo {format_currency(historico['pnl'].min())}")
+    print(f"[✅ SALVO] Histórico e retornos por sinal em: {destino}")
+    return historico, sinais
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", type=str, required=True, help="Caminho para o CSV de simulação")
+    modo = parser.add_mutually_exclusive_group(required=True)
+    modo.add_argument("--input", type=str, help="Caminho para o CSV de simulação")
+    modo.add_argument("--historico", action="store_true", help="Avalia todas as simulações salvas (série de P&L e retornos por sinal)")
+    parser.add_argument("--offline", action="store_true", help="Usa o último fechamento salvo em data/ohlcv em vez do preço da Binance")
+    parser.add_argument("--simulations_dir", type=str, default=SIMULATIONS_DIR, help="Diretório das simulações (--historico)")
+    parser.add_argument("--snapshot", action="store_true", help="Valor atual pelo snapshot de preços em vez do último fechamento (--historico)")
+    parser.add_argument("--horizonte", type=int, default=5, help="Barras após a compra para o retorno de cada sinal (--historico)")
+    parser.add_argument("--destino", type=str, default=AVALIACOES_DIR, help="Diretório dos CSVs da avaliação (--historico)")
+    adicionar_argumentos_metricas(parser)
     args = parser.parse_args()
-    evaluate_simulation(args.input)
+    configurar_metricas(args)
+    if args.historico:
+        evaluate_historico(args.simulations_dir, snapshot=args.snapshot, offline=args.offline,
+                           horizonte=args.horizonte, destino=args.destino)
+    else:
+        evaluate_simulation(args.input, offline=args.offline)
@@ -0,0 +1,76 @@
+import os
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Iterable
+
+from instrumentacao import REGISTRO, medir, executar_medido, rotulo_ticker
+
+
+def adicionar_argumento_workers(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--workers", type=int, default=1, help="Processos paralelos para o processamento por ticker (1 = sequencial)")
+
+
+def cores_por_worker(workers: int) -> int:
+    """
+    Divide os núcleos da máquina entre os processos, para que cada worker use apenas a sua parte.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def executar_por_ticker(func: Callable[..., Any], tickers: Iterable[str], workers: int = 1,
+                        max_pendentes: int | None = None, etapa: str | None = None,
+                        **kwargs) -> tuple[list[tuple[str, Any]], dict[str, str]]:
+    """
+    Executa func(ticker, **kwargs) para cada ticker, em um ProcessPoolExecutor quando workers > 1.
+    - Resultados retornam na mesma ordem dos tickers, independente da ordem de conclusão.
+    - No máximo max_pendentes tarefas ficam em andamento (padrão: 2 por worker), limitando a memória
+      ocupada por resultados ainda não consumidos.
+    - Exceções são coletadas por ticker em vez de interromper a etapa.
+    - Cada ticker é medido (instrumentacao) sob 'etapa' (padrão: nome da função); as métricas dos
+      workers voltam junto com o resultado e são somadas no processo principal.
+    """
+    tarefa = partial(func, **kwargs)
+    etapa = etapa or getattr(func, "__name__", "tarefa")
+    resultados: list[tuple[str, Any]] = []
+    erros: dict[str, str] = {}
+
+    if workers <= 1:
+        for ticker in tickers:
+            try:
+                with medir(etapa, rotulo_ticker(ticker)):
+                    resultados.append((ticker, tarefa(ticker)))
+            except Exception as e:
+                erros[ticker] = str(e)
+        return resultados, erros
+
+    limite = max_pendentes or 2 * workers
+    pendentes: deque = deque()
+
+    def consumir_primeiro():
+        ticker, futuro = pendentes.popleft()
+        try:
+            resultado, metricas = futuro.result()
+            REGISTRO.mesclar(metricas)
+            resultados.append((ticker, resultado))
+        except Exception as e:
+            erros[ticker] = str(e)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for ticker in tickers:
+            if len(pendentes) >= limite:
+                consumir_primeiro()
+            pendentes.append((ticker, executor.submit(executar_medido, tarefa, etapa, ticker)))
+        while pendentes:
+            consumir_primeiro()
+
+    return resultados, erros
+
+
+def registrar_erros(erros: dict[str, str], etapa: str) -> None:
+    for ticker, mensagem in erros.items():
+        logging.error(f"[ERRO] {etapa} {ticker}: {mensagem}")
+    if erros:
+        logging.warning(f"[AVISO] {etapa}: {len(erros)} ticker(s) com erro")
@@ -1,11 +1,22 @@
 import os
 import logging
+import argparse
 import pandas as pd
 from ta.momentum import RSIIndicator
 from ta.trend import MACD, ADXIndicator
 from ta.volatility import BollingerBands, AverageTrueRange
 from ta.volume import OnBalanceVolumeIndicator
-from typing import Optional
+import storage
+from indicadores_incrementais import atualizar_features_incremental
+from indicadores_painel import processar_painel
+from execucao import adicionar_argumento_workers, executar_por_ticker, registrar_erros
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, medir
+
+# Colunas geradas por add_technical_indicators (gravadas em float32; OHLCV permanece float64)
+INDICADORES = [
+    'rsi_14', 'macd', 'macd_signal', 'macd_diff', 'adx',
+    'bb_hband', 'bb_lband', 'atr_14', 'ma_10', 'ma_50', 'obv'
+]
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -14,63 +25,80 @@ def add_technical_indicators(df: pd.DataFrame) -> pd.DataFrame:
     """
     Adiciona indicadores técnicos ao DataFrame OHLCV.
     """
-    df = df.copy()
-
     try:
+        indicadores = {}
+
         # Momentum
-        df['rsi_14'] = RSIIndicator(close=df['close'], window=14).rsi()
+        indicadores['rsi_14'] = RSIIndicator(close=df['close'], window=14).rsi()
 
         # Tendência
         macd = MACD(close=df['close'])
-        df['macd'] = macd.macd()
-        df['macd_signal'] = macd.macd_signal()
-        df['macd_diff'] = macd.macd_diff()
+        indicadores['macd'] = macd.macd()
+        indicadores['macd_signal'] = macd.macd_signal()
+        indicadores['macd_diff'] = macd.macd_diff()
 
-        df['adx'] = ADXIndicator(high=df['high'], low=df['low'], close=df['close'], window=14).adx()
+        indicadores['adx'] = ADXIndicator(high=df['high'], low=df['low'], close=df['close'], window=14).adx()
 
         # Volatilidade
         bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-        df['bb_hband'] = bb.bollinger_hband()
-        df['bb_lband'] = bb.bollinger_lband()
-        df['atr_14'] = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14).average_true_range()
+        indicadores['bb_hband'] = bb.bollinger_hband()
+        indicadores['bb_lband'] = bb.bollinger_lband()
+        indicadores['atr_14'] = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14).average_true_range()
 
         # Médias móveis
-        df['ma_10'] = df['close'].rolling(window=10).mean()
-        df['ma_50'] = df['close'].rolling(window=50).mean()
+        indicadores['ma_10'] = df['close'].rolling(window=10).mean()
+        indicadores['ma_50'] = df['close'].rolling(window=50).mean()
 
         # Volume
-        df['obv'] = OnBalanceVolumeIndicator(close=df['close'], volume=df['volume']).on_balance_volume()
+        indicadores['obv'] = OnBalanceVolumeIndicator(close=df['close'], volume=df['volume']).on_balance_volume()
 
-        return df
+        # Um único concat no lugar de copiar o DataFrame de entrada e inserir coluna a coluna
+        return pd.concat([df, pd.DataFrame(indicadores, index=df.index)], axis=1)
     except Exception as e:
         logging.error(f"Erro ao adicionar indicadores: {e}")
         return pd.DataFrame()
 
-def processar_arquivo_ohlcv(input_path: str, output_path: str) -> Optional[str]:
+def processar_arquivo_ohlcv(ticker: str, input_dir: str, output_dir: str) -> str:
     """
-    Lê um arquivo OHLCV, adiciona indicadores e salva o resultado.
+    Lê os dados OHLCV de um ticker, adiciona indicadores e salva o resultado.
+    Erros são propagados para que executar_por_ticker os registre por ticker.
     """
-    try:
-        df = pd.read_csv(input_path, parse_dates=['date'])
-        df.set_index('date', inplace=True)
-        df_feat = add_technical_indicators(df)
-        if not df_feat.empty:
-            df_feat.to_csv(output_path)
-            logging.info(f"[OK] {os.path.basename(input_path)} → {output_path}")
-            return output_path
-        else:
-            logging.warning(f"[AVISO] Nenhum dado gerado para {input_path}.")
-    except Exception as e:
-        logging.error(f"[ERRO] {input_path}: {e}")
-    return None
+    df = storage.ler(input_dir, ticker)
+    df_feat = add_technical_indicators(df)
+    if df_feat.empty:
+        raise ValueError(f"Nenhum indicador gerado para {ticker}")
+    output_path = storage.salvar(df_feat, output_dir, f"{ticker}_feat", float32=INDICADORES)
+    logging.info(f"[OK] {ticker} → {output_path}")
+    return output_path
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geração de indicadores técnicos")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--incremental", action="store_true", help="Calcula indicadores apenas para os candles novos, a partir do estado salvo")
+    modo.add_argument("--painel", action="store_true", help="Calcula todos os símbolos de uma vez em matrizes NumPy (tempo × símbolo)")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
     input_dir = "data/ohlcv"
     output_dir = "data/features"
     os.makedirs(output_dir, exist_ok=True)
 
-    arquivos_csv = [f for f in os.listdir(input_dir) if f.endswith(".csv")]
-    for arquivo in arquivos_csv:
-        input_path = os.path.join(input_dir, arquivo)
-        output_path = os.path.join(output_dir, arquivo.replace(".csv", "_feat.csv"))
-        processar_arquivo_ohlcv(input_path, output_path)
+    if args.painel:
+        with medir("features"):
+            processar_painel(input_dir, output_dir)
+    elif args.incremental:
+        resultados, erros = executar_por_ticker(
+            atualizar_features_incremental, storage.listar(input_dir), workers=args.workers, etapa="features",
+            input_dir=input_dir, output_dir=output_dir
+        )
+        for ticker, novos in resultados:
+            logging.info(f"[OK] {ticker}: {novos} candles processados (incremental)")
+        registrar_erros(erros, "features")
+    else:
+        _, erros = executar_por_ticker(
+            processar_arquivo_ohlcv, storage.listar(input_dir), workers=args.workers, etapa="features",
+            input_dir=input_dir, output_dir=output_dir
+        )
+        registrar_erros(erros, "features")
@@ -1,12 +1,15 @@
 import os
+import json
 import logging
+import argparse
 from datetime import datetime
-from binance.client import Client
 import pandas as pd
-from typing import Dict
+from typing import Dict, Optional
 from concurrent.futures import ThreadPoolExecutor
 from config import API_KEY as API_KEY
 from config import API_SECRET as API_SECRET
+import storage
+from instrumentacao import adicionar_argumentos_metricas, chamada_api, configurar_metricas, medir
 
 # Setup básico de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -14,8 +17,17 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 # Configurações da Binance API (substituir por suas chaves ou variáveis de ambiente)
 # Recomenda-se usar variáveis de ambiente para segurança
 
-# Inicializa o cliente da Binance
-client = Client(API_KEY, API_SECRET)
+# Cliente da Binance criado sob demanda: o construtor faz um ping na API,
+# então importar este módulo (ex: pelas listas de pares) não deve exigir rede.
+# O python-binance também é importado só aqui, pois sozinho leva mais de meio segundo
+_client = None
+
+def obter_client():
+    global _client
+    if _client is None:
+        from binance.client import Client
+        _client = Client(API_KEY, API_SECRET)
+    return _client
 
 # Pares de criptomoedas (exemplo: BTCUSDT, ETHUSDT - adicione ou remova conforme desejar)
 CRYPTO_PAIRS = [
@@ -35,37 +47,188 @@ END_DATE = datetime.today().strftime("%d %b, %Y") # Formato compatível com pyth
 
 OUTPUT_DIR = "data/ohlcv"
 
-def fetch_ohlcv_binance(symbol: str) -> pd.DataFrame:
+# Máximo de candles retornados por requisição de klines da Binance
+KLINES_LIMIT = 1000
+
+KLINE_COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_asset_volume', 'number_of_trades',
+    'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+]
+
+def intervalo_em_ms(interval: str) -> int:
+    """
+    Converte um intervalo da Binance (ex: '15m', '1h', '1d', '1w') em milissegundos.
+    """
+    unidades = {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}
+    if len(interval) < 2 or interval[-1] not in unidades or not interval[:-1].isdigit():
+        raise ValueError(f"Intervalo não suportado: {interval}")
+    return int(interval[:-1]) * unidades[interval[-1]]
+
+def klines_para_dataframe(klines: list) -> pd.DataFrame:
+    """
+    Converte a lista de klines da Binance em um DataFrame OHLCV indexado por data.
+    """
+    df = pd.DataFrame(klines, columns=KLINE_COLUMNS)
+
+    # Converte timestamp para datetime e define como índice
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df = df.set_index('timestamp')
+
+    # Seleciona e renomeia colunas relevantes e converte para tipo numérico
+    df = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
+
+    df.index.name = 'date'
+
+    return df
+
+def fetch_ohlcv_binance(symbol: str, start=START_DATE, end=END_DATE) -> pd.DataFrame:
     """
     Baixa dados OHLCV de um par de criptomoedas da Binance e formata o DataFrame.
     """
     try:
         # Obtém dados históricos
-        klines = client.get_historical_klines(symbol, INTERVAL, START_DATE, END_DATE)
+        with chamada_api("klines", symbol):
+            klines = obter_client().get_historical_klines(symbol, INTERVAL, start, end)
 
         if not klines:
             raise ValueError(f"Nenhum dado encontrado para {symbol}")
 
-        # Converte para DataFrame
-        df = pd.DataFrame(klines, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume',
-            'close_time', 'quote_asset_volume', 'number_of_trades',
-            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-        ])
+        return klines_para_dataframe(klines)
+    except Exception as e:
+        logging.warning(f"[{symbol}] Erro ao baixar dados da Binance: {e}")
+        return pd.DataFrame()  # Retorna vazio se falhar
+
+def fetch_ohlcv_intervalo(symbol: str, start_ms: int, end_ms: Optional[int] = None) -> pd.DataFrame:
+    """
+    Baixa os candles entre start_ms e end_ms (inclusive).
+    Intervalos que cabem em uma página usam uma única chamada a get_klines;
+    os demais caem na paginação de get_historical_klines.
+    """
+    passo = intervalo_em_ms(INTERVAL)
+    fim = end_ms if end_ms is not None else int(datetime.now().timestamp() * 1000)
+    if (fim - start_ms) // passo + 1 <= KLINES_LIMIT:
+        params = {'symbol': symbol, 'interval': INTERVAL, 'startTime': start_ms, 'limit': KLINES_LIMIT}
+        if end_ms is not None:
+            params['endTime'] = end_ms
+        with chamada_api("klines", symbol):
+            klines = obter_client().get_klines(**params)
+    else:
+        with chamada_api("klines", symbol):
+            klines = obter_client().get_historical_klines(symbol, INTERVAL, start_ms, end_ms)
 
-        # Converte timestamp para datetime e define como índice
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df = df.set_index('timestamp')
+    if not klines:
+        return pd.DataFrame()
+    return klines_para_dataframe(klines)
+
+def ler_ohlcv_existente(output_dir: str, symbol: str) -> pd.DataFrame:
+    """
+    Lê os dados OHLCV já salvos de um símbolo (vazio se não existir).
+    """
+    if not storage.existe(output_dir, symbol):
+        return pd.DataFrame()
+    return storage.ler(output_dir, symbol).sort_index()
+
+def detectar_lacunas(index: pd.DatetimeIndex, interval: str = INTERVAL) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Retorna os intervalos (início, fim) de candles ausentes entre o primeiro e o último registro.
+    """
+    if len(index) < 2:
+        return []
+    passo = pd.Timedelta(milliseconds=intervalo_em_ms(interval))
+    esperado = pd.date_range(index.min(), index.max(), freq=passo)
+    faltantes = esperado.difference(index)
+    if faltantes.empty:
+        return []
 
-        # Seleciona e renomeia colunas relevantes e converte para tipo numérico
-        df = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
+    # Agrupa timestamps consecutivos em blocos contínuos
+    quebras = (faltantes.to_series().diff() != passo).cumsum()
+    return [(bloco.min(), bloco.max()) for _, bloco in faltantes.to_series().groupby(quebras)]
 
-        df.index.name = 'date'
+def caminho_lacunas_vazias(output_dir: str, symbol: str) -> str:
+    return os.path.join(output_dir, "lacunas", f"{symbol}.json")
 
-        return df
+def carregar_lacunas_vazias(output_dir: str, symbol: str) -> set[tuple[str, str]]:
+    """
+    Lacunas já buscadas que a Binance não tem (ex: exchange fora do ar), como (início, fim) em ISO.
+    """
+    path = caminho_lacunas_vazias(output_dir, symbol)
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {tuple(lacuna) for lacuna in json.load(f)}
+
+def registrar_lacunas_vazias(output_dir: str, symbol: str, lacunas: list[tuple[pd.Timestamp, pd.Timestamp]]) -> None:
+    if not lacunas:
+        return
+    vazias = carregar_lacunas_vazias(output_dir, symbol) | {(a.isoformat(), b.isoformat()) for a, b in lacunas}
+    path = caminho_lacunas_vazias(output_dir, symbol)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(sorted(vazias), f)
+    logging.info(f"[{symbol}] {len(lacunas)} lacuna(s) sem candles na Binance: ignoradas nas próximas atualizações")
+
+def lacunas_pendentes(index: pd.DatetimeIndex, output_dir: str, symbol: str,
+                      interval: str = INTERVAL) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Lacunas do histórico salvo, exceto as que já voltaram vazias em uma atualização anterior.
+    """
+    vazias = carregar_lacunas_vazias(output_dir, symbol)
+    return [(a, b) for a, b in detectar_lacunas(index, interval) if (a.isoformat(), b.isoformat()) not in vazias]
+
+def _para_ms(ts: pd.Timestamp) -> int:
+    return int(ts.timestamp() * 1000)
+
+def atualizar_ohlcv_incremental(symbol: str, output_dir: str) -> int:
+    """
+    Atualiza a tabela OHLCV de um símbolo buscando apenas os candles novos e as lacunas.
+    Lacunas que voltam sem candles são registradas e não são buscadas de novo.
+    Retorna a quantidade de candles novos gravados.
+    """
+    df = ler_ohlcv_existente(output_dir, symbol)
+
+    if df.empty:
+        # Sem histórico salvo: download completo desde START_DATE
+        df_novo = fetch_ohlcv_binance(symbol)
+        if df_novo.empty:
+            return 0
+        path = storage.salvar(df_novo, output_dir, symbol)
+        logging.info(f"[{symbol}] histórico completo salvo em {path} ({len(df_novo)} candles)")
+        return len(df_novo)
+
+    try:
+        lacunas = lacunas_pendentes(df.index, output_dir, symbol)
+        partes = [fetch_ohlcv_intervalo(symbol, _para_ms(inicio), _para_ms(fim)) for inicio, fim in lacunas]
+        # O último candle salvo pode estar incompleto (candle do dia corrente), então é buscado de novo
+        cauda = fetch_ohlcv_intervalo(symbol, _para_ms(df.index.max()))
     except Exception as e:
-        logging.warning(f"[{symbol}] Erro ao baixar dados da Binance: {e}")
-        return pd.DataFrame()  # Retorna vazio se falhar
+        logging.warning(f"[{symbol}] Erro ao atualizar dados da Binance: {e}")
+        return 0
+
+    registrar_lacunas_vazias(output_dir, symbol, [l for l, p in zip(lacunas, partes) if p.empty])
+    partes = [p for p in partes if not p.empty]
+    novos = cauda[cauda.index > df.index.max()] if not cauda.empty else cauda
+
+    ultimo_alterado = (
+        not cauda.empty
+        and df.index.max() in cauda.index
+        and not cauda.loc[df.index.max()].equals(df.loc[df.index.max()])
+    )
+
+    if not partes and not ultimo_alterado:
+        # Caso comum: apenas candles novos no fim, anexados ao arquivo existente
+        if not novos.empty:
+            storage.anexar(novos, output_dir, symbol)
+        logging.info(f"[{symbol}] {len(novos)} candles novos anexados")
+        return len(novos)
+
+    # Lacunas preenchidas ou último candle revisado: regrava a tabela ordenada
+    df = pd.concat([df, *partes, cauda])
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    path = storage.salvar(df, output_dir, symbol)
+    preenchidos = sum(len(p) for p in partes)
+    logging.info(f"[{symbol}] {len(novos)} candles novos e {preenchidos} de lacunas gravados em {path}")
+    return len(novos) + preenchidos
 
 def fetch_all_ohlcv(symbols: list[str]) -> Dict[str, pd.DataFrame]:
     """
@@ -75,7 +238,8 @@ def fetch_all_ohlcv(symbols: list[str]) -> Dict[str, pd.DataFrame]:
     data = {}
 
     def process_symbol(s):
-        df = fetch_ohlcv_binance(s)
+        with medir("fetch", s):
+            df = fetch_ohlcv_binance(s)
         if not df.empty:
             data[s] = df
 
@@ -86,19 +250,37 @@ def fetch_all_ohlcv(symbols: list[str]) -> Dict[str, pd.DataFrame]:
 
 def salvar_dados_ohlcv(data: Dict[str, pd.DataFrame], output_dir: str) -> None:
     """
-    Salva os dados coletados em arquivos CSV.
+    Salva os dados coletados no formato de armazenamento do pipeline.
     """
-    os.makedirs(output_dir, exist_ok=True)
     for symbol, df in data.items():
-        path = os.path.join(output_dir, f"{symbol}.csv")
-        df.to_csv(path)
+        path = storage.salvar(df, output_dir, symbol)
         logging.info(f"[{symbol}] salvo em {path}")
 
+def atualizar_todos_ohlcv(symbols: list[str], output_dir: str) -> Dict[str, int]:
+    """
+    Executa a atualização incremental de todos os símbolos em paralelo.
+    """
+    logging.info("Iniciando atualização incremental dos dados OHLCV da Binance...")
+    def atualizar(s):
+        with medir("fetch", s):
+            return atualizar_ohlcv_incremental(s, output_dir)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        novos = executor.map(atualizar, symbols)
+    return dict(zip(symbols, novos))
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coleta de dados OHLCV da Binance")
+    parser.add_argument("--incremental", action="store_true", help="Busca apenas candles novos e lacunas, anexando aos dados existentes")
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
     # Certifique-se de configurar suas chaves de API da Binance
     if 'SUA_API_KEY' in API_KEY or 'SUA_API_SECRET' in API_SECRET:
         logging.warning("Por favor, configure suas chaves de API da Binance no arquivo ou variáveis de ambiente.")
+    elif args.incremental:
+        atualizar_todos_ohlcv(CRYPTO_PAIRS, OUTPUT_DIR)
     else:
         ohlcv_data = fetch_all_ohlcv(CRYPTO_PAIRS)
         salvar_dados_ohlcv(ohlcv_data, OUTPUT_DIR)
-
@@ -0,0 +1,254 @@
+import time
+import random
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Optional
+
+import aiohttp
+import pandas as pd
+
+import storage
+from instrumentacao import adicionar_argumentos_metricas, chamada_api, configurar_metricas, medir
+from fetch_all_ohlcv_salva_todos import (
+    CRYPTO_PAIRS, INTERVAL, OUTPUT_DIR, KLINES_LIMIT,
+    intervalo_em_ms, klines_para_dataframe, lacunas_pendentes, registrar_lacunas_vazias,
+)
+
+BASE_URL = "https://api.binance.com"
+START_MS = int(datetime(2017, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+# Limite de peso de requisições da Binance (REQUEST_WEIGHT por minuto) e peso de /api/v3/klines
+PESO_MAXIMO_MINUTO = 6000
+PESO_KLINES = 2
+# Margem de segurança: o limitador nunca usa todo o limite informado pela exchange
+FRACAO_SEGURA = 0.8
+
+MAX_TENTATIVAS = 6
+BACKOFF_BASE = 0.5
+BACKOFF_MAXIMO = 30.0
+
+
+class LimitadorPeso:
+    """
+    Token bucket de peso de requisições. Recarrega continuamente até 'capacidade' por minuto
+    e é ressincronizado com o peso real consumido, informado pela Binance no cabeçalho
+    X-MBX-USED-WEIGHT-1M de cada resposta.
+    """
+
+    def __init__(self, capacidade: float = PESO_MAXIMO_MINUTO * FRACAO_SEGURA):
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.taxa = capacidade / 60.0
+        self.ultimo = time.monotonic()
+        self.pausa_ate = 0.0
+        self._lock = asyncio.Lock()
+
+    def _recarregar(self) -> None:
+        agora = time.monotonic()
+        if agora <= self.ultimo:
+            return
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+        self.ultimo = agora
+
+    async def adquirir(self, peso: float) -> None:
+        async with self._lock:
+            while True:
+                espera_pausa = self.pausa_ate - time.monotonic()
+                if espera_pausa > 0:
+                    await asyncio.sleep(espera_pausa)
+                    continue
+                self._recarregar()
+                if self.tokens >= peso:
+                    self.tokens -= peso
+                    return
+                await asyncio.sleep((peso - self.tokens) / self.taxa)
+
+    def sincronizar(self, usado_1m: Optional[str]) -> None:
+        """
+        Ajusta os tokens disponíveis ao peso já usado no minuto segundo a exchange.
+        """
+        if usado_1m is None:
+            return
+        try:
+            restante = self.capacidade - float(usado_1m)
+        except ValueError:
+            return
+        self._recarregar()
+        self.tokens = min(self.tokens, max(restante, 0.0))
+
+    def pausar(self, segundos: float) -> None:
+        """
+        Suspende todas as requisições (429/418 com Retry-After). Os tokens são zerados e só
+        voltam a recarregar depois da pausa, já que o limite real da exchange foi atingido.
+        """
+        self.pausa_ate = max(self.pausa_ate, time.monotonic() + segundos)
+        self.tokens = 0.0
+        self.ultimo = self.pausa_ate
+
+
+async def _get_klines(session: aiohttp.ClientSession, limitador: LimitadorPeso, base_url: str,
+                      params: dict) -> list:
+    """
+    GET /api/v3/klines com limitação de peso e nova tentativa com backoff exponencial e jitter
+    em 429 (limite excedido), 418 (IP banido temporariamente), 5xx e falhas de conexão.
+    """
+    url = f"{base_url}/api/v3/klines"
+    for tentativa in range(MAX_TENTATIVAS):
+        await limitador.adquirir(PESO_KLINES)
+        try:
+            with chamada_api("klines", params["symbol"]):
+                async with session.get(url, params=params) as resp:
+                    limitador.sincronizar(resp.headers.get("X-MBX-USED-WEIGHT-1M"))
+                    if resp.status == 200:
+                        return await resp.json()
+                    if resp.status in (429, 418):
+                        retry_after = float(resp.headers.get("Retry-After", BACKOFF_BASE * 2 ** tentativa))
+                        limitador.pausar(retry_after)
+                        logging.warning(f"[{params['symbol']}] HTTP {resp.status}: pausando {retry_after:.1f}s")
+                        continue
+                    if resp.status < 500:
+                        raise RuntimeError(f"HTTP {resp.status}: {await resp.text()}")
+                    logging.warning(f"[{params['symbol']}] HTTP {resp.status} (tentativa {tentativa + 1})")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"[{params['symbol']}] Falha de conexão (tentativa {tentativa + 1}): {e}")
+        # Full jitter: espera aleatória entre 0 e o backoff exponencial
+        await asyncio.sleep(random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** tentativa)))
+    raise RuntimeError(f"[{params['symbol']}] Número máximo de tentativas excedido")
+
+
+def _janelas(inicio_ms: int, fim_ms: int, passo_ms: int) -> list[tuple[int, int]]:
+    """
+    Divide [inicio, fim] em janelas de no máximo KLINES_LIMIT candles.
+    """
+    largura = passo_ms * KLINES_LIMIT
+    return [(ini, min(ini + largura - 1, fim_ms)) for ini in range(inicio_ms, fim_ms + 1, largura)]
+
+
+async def buscar_intervalo(session, limitador, base_url: str, symbol: str, interval: str,
+                           inicio_ms: int, fim_ms: int) -> list:
+    """
+    Baixa todas as janelas de klines do intervalo em paralelo e devolve a lista ordenada.
+    """
+    passo = intervalo_em_ms(interval)
+    tarefas = [
+        _get_klines(session, limitador, base_url, {
+            "symbol": symbol, "interval": interval,
+            "startTime": ini, "endTime": fim, "limit": KLINES_LIMIT,
+        })
+        for ini, fim in _janelas(inicio_ms, fim_ms, passo)
+    ]
+    paginas = await asyncio.gather(*tarefas)
+    return [k for pagina in paginas for k in pagina]
+
+
+async def _primeiro_timestamp(session, limitador, base_url: str, symbol: str, interval: str) -> Optional[int]:
+    klines = await _get_klines(session, limitador, base_url,
+                               {"symbol": symbol, "interval": interval, "startTime": 0, "limit": 1})
+    return klines[0][0] if klines else None
+
+
+def _ms(ts: pd.Timestamp) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+async def atualizar_simbolo(session, limitador, base_url: str, symbol: str, interval: str,
+                            output_dir: str, incremental: bool) -> int:
+    """
+    Baixa o histórico de um símbolo (ou só candles novos e lacunas, no modo incremental)
+    e grava a tabela OHLCV. Lacunas que voltam sem candles são registradas e não são buscadas de novo.
+    Retorna a quantidade de candles baixados.
+    """
+    agora = int(time.time() * 1000)
+    existente = storage.ler(output_dir, symbol) if incremental and storage.existe(output_dir, symbol) else pd.DataFrame()
+
+    if existente.empty:
+        primeiro = await _primeiro_timestamp(session, limitador, base_url, symbol, interval)
+        if primeiro is None:
+            logging.warning(f"[{symbol}] Nenhum dado encontrado")
+            return 0
+        lacunas = []
+        intervalos = [(max(START_MS, primeiro), agora)]
+    else:
+        lacunas = lacunas_pendentes(existente.index, output_dir, symbol, interval)
+        intervalos = [(_ms(a), _ms(b)) for a, b in lacunas]
+        # O último candle salvo pode estar incompleto, então é buscado de novo
+        intervalos.append((_ms(existente.index.max()), agora))
+
+    partes = await asyncio.gather(*[
+        buscar_intervalo(session, limitador, base_url, symbol, interval, ini, fim) for ini, fim in intervalos
+    ])
+    registrar_lacunas_vazias(output_dir, symbol, [l for l, parte in zip(lacunas, partes) if not parte])
+    klines = [k for parte in partes for k in parte]
+    if not klines:
+        return 0
+
+    df = klines_para_dataframe(klines)
+    df = df[~df.index.duplicated(keep="last")]
+    if not existente.empty:
+        ultimo = existente.index.max()
+        revisado = ultimo in df.index and not df.loc[ultimo].equals(existente.loc[ultimo])
+        if not revisado and not (df.index < ultimo).any():
+            # Caso comum: apenas candles novos no fim, anexados ao arquivo existente
+            novos = df[df.index > ultimo].sort_index()
+            if not novos.empty:
+                storage.anexar(novos, output_dir, symbol)
+            logging.info(f"[{symbol}] {len(novos)} candles novos anexados")
+            return len(klines)
+        # Lacunas preenchidas ou último candle revisado: regrava a tabela ordenada
+        df = pd.concat([existente, df])
+        df = df[~df.index.duplicated(keep="last")]
+    df = df.sort_index()
+    path = storage.salvar(df, output_dir, symbol)
+    logging.info(f"[{symbol}] {len(klines)} candles baixados → {path}")
+    return len(klines)
+
+
+async def atualizar_todos(symbols: list[str], interval: str = INTERVAL, output_dir: str = OUTPUT_DIR,
+                          incremental: bool = True, base_url: str = BASE_URL, concorrencia: int = 20,
+                          limitador: Optional[LimitadorPeso] = None) -> dict[str, int]:
+    """
+    Atualiza todos os símbolos com uma única sessão HTTP (pool de conexões compartilhado).
+    Falhas de um símbolo são registradas sem interromper os demais.
+    """
+    limitador = limitador or LimitadorPeso()
+    conector = aiohttp.TCPConnector(limit=concorrencia)
+    timeout = aiohttp.ClientTimeout(total=30)
+    resultados: dict[str, int] = {}
+
+    async with aiohttp.ClientSession(connector=conector, timeout=timeout) as session:
+        async def processar(symbol):
+            try:
+                with medir("fetch", symbol):
+                    resultados[symbol] = await atualizar_simbolo(
+                        session, limitador, base_url, symbol, interval, output_dir, incremental)
+            except Exception as e:
+                logging.error(f"[{symbol}] Erro ao baixar dados: {e}")
+
+        await asyncio.gather(*(processar(s) for s in symbols))
+    return resultados
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Coleta assíncrona de OHLCV da Binance com controle de peso")
+    parser.add_argument("--symbols", type=str, nargs="*", default=CRYPTO_PAIRS, help="Pares a baixar")
+    parser.add_argument("--interval", type=str, default=INTERVAL, help="Intervalo dos candles (ex: 1d, 1h, 15m)")
+    parser.add_argument("--output_dir", type=str, default=OUTPUT_DIR, help="Diretório da tabela OHLCV")
+    parser.add_argument("--completo", action="store_true", help="Ignora os dados salvos e baixa o histórico completo")
+    parser.add_argument("--concorrencia", type=int, default=20, help="Conexões HTTP simultâneas")
+    parser.add_argument("--peso_maximo", type=int, default=PESO_MAXIMO_MINUTO, help="Limite de peso por minuto da API")
+    parser.add_argument("--base_url", type=str, default=BASE_URL, help="URL da API (ex: http://localhost:8081 para o servidor mock)")
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    inicio = time.perf_counter()
+    resultados = asyncio.run(atualizar_todos(
+        args.symbols, interval=args.interval, output_dir=args.output_dir, incremental=not args.completo,
+        base_url=args.base_url, concorrencia=args.concorrencia,
+        limitador=LimitadorPeso(args.peso_maximo * FRACAO_SEGURA),
+    ))
+    logging.info(f"{len(resultados)}/{len(args.symbols)} símbolos atualizados em {time.perf_counter() - inicio:.1f}s")
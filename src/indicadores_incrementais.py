@@ -0,0 +1,357 @@
+import os
+import json
+import zlib
+import logging
+import argparse
+from collections import deque
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+# Janelas usadas por add_technical_indicators (features_completo.py)
+RSI_WINDOW = 14
+MACD_FAST, MACD_SLOW, MACD_SIGN = 12, 26, 9
+ADX_WINDOW = 14
+BB_WINDOW, BB_DEV = 20, 2
+ATR_WINDOW = 14
+MA_CURTA, MA_LONGA = 10, 50
+
+COLUNAS = [
+    'rsi_14', 'macd', 'macd_signal', 'macd_diff', 'adx',
+    'bb_hband', 'bb_lband', 'atr_14', 'ma_10', 'ma_50', 'obv'
+]
+
+
+class _EWM:
+    """
+    Média exponencial com adjust=False, reproduzindo a recorrência do pandas (ewm().mean()).
+    """
+
+    def __init__(self, alpha: float, min_periods: int, weighted: float = np.nan, nobs: int = 0):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.weighted = weighted
+        self.nobs = nobs
+
+    def update(self, x: float) -> float:
+        observado = x == x
+        self.nobs += int(observado)
+        if self.weighted == self.weighted:
+            if observado and self.weighted != x:
+                old_wt = 1.0 - self.alpha
+                self.weighted = (old_wt * self.weighted + self.alpha * x) / (old_wt + self.alpha)
+        elif observado:
+            self.weighted = x
+        return self.weighted if self.nobs >= self.min_periods else np.nan
+
+    def estado(self) -> dict:
+        return {'weighted': self.weighted, 'nobs': self.nobs}
+
+
+class MotorIndicadores:
+    """
+    Calcula os indicadores de add_technical_indicators candle a candle, mantendo o estado
+    de suavização (EMA/Wilder), as janelas móveis e o OBV acumulado de um símbolo.
+    """
+
+    def __init__(self, estado: Optional[dict] = None):
+        e = estado or {}
+        self.n = e.get('n', 0)
+        self.prev_close = e.get('prev_close', np.nan)
+        self.prev_high = e.get('prev_high', np.nan)
+        self.prev_low = e.get('prev_low', np.nan)
+
+        # RSI (Wilder) e MACD
+        self.rsi_up = _EWM(1 / RSI_WINDOW, RSI_WINDOW, **e.get('rsi_up', {}))
+        self.rsi_dn = _EWM(1 / RSI_WINDOW, RSI_WINDOW, **e.get('rsi_dn', {}))
+        self.ema_fast = _EWM(2 / (MACD_FAST + 1), MACD_FAST, **e.get('ema_fast', {}))
+        self.ema_slow = _EWM(2 / (MACD_SLOW + 1), MACD_SLOW, **e.get('ema_slow', {}))
+        self.ema_sign = _EWM(2 / (MACD_SIGN + 1), MACD_SIGN, **e.get('ema_sign', {}))
+
+        # ADX: somas iniciais acumuladas até completar a janela, depois suavização de Wilder
+        self.adx_ini = e.get('adx_ini', {'dm': [], 'pos': [], 'neg': [], 'dx': []})
+        self.trs = e.get('trs', np.nan)
+        self.dip = e.get('dip', np.nan)
+        self.din = e.get('din', np.nan)
+        self.adx = e.get('adx', 0.0)
+
+        # ATR
+        self.tr_ini = e.get('tr_ini', [])
+        self.atr = e.get('atr', 0.0)
+
+        # Janelas móveis de fechamento (MA10, MA50, Bollinger) e OBV acumulado
+        self.closes = deque(e.get('closes', []), maxlen=max(MA_LONGA, BB_WINDOW))
+        self.obv = e.get('obv', 0.0)
+
+    def para_dict(self) -> dict:
+        return {
+            'n': self.n,
+            'prev_close': self.prev_close,
+            'prev_high': self.prev_high,
+            'prev_low': self.prev_low,
+            'rsi_up': self.rsi_up.estado(),
+            'rsi_dn': self.rsi_dn.estado(),
+            'ema_fast': self.ema_fast.estado(),
+            'ema_slow': self.ema_slow.estado(),
+            'ema_sign': self.ema_sign.estado(),
+            'adx_ini': self.adx_ini,
+            'trs': self.trs,
+            'dip': self.dip,
+            'din': self.din,
+            'adx': self.adx,
+            'tr_ini': self.tr_ini,
+            'atr': self.atr,
+            'closes': list(self.closes),
+            'obv': self.obv,
+        }
+
+    def _rsi(self, close: float) -> float:
+        diff = close - self.prev_close
+        up = diff if diff > 0 else 0.0
+        dn = -(diff if diff < 0 else 0.0)
+        emaup = self.rsi_up.update(up)
+        emadn = self.rsi_dn.update(dn)
+        if emadn == 0:
+            return 100.0
+        return 100 - (100 / (1 + emaup / emadn))
+
+    def _adx(self, high: float, low: float, close: float) -> float:
+        w = ADX_WINDOW
+        b = self.n
+        if b == 0:
+            return 0.0
+
+        dm = max(high, self.prev_close) - min(low, self.prev_close)
+        diff_up = high - self.prev_high
+        diff_down = self.prev_low - low
+        pos = abs(((diff_up > diff_down) and (diff_up > 0)) * diff_up)
+        neg = abs(((diff_down > diff_up) and (diff_down > 0)) * diff_down)
+
+        ini = self.adx_ini
+        if b < w:
+            ini['dm'].append(dm)
+            ini['pos'].append(pos)
+            ini['neg'].append(neg)
+            return 0.0
+        if b == w:
+            ini['dm'].append(dm)
+            ini['pos'].append(pos)
+            ini['neg'].append(neg)
+            self.trs = float(np.sum(ini['dm']))
+            self.dip = float(np.sum(ini['pos']))
+            self.din = float(np.sum(ini['neg']))
+            ini['dm'], ini['pos'], ini['neg'] = [], [], []
+        else:
+            self.trs = self.trs - (self.trs / float(w)) + dm
+            self.dip = self.dip - (self.dip / float(w)) + pos
+            self.din = self.din - (self.din / float(w)) + neg
+
+        di_pos = 100 * (self.dip / self.trs) if self.trs != 0 else 0
+        di_neg = 100 * (self.din / self.trs) if self.trs != 0 else 0
+        if di_pos + di_neg != 0:
+            dx = 100 * np.abs((di_pos - di_neg) / (di_pos + di_neg))
+        else:
+            dx = 0.0
+
+        if b < 2 * w - 1:
+            ini['dx'].append(dx)
+            return 0.0
+        if b == 2 * w - 1:
+            ini['dx'].append(dx)
+            self.adx = float(np.mean(ini['dx'][:w]))
+            ini['dx'] = []
+        else:
+            self.adx = ((self.adx * (w - 1)) + dx) / float(w)
+        return self.adx
+
+    def _atr(self, high: float, low: float) -> float:
+        w = ATR_WINDOW
+        tr = np.nanmax([high - low, abs(high - self.prev_close), abs(low - self.prev_close)])
+        if self.n < w:
+            self.tr_ini.append(float(tr))
+            if self.n < w - 1:
+                return 0.0
+            self.atr = float(np.mean(self.tr_ini))
+            self.tr_ini = []
+        else:
+            self.atr = (self.atr * (w - 1) + tr) / float(w)
+        return self.atr
+
+    def atualizar(self, high: float, low: float, close: float, volume: float) -> dict:
+        """
+        Processa um novo candle e retorna os indicadores correspondentes.
+        """
+        linha = {'rsi_14': self._rsi(close)}
+
+        fast = self.ema_fast.update(close)
+        slow = self.ema_slow.update(close)
+        macd = fast - slow
+        sinal = self.ema_sign.update(macd)
+        linha['macd'] = macd
+        linha['macd_signal'] = sinal
+        linha['macd_diff'] = macd - sinal
+
+        linha['adx'] = self._adx(high, low, close)
+
+        self.closes.append(close)
+        janela_bb = np.array(self.closes)[-BB_WINDOW:]
+        if len(janela_bb) == BB_WINDOW:
+            media, desvio = janela_bb.mean(), janela_bb.std(ddof=0)
+            linha['bb_hband'] = media + BB_DEV * desvio
+            linha['bb_lband'] = media - BB_DEV * desvio
+        else:
+            linha['bb_hband'] = linha['bb_lband'] = np.nan
+        linha['atr_14'] = self._atr(high, low)
+        linha['ma_10'] = np.mean(list(self.closes)[-MA_CURTA:]) if len(self.closes) >= MA_CURTA else np.nan
+        linha['ma_50'] = np.mean(self.closes) if len(self.closes) >= MA_LONGA else np.nan
+
+        self.obv += -volume if close < self.prev_close else volume
+        linha['obv'] = self.obv
+
+        self.prev_close, self.prev_high, self.prev_low = close, high, low
+        self.n += 1
+        return linha
+
+    def processar(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Processa os candles novos de um DataFrame OHLCV e retorna OHLCV + indicadores.
+        """
+        linhas = [
+            self.atualizar(h, l, c, v)
+            for h, l, c, v in zip(df['high'].to_numpy(), df['low'].to_numpy(),
+                                  df['close'].to_numpy(), df['volume'].to_numpy())
+        ]
+        indicadores = pd.DataFrame(linhas, index=df.index, columns=COLUNAS)
+        return pd.concat([df, indicadores], axis=1)
+
+
+# Candles já processados conferidos a cada atualização: a maior janela móvel do motor.
+# Lacunas preenchidas em qualquer ponto do histórico mudam a contagem de linhas e também são detectadas
+JANELA_CHECKSUM = max(MA_LONGA, BB_WINDOW)
+
+
+def checksum_ohlcv(df: pd.DataFrame) -> int:
+    """
+    CRC32 das datas e valores OHLCV: detecta candles anteriores revisados pelo fetch.
+    """
+    valores = np.ascontiguousarray(df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64))
+    return zlib.crc32(valores.tobytes(), zlib.crc32(df.index.asi8.tobytes()))
+
+
+def caminho_estado(output_dir: str, ticker: str) -> str:
+    return os.path.join(output_dir, "estado", f"{ticker}.json")
+
+
+def carregar_estado(output_dir: str, ticker: str) -> Optional[dict]:
+    path = caminho_estado(output_dir, ticker)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salvar_estado(output_dir: str, ticker: str, estado: dict) -> None:
+    path = caminho_estado(output_dir, ticker)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+
+
+def atualizar_features_incremental(ticker: str, input_dir: str, output_dir: str) -> int:
+    """
+    Atualiza as features de um ticker processando apenas os candles posteriores ao estado salvo.
+    O último candle é sempre reprocessado, pois pode ter sido revisado (candle ainda aberto).
+    Só a cauda do OHLCV é lida: o estado guarda a quantidade de candles processados e o checksum
+    dos últimos JANELA_CHECKSUM deles. Se o fetch preencher uma lacuna ou revisar um candle dessa
+    janela, as features são reconstruídas; senão, as linhas novas são anexadas à tabela.
+    Retorna a quantidade de candles processados.
+    """
+    estado = carregar_estado(output_dir, ticker)
+    feat_nome = f"{ticker}_feat"
+
+    cauda = None
+    if estado is not None and estado['ultimo_ts'] is not None and storage.existe(output_dir, feat_nome):
+        novos = storage.num_linhas(input_dir, ticker) - estado['linhas']
+        janela = min(JANELA_CHECKSUM, estado['linhas'])
+        if novos >= 1:
+            cauda = storage.ler(input_dir, ticker, tail=novos + janela)
+            processados = cauda[cauda.index <= pd.Timestamp(estado['ultimo_ts'])]
+            if (len(processados) != janela or processados.index[-1] != pd.Timestamp(estado['ultimo_ts'])
+                    or estado.get('checksum') != checksum_ohlcv(processados)):
+                cauda = None
+    if cauda is None:
+        # Sem estado válido (primeira execução ou histórico revisado): reconstrução completa
+        estado, cauda, janela = None, storage.ler(input_dir, ticker), 0
+        if cauda.empty:
+            return 0
+
+    df = cauda.iloc[janela:]
+    motor = MotorIndicadores(estado['motor'] if estado else None)
+    # Estado salvo antes do último candle, para que ele possa ser recalculado na próxima execução
+    partes = [motor.processar(df.iloc[:-1])] if len(df) > 1 else []
+    if len(df) > 1:
+        anteriores = cauda.iloc[:-1].tail(JANELA_CHECKSUM)
+        linhas = (estado['linhas'] if estado else 0) + len(df) - 1
+        snapshot = {'ultimo_ts': str(df.index[-2]), 'linhas': linhas, 'checksum': checksum_ohlcv(anteriores)}
+    elif estado:
+        snapshot = {k: estado.get(k) for k in ('ultimo_ts', 'linhas', 'checksum')}
+    else:
+        snapshot = {'ultimo_ts': None}
+    snapshot['motor'] = motor.para_dict()
+    partes.append(motor.processar(df.iloc[-1:]))
+    df_feat = pd.concat(partes)
+
+    if estado is not None:
+        # Substitui a linha do último candle anterior, recalculada acima
+        storage.anexar(df_feat, output_dir, feat_nome, substituir_desde=df.index[0])
+    else:
+        # O último candle vai para uma parte separada, substituída na próxima atualização sem
+        # regravar o histórico
+        storage.salvar(df_feat.iloc[:-1] if len(df_feat) > 1 else df_feat, output_dir, feat_nome, float32=COLUNAS)
+        if len(df_feat) > 1:
+            storage.anexar(df_feat.iloc[-1:], output_dir, feat_nome)
+    salvar_estado(output_dir, ticker, snapshot)
+    return len(df)
+
+
+def verificar_equivalencia(df: pd.DataFrame, cortes: int = 5, rtol: float = 1e-9) -> bool:
+    """
+    Confere se o cálculo incremental (em lotes arbitrários) reproduz add_technical_indicators.
+    """
+    from features_completo import add_technical_indicators
+
+    batch = add_technical_indicators(df)
+    if batch.empty:
+        raise ValueError("Histórico insuficiente para o cálculo em lote")
+
+    # Divide o histórico em lotes de tamanhos diferentes e reconstrói o motor a partir do estado serializado
+    limites = np.linspace(0, len(df), cortes + 1).astype(int)
+    motor, partes = MotorIndicadores(), []
+    for ini, fim in zip(limites[:-1], limites[1:]):
+        partes.append(motor.processar(df.iloc[ini:fim]))
+        motor = MotorIndicadores(json.loads(json.dumps(motor.para_dict())))
+    incremental = pd.concat(partes)
+
+    ok = True
+    for col in COLUNAS:
+        if not np.allclose(incremental[col], batch[col], rtol=rtol, atol=1e-9, equal_nan=True):
+            diff = (incremental[col] - batch[col]).abs().max()
+            logging.error(f"[DIVERGÊNCIA] {col}: diferença máxima {diff}")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Confere o motor incremental contra o cálculo em lote")
+    parser.add_argument("--input_dir", type=str, default="data/ohlcv", help="Diretório com os dados OHLCV")
+    parser.add_argument("--cortes", type=int, default=5, help="Quantidade de lotes incrementais")
+    args = parser.parse_args()
+
+    for ticker in storage.listar(args.input_dir):
+        ok = verificar_equivalencia(storage.ler(args.input_dir, ticker), cortes=args.cortes)
+        logging.info(f"[{'OK' if ok else 'ERRO'}] {ticker}: incremental {'=' if ok else '≠'} lote")
@@ -0,0 +1,200 @@
+import logging
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import storage
+from indicadores_incrementais import (
+    RSI_WINDOW, MACD_FAST, MACD_SLOW, MACD_SIGN, ADX_WINDOW,
+    BB_WINDOW, BB_DEV, ATR_WINDOW, MA_CURTA, MA_LONGA, COLUNAS,
+)
+
+CAMPOS_OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+
+def montar_painel(dados: Dict[str, pd.DataFrame]) -> tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Empilha o OHLCV de todos os símbolos em matrizes (tempo × símbolo).
+    Cada coluna é alinhada à direita pelo número do candle: o último candle de todos os símbolos
+    ocupa a última linha e o início dos símbolos mais novos é preenchido com NaN.
+    Retorna as matrizes por campo e o deslocamento (linhas de preenchimento) de cada símbolo.
+    """
+    comprimentos = np.array([len(df) for df in dados.values()])
+    T, N = int(comprimentos.max()), len(dados)
+    offsets = T - comprimentos
+
+    painel = {campo: np.full((T, N), np.nan) for campo in CAMPOS_OHLCV}
+    for j, df in enumerate(dados.values()):
+        for campo in CAMPOS_OHLCV:
+            painel[campo][offsets[j]:, j] = df[campo].to_numpy(dtype=float)
+    return painel, offsets
+
+
+def _anterior(x: np.ndarray) -> np.ndarray:
+    prev = np.full_like(x, np.nan)
+    prev[1:] = x[:-1]
+    return prev
+
+
+def _ewm(x: np.ndarray, alpha: float, min_periods: int) -> np.ndarray:
+    """
+    ewm(alpha, adjust=False).mean() aplicado a todas as colunas de uma vez.
+    """
+    old_wt = 1.0 - alpha
+    weighted = np.full(x.shape[1], np.nan)
+    nobs = np.zeros(x.shape[1], dtype=int)
+    out = np.empty_like(x)
+    for t in range(x.shape[0]):
+        cur = x[t]
+        observado = ~np.isnan(cur)
+        nobs += observado
+        iniciado = ~np.isnan(weighted)
+        atualiza = iniciado & observado & (weighted != cur)
+        weighted = np.where(atualiza, (old_wt * weighted + alpha * cur) / (old_wt + alpha), weighted)
+        weighted = np.where(~iniciado & observado, cur, weighted)
+        out[t] = np.where(nobs >= min_periods, weighted, np.nan)
+    return out
+
+
+def _rolling(x: np.ndarray, window: int, func) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if x.shape[0] >= window:
+        out[window - 1:] = func(sliding_window_view(x, window, axis=0), axis=-1)
+    return out
+
+
+def _coletar(x: np.ndarray, inicio: np.ndarray, window: int) -> np.ndarray:
+    """
+    Retorna, para cada coluna j, os 'window' valores a partir da linha inicio[j] (window × N).
+    Linhas fora do painel (símbolos com histórico curto) viram NaN.
+    """
+    linhas = inicio[None, :] + np.arange(window)[:, None]
+    validas = linhas < x.shape[0]
+    valores = np.take_along_axis(x, np.minimum(linhas, x.shape[0] - 1), axis=0)
+    return np.where(validas, valores, np.nan)
+
+
+def _rsi(close: np.ndarray, barra: np.ndarray) -> np.ndarray:
+    diff = close - _anterior(close)
+    up = np.where(diff > 0, diff, 0.0)
+    down = -np.where(diff < 0, diff, 0.0)
+    # Linhas de preenchimento não são observações
+    up = np.where(barra >= 0, up, np.nan)
+    down = np.where(barra >= 0, down, np.nan)
+    emaup = _ewm(up, 1 / RSI_WINDOW, RSI_WINDOW)
+    emadn = _ewm(down, 1 / RSI_WINDOW, RSI_WINDOW)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(emadn == 0, 100, 100 - (100 / (1 + emaup / emadn)))
+
+
+def _wilder_soma(x: np.ndarray, barra: np.ndarray, offsets: np.ndarray, w: int) -> np.ndarray:
+    """
+    Soma inicial dos valores das barras 1..w seguida da suavização s - s/w + x (ADX do ta).
+    """
+    inicial = np.nansum(_coletar(x, offsets + 1, w), axis=0)
+    out = np.full_like(x, np.nan)
+    prev = np.full(x.shape[1], np.nan)
+    for t in range(x.shape[0]):
+        b = barra[t]
+        prev = np.where(b == w, inicial, np.where(b > w, prev - (prev / float(w)) + x[t], np.nan))
+        out[t] = prev
+    return out
+
+
+def _adx(high: np.ndarray, low: np.ndarray, close: np.ndarray, barra: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    w = ADX_WINDOW
+    close_prev = _anterior(close)
+    dm = np.maximum(high, close_prev) - np.minimum(low, close_prev)
+    diff_up = high - _anterior(high)
+    diff_down = _anterior(low) - low
+    pos = np.abs(((diff_up > diff_down) & (diff_up > 0)) * diff_up)
+    neg = np.abs(((diff_down > diff_up) & (diff_down > 0)) * diff_down)
+
+    trs = _wilder_soma(dm, barra, offsets, w)
+    dip = _wilder_soma(pos, barra, offsets, w)
+    din = _wilder_soma(neg, barra, offsets, w)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_pos = np.where(trs != 0, 100 * (dip / trs), 0)
+        di_neg = np.where(trs != 0, 100 * (din / trs), 0)
+        dx = np.where(di_pos + di_neg != 0, 100 * np.abs((di_pos - di_neg) / (di_pos + di_neg)), 0)
+
+    inicial = np.mean(_coletar(dx, offsets + w, w), axis=0)
+    out = np.zeros_like(close)
+    prev = np.zeros(close.shape[1])
+    for t in range(close.shape[0]):
+        b = barra[t]
+        prev = np.where(b == 2 * w - 1, inicial,
+                        np.where(b >= 2 * w, ((prev * (w - 1)) + dx[t]) / float(w), 0.0))
+        out[t] = prev
+    return out
+
+
+def _atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, barra: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    w = ATR_WINDOW
+    close_prev = _anterior(close)
+    tr = np.fmax(np.fmax(high - low, np.abs(high - close_prev)), np.abs(low - close_prev))
+    inicial = np.mean(_coletar(tr, offsets, w), axis=0)
+    out = np.zeros_like(close)
+    prev = np.zeros(close.shape[1])
+    for t in range(close.shape[0]):
+        b = barra[t]
+        prev = np.where(b == w - 1, inicial, np.where(b >= w, (prev * (w - 1) + tr[t]) / float(w), 0.0))
+        out[t] = prev
+    return out
+
+
+def calcular_indicadores_painel(painel: Dict[str, np.ndarray], offsets: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Calcula os indicadores de add_technical_indicators para todos os símbolos de uma vez.
+    Os laços percorrem apenas o eixo do tempo; cada passo opera sobre o vetor de símbolos.
+    """
+    high, low, close, volume = painel['high'], painel['low'], painel['close'], painel['volume']
+    # Número do candle de cada símbolo em cada linha (negativo no preenchimento)
+    barra = np.arange(close.shape[0])[:, None] - offsets[None, :]
+
+    ind = {'rsi_14': _rsi(close, barra)}
+
+    fast = _ewm(close, 2 / (MACD_FAST + 1), MACD_FAST)
+    slow = _ewm(close, 2 / (MACD_SLOW + 1), MACD_SLOW)
+    ind['macd'] = fast - slow
+    ind['macd_signal'] = _ewm(ind['macd'], 2 / (MACD_SIGN + 1), MACD_SIGN)
+    ind['macd_diff'] = ind['macd'] - ind['macd_signal']
+
+    ind['adx'] = _adx(high, low, close, barra, offsets)
+
+    media = _rolling(close, BB_WINDOW, np.mean)
+    desvio = _rolling(close, BB_WINDOW, np.std)
+    ind['bb_hband'] = media + BB_DEV * desvio
+    ind['bb_lband'] = media - BB_DEV * desvio
+    ind['atr_14'] = _atr(high, low, close, barra, offsets)
+
+    ind['ma_10'] = _rolling(close, MA_CURTA, np.mean)
+    ind['ma_50'] = _rolling(close, MA_LONGA, np.mean)
+
+    sinal = np.where(close < _anterior(close), -volume, volume)
+    ind['obv'] = np.cumsum(np.where(barra >= 0, sinal, 0.0), axis=0)
+    return ind
+
+
+def processar_painel(input_dir: str, output_dir: str) -> list[str]:
+    """
+    Lê o OHLCV de todos os símbolos, calcula os indicadores no painel e grava as features por símbolo.
+    """
+    tickers = storage.listar(input_dir)
+    dados = {t: storage.ler(input_dir, t, columns=CAMPOS_OHLCV).sort_index() for t in tickers}
+    if not dados:
+        return []
+
+    painel, offsets = montar_painel(dados)
+    indicadores = calcular_indicadores_painel(painel, offsets)
+
+    salvos = []
+    for j, (ticker, df) in enumerate(dados.items()):
+        colunas = {col: indicadores[col][offsets[j]:, j] for col in COLUNAS}
+        df_feat = pd.concat([df, pd.DataFrame(colunas, index=df.index)], axis=1)
+        salvos.append(storage.salvar(df_feat, output_dir, f"{ticker}_feat", float32=COLUNAS))
+        logging.info(f"[OK] {ticker} → {salvos[-1]}")
+    return salvos
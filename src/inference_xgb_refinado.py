@@ -1,9 +1,13 @@
 import os
+import time
+import numpy as np
 import pandas as pd
 import argparse
-import xgboost as xgb
 import pickle
 from datetime import datetime
+import storage
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, cronometrado
+from label_completo import colunas_nao_features
 
 # Caminhos diretos
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -12,6 +16,8 @@ PROCESSED_PATH = os.path.join(ROOT_DIR, "data", "processed")
 MODEL_PATH = os.path.join(ROOT_DIR, "data", "models")
 SIGNALS_PATH = os.path.join(ROOT_DIR, "data", "signals")
 HORIZON = 5
+# Linhas finais lidas de cada dataset: a previsão usa apenas a última linha com label
+LINHAS_CAUDA = 64
 
 def detectar_coluna_target(df):
     """Tenta detectar automaticamente a coluna de label usada para previsão."""
@@ -28,39 +34,178 @@ def carregar_modelo(model_path):
             model = model[0]  # Assume (model, score)
     return model
 
-def prever_e_rankear(threshold=0.3):
-    sinais = []
-    arquivos = [f for f in os.listdir(PROCESSED_PATH) if f.endswith("_merged.csv")]
-    print(f"📁 {len(arquivos)} arquivos de dados processados encontrados.")
+class RegistroModelos:
+    """
+    Mantém os boosters carregados em memória, recarregando um modelo apenas quando o
+    mtime do arquivo .pkl muda (ex: após um novo treinamento).
+    """
 
-    for arquivo in arquivos:
-        ticker = arquivo.split("_")[0]
+    def __init__(self, model_dir=MODEL_PATH):
+        self.model_dir = model_dir
+        self._modelos = {}  # ticker -> (mtime, booster, iteration_range)
+
+    def obter(self, ticker):
+        model_file = os.path.join(self.model_dir, f"{ticker}_xgb_model_refinado.pkl")
         try:
-            df = pd.read_csv(os.path.join(PROCESSED_PATH, arquivo))
-            coluna_label = detectar_coluna_target(df)
-            df = df.dropna(subset=[coluna_label]).copy()
-            if df.empty:
-                continue
+            mtime = os.stat(model_file).st_mtime_ns
+        except FileNotFoundError:
+            self._modelos.pop(ticker, None)
+            return None
+
+        item = self._modelos.get(ticker)
+        if item is None or item[0] != mtime:
+            model = carregar_modelo(model_file)
+            booster = model.get_booster() if hasattr(model, "get_booster") else model
+            # Mesmas árvores usadas por predict_proba quando houve early stopping
+            best = getattr(model, "best_iteration", None)
+            item = (mtime, booster, (0, best + 1) if best is not None else (0, 0))
+            self._modelos[ticker] = item
+        return item[1], item[2]
+
+
+class MotorInferencia:
+    """
+    Pontua todos os ativos de uma vez: lê só a cauda de cada dataset (com cache por mtime),
+    monta uma única matriz de features float32 e chama Booster.inplace_predict sobre as linhas
+    dessa matriz, sem DataFrames nem listas Python no caminho da previsão.
+    Com agrupado=True, um único modelo (modelo_agrupado.py) pontua a matriz inteira de uma vez.
+    """
 
-            model_file = os.path.join(MODEL_PATH, f"{ticker}_xgb_model_refinado.pkl")
-            if not os.path.exists(model_file):
+    def __init__(self, processed_dir=PROCESSED_PATH, model_dir=MODEL_PATH, agrupado=False):
+        self.processed_dir = processed_dir
+        self.model_dir = model_dir
+        self.agrupado = agrupado
+        self._modelo_agrupado = None  # (mtime, booster, metadados)
+        self.registro = RegistroModelos(model_dir)
+        self._linhas = {}  # arquivo -> (mtime, colunas, linha)
+        self._indices = {}  # (colunas, feature_names) -> posições das features do modelo
+
+    def _ultima_linha(self, arquivo):
+        """
+        Última linha com label do dataset, como vetor float32 (None se não houver).
+        """
+        path = storage.localizar(self.processed_dir, arquivo)
+        mtime = os.stat(path).st_mtime_ns
+        item = self._linhas.get(arquivo)
+        if item is not None and item[0] == mtime:
+            return item[1], item[2]
+
+        df = storage.ler(self.processed_dir, arquivo, tail=LINHAS_CAUDA)
+        coluna_label = detectar_coluna_target(df)
+        df = df.dropna(subset=[coluna_label])
+        if df.empty:
+            # Cauda sem labels (ex: estratégia contínua): recorre ao histórico completo
+            df = storage.ler(self.processed_dir, arquivo).dropna(subset=[coluna_label])
+        if df.empty:
+            self._linhas[arquivo] = (mtime, None, None)
+            return None, None
+
+        X = df.drop(columns=colunas_nao_features(df.columns))
+        item = (mtime, tuple(X.columns), X.iloc[-1].to_numpy(dtype=np.float32))
+        self._linhas[arquivo] = item
+        return item[1], item[2]
+
+    def montar_matriz(self):
+        """
+        Retorna (tickers, colunas, X) com uma linha por ativo que possui modelo treinado.
+        """
+        tickers, colunas, linhas = [], None, []
+        for arquivo in storage.listar(self.processed_dir, "_merged"):
+            ticker = arquivo.split("_")[0]
+            try:
+                cols, linha = self._ultima_linha(arquivo)
+            except Exception as e:
+                print(f"❌ Erro ao processar {ticker}: {e}")
+                continue
+            if linha is None:
                 continue
+            if colunas is None:
+                colunas = cols
+            elif cols != colunas:
+                print(f"❌ Erro ao processar {ticker}: colunas de features diferentes dos demais ativos")
+                continue
+            tickers.append(ticker)
+            linhas.append(linha)
 
-            model = carregar_modelo(model_file)
-            X = df.drop(columns=["date", coluna_label], errors="ignore").iloc[-1]
-            proba = model.predict_proba([X])[0][1]
+        X = np.vstack(linhas) if linhas else np.empty((0, 0), dtype=np.float32)
+        return tickers, colunas, X
+
+    def _posicoes(self, colunas, feature_names):
+        chave = (colunas, tuple(feature_names) if feature_names else None)
+        if chave not in self._indices:
+            if feature_names is None or list(feature_names) == list(colunas):
+                self._indices[chave] = None
+            else:
+                self._indices[chave] = np.array([colunas.index(f) for f in feature_names])
+        return self._indices[chave]
+
+    def _pontuar_agrupado(self, tickers, colunas, X):
+        # Importado só no modo agrupado: traz o scikit-learn, desnecessário para os modelos por ativo
+        from modelo_agrupado import carregar_agrupado, preparar_features, MODELO_AGRUPADO
+
+        path = os.path.join(self.model_dir, MODELO_AGRUPADO)
+        if not os.path.exists(path):
+            print("❌ Modelo agrupado não encontrado. Execute modelo_agrupado.py.")
+            return np.full(len(tickers), np.nan)
+        mtime = os.stat(path).st_mtime_ns
+        if self._modelo_agrupado is None or self._modelo_agrupado[0] != mtime:
+            self._modelo_agrupado = (mtime, *carregar_agrupado(self.model_dir))
+        _, booster, metadados = self._modelo_agrupado
+
+        df = preparar_features(pd.DataFrame(X, columns=list(colunas)), tickers, metadados["categorias"])
+        return booster.inplace_predict(df[booster.feature_names])
 
-            if proba >= threshold:
-                sinais.append({"ticker": ticker, "score": proba})
+    def pontuar(self):
+        """
+        Probabilidade da classe positiva para cada ativo (pd.Series indexada pelo ticker).
+        """
+        tickers, colunas, X = self.montar_matriz()
+        if self.agrupado:
+            scores = self._pontuar_agrupado(tickers, colunas, X) if tickers else np.empty(0)
+            return pd.Series(scores, index=tickers, name="score").dropna()
+        scores = np.full(len(tickers), np.nan)
+        for i, ticker in enumerate(tickers):
+            try:
+                modelo = self.registro.obter(ticker)
+                if modelo is None:
+                    continue
+                booster, iteration_range = modelo
+                posicoes = self._posicoes(colunas, booster.feature_names)
+                linha = X[i:i + 1] if posicoes is None else X[i:i + 1, posicoes]
+                proba = booster.inplace_predict(linha, iteration_range=iteration_range)
+                scores[i] = proba[0, 1] if proba.ndim == 2 else proba[0]
+            except Exception as e:
+                print(f"❌ Erro ao processar {ticker}: {e}")
+        return pd.Series(scores, index=tickers, name="score").dropna()
 
-        except Exception as e:
-            print(f"❌ Erro ao processar {ticker}: {e}")
+
+# Motor compartilhado entre chamadas no mesmo processo (modelos e caudas ficam em cache)
+_motor = None
+
+def obter_motor(agrupado=False):
+    global _motor
+    if _motor is None or _motor.agrupado != agrupado:
+        _motor = MotorInferencia(agrupado=agrupado)
+    return _motor
+
+@cronometrado("inference")
+def prever_e_rankear(threshold=0.3, agrupado=False, motor=None, signals_dir=SIGNALS_PATH):
+    """
+    Rankeia os tickers pela probabilidade prevista. 'motor' permite usar outro MotorInferencia
+    (ex: diretórios de um benchmark) no lugar do compartilhado do processo.
+    """
+    motor = motor or obter_motor(agrupado)
+    print(f"📁 {len(storage.listar(motor.processed_dir, '_merged'))} arquivos de dados processados encontrados.")
+
+    scores = motor.pontuar()
+    scores = scores[scores >= threshold]
+    sinais = [{"ticker": ticker, "score": score} for ticker, score in scores.items()]
 
     if sinais:
         df_sinais = pd.DataFrame(sinais)
         df_sinais = df_sinais.sort_values("score", ascending=False)
-        os.makedirs(SIGNALS_PATH, exist_ok=True)
-        output_file = os.path.join(SIGNALS_PATH, f"signals_ranked_{datetime.now().date()}.csv")
+        os.makedirs(signals_dir, exist_ok=True)
+        output_file = os.path.join(signals_dir, f"signals_ranked_{datetime.now().date()}.csv")
         df_sinais.to_csv(output_file, index=False)
         print(f"✅ Sinais salvos em: {output_file}")
         return df_sinais
@@ -71,7 +216,19 @@ def prever_e_rankear(threshold=0.3):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--threshold", type=float, default=0.3, help="Probabilidade mínima para gerar sinal")
+    parser.add_argument("--agrupado", action="store_true", help="Usa o modelo único treinado com todos os ativos (modelo_agrupado.py)")
+    parser.add_argument("--benchmark", type=int, default=0, help="Repete o ranking N vezes com os modelos em cache e mede o tempo")
+    adicionar_argumentos_metricas(parser)
     args = parser.parse_args()
+    configurar_metricas(args)
 
     print(f"🔍 Lendo modelo salvo de: {MODEL_PATH}")
-    prever_e_rankear(threshold=args.threshold)
+    prever_e_rankear(threshold=args.threshold, agrupado=args.agrupado)
+
+    if args.benchmark:
+        # Rankings seguintes reaproveitam modelos e features já carregados
+        motor = obter_motor(args.agrupado)
+        inicio = time.perf_counter()
+        for _ in range(args.benchmark):
+            motor.pontuar()
+        print(f"⏱️  Ranking com cache: {1000 * (time.perf_counter() - inicio) / args.benchmark:.2f} ms por execução")
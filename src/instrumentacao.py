@@ -0,0 +1,297 @@
+"""
+Métricas de execução compartilhadas pelos scripts: tempo por etapa e ticker, memória (RSS) e
+contadores (linhas e bytes lidos, ajustes de modelo, chamadas de API e sua latência).
+
+Os valores são agregados por (etapa, ticker, métrica) no processo atual. Tarefas executadas em
+outros processos (execucao.executar_por_ticker) devolvem as próprias métricas, que são mescladas
+no processo principal. Com --metricas, uma tabela-resumo é impressa ao final do script;
+--metricas_saida grava as métricas em formato Prometheus (.prom) ou JSON lines (.jsonl).
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# Etapa e ticker em andamento: contadores registrados sem etapa/ticker explícitos vão para eles
+_contexto: ContextVar[tuple[Optional[str], Optional[str]]] = ContextVar("instrumentacao_contexto", default=(None, None))
+
+# Métricas cujo agregado é o máximo (as demais são somadas)
+METRICAS_MAXIMO = {"rss_crescimento_mb", "pico_rss_acrescimo_mb", "pico_rss_processo_mb"}
+
+# Amostras guardadas por (etapa, ticker, métrica) registrada com amostrar(), para percentis
+AMOSTRAS_MAXIMAS = 10000
+
+
+def pico_rss_mb() -> Optional[float]:
+    """
+    Maior RSS do processo até agora, em MB (None onde o módulo resource não existe, ex: Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return pico / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def rss_atual_mb() -> Optional[float]:
+    """
+    RSS atual do processo, em MB (None fora do Linux, onde /proc/self/statm não existe).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return paginas * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class Registro:
+    """
+    Agregados (soma, contagem, máximo) por (etapa, ticker, métrica), seguros entre threads.
+    Métricas registradas com amostrar() também guardam as últimas AMOSTRAS_MAXIMAS amostras.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores: dict[tuple, list] = {}
+        self._amostras: dict[tuple, deque] = {}
+
+    def adicionar(self, metrica: str, valor: float, etapa: Optional[str] = None, ticker: Optional[str] = None,
+                  amostrar: bool = False) -> None:
+        atual_etapa, atual_ticker = _contexto.get()
+        chave = (etapa or atual_etapa or "-", ticker or atual_ticker or "-", metrica)
+        with self._lock:
+            item = self._valores.get(chave)
+            if item is None:
+                self._valores[chave] = [valor, 1, valor]
+            else:
+                item[0] += valor
+                item[1] += 1
+                item[2] = max(item[2], valor)
+            if amostrar:
+                self._amostras.setdefault(chave, deque(maxlen=AMOSTRAS_MAXIMAS)).append(valor)
+
+    def percentis(self, etapa: str, percentis: tuple = (50, 99)) -> dict[str, dict]:
+        """
+        Por métrica amostrada da etapa (todos os tickers): contagem total e percentis das amostras.
+        """
+        import numpy as np
+
+        with self._lock:
+            amostras, contagens = {}, {}
+            for chave, valores in self._amostras.items():
+                if chave[0] == etapa:
+                    metrica = chave[2]
+                    amostras.setdefault(metrica, []).extend(valores)
+                    contagens[metrica] = contagens.get(metrica, 0) + self._valores[chave][1]
+        return {
+            metrica: {"contagem": contagens[metrica],
+                      **{f"p{p}": float(np.percentile(valores, p)) for p in percentis}}
+            for metrica, valores in amostras.items()
+        }
+
+    def dados(self) -> list[tuple]:
+        with self._lock:
+            return [(*chave, *item) for chave, item in self._valores.items()]
+
+    def mesclar(self, dados: list[tuple]) -> None:
+        with self._lock:
+            for etapa, ticker, metrica, soma, contagem, maximo in dados:
+                item = self._valores.get((etapa, ticker, metrica))
+                if item is None:
+                    self._valores[(etapa, ticker, metrica)] = [soma, contagem, maximo]
+                else:
+                    item[0] += soma
+                    item[1] += contagem
+                    item[2] = max(item[2], maximo)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._valores.clear()
+            self._amostras.clear()
+
+
+REGISTRO = Registro()
+
+
+def contar(metrica: str, valor: float = 1, etapa: Optional[str] = None, ticker: Optional[str] = None) -> None:
+    REGISTRO.adicionar(metrica, valor, etapa, ticker)
+
+
+def amostrar(metrica: str, valor: float, etapa: Optional[str] = None, ticker: Optional[str] = None) -> None:
+    """
+    Como contar, guardando também a amostra para percentis (ex: latência por requisição).
+    """
+    REGISTRO.adicionar(metrica, valor, etapa, ticker, amostrar=True)
+
+
+@contextmanager
+def medir(etapa: str, ticker: Optional[str] = None):
+    """
+    Mede o tempo de parede do bloco e a memória usada por ele:
+    - rss_crescimento_mb: RSS ao final menos RSS no início (memória retida pelo bloco);
+    - pico_rss_acrescimo_mb: quanto o bloco elevou o pico de RSS do processo (0 se ficou abaixo
+      de um pico anterior);
+    - pico_rss_processo_mb: pico de RSS do processo até o fim do bloco, incluindo etapas anteriores.
+    Dentro do bloco, contadores sem etapa/ticker explícitos são atribuídos a esta etapa (e ao
+    ticker, se informado).
+    """
+    ticker = ticker or _contexto.get()[1]
+    token = _contexto.set((etapa, ticker))
+    rss_inicio, pico_inicio = rss_atual_mb(), pico_rss_mb()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRO.adicionar("segundos", time.perf_counter() - inicio, etapa, ticker)
+        rss_fim, pico_fim = rss_atual_mb(), pico_rss_mb()
+        if rss_inicio is not None and rss_fim is not None:
+            REGISTRO.adicionar("rss_crescimento_mb", rss_fim - rss_inicio, etapa, ticker)
+        if pico_fim is not None:
+            REGISTRO.adicionar("pico_rss_acrescimo_mb", pico_fim - pico_inicio, etapa, ticker)
+            REGISTRO.adicionar("pico_rss_processo_mb", pico_fim, etapa, ticker)
+        _contexto.reset(token)
+
+
+def cronometrado(etapa: str) -> Callable:
+    """
+    Decorador equivalente a 'with medir(etapa)' em volta da função.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def envolvida(*args, **kwargs):
+            with medir(etapa):
+                return func(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+@contextmanager
+def chamada_api(nome: str, ticker: Optional[str] = None):
+    """
+    Conta uma chamada de API e acumula sua latência em segundos.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        contar(f"chamadas_{nome}", 1, ticker=ticker)
+        contar(f"latencia_{nome}_s", time.perf_counter() - inicio, ticker=ticker)
+
+
+def rotulo_ticker(tarefa) -> Optional[str]:
+    """
+    Ticker de uma tarefa: a própria string ou o primeiro item de uma tupla (ex: (ticker, janela)).
+    """
+    if isinstance(tarefa, str):
+        return tarefa
+    if isinstance(tarefa, tuple) and tarefa and isinstance(tarefa[0], str):
+        return tarefa[0]
+    return None
+
+
+def executar_medido(func: Callable, etapa: str, tarefa):
+    """
+    Executa func(tarefa) em um worker e devolve (resultado, métricas da tarefa).
+    O registro do worker é zerado antes, pois o mesmo processo atende várias tarefas.
+    """
+    REGISTRO.limpar()
+    with medir(etapa, rotulo_ticker(tarefa)):
+        resultado = func(tarefa)
+    return resultado, REGISTRO.dados()
+
+
+# ---------------------------------------------------------------------------
+# Resumo e exportação
+# ---------------------------------------------------------------------------
+
+def tabela_resumo():
+    """
+    DataFrame com uma linha por (etapa, ticker) e uma coluna por métrica (soma ou máximo).
+    """
+    import pandas as pd
+
+    dados = REGISTRO.dados()
+    if not dados:
+        return pd.DataFrame()
+    df = pd.DataFrame(dados, columns=["etapa", "ticker", "metrica", "soma", "contagem", "maximo"])
+    df["valor"] = df["maximo"].where(df["metrica"].isin(METRICAS_MAXIMO), df["soma"])
+    tabela = df.pivot_table(index=["etapa", "ticker"], columns="metrica", values="valor", aggfunc="sum")
+    tabela.columns.name = None
+    if "segundos" in tabela.columns:
+        tabela = tabela.sort_values("segundos", ascending=False)
+    return tabela
+
+
+def imprimir_resumo(linhas: int = 30) -> None:
+    tabela = tabela_resumo()
+    if tabela.empty:
+        return
+    print(f"\n📊 Métricas de execução (top {min(linhas, len(tabela))} por tempo):")
+    print(tabela.head(linhas).round(3).to_string())
+    if "segundos" in tabela.columns:
+        por_etapa = tabela.groupby(level="etapa")["segundos"].sum().sort_values(ascending=False)
+        print("\n⏱️  Tempo por etapa (s): " + ", ".join(f"{e}: {s:.2f}" for e, s in por_etapa.items()))
+
+
+def _rotulo(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def exportar_prometheus(path: str) -> None:
+    """
+    Formato de exposição de texto do Prometheus: somas como counters (_total) e máximos como gauges.
+    """
+    # As amostras de uma métrica precisam ficar juntas, logo abaixo da linha TYPE
+    linhas, tipos = [], set()
+    for metrica, etapa, ticker, soma, contagem, maximo in sorted((m, e, t, s, c, x) for e, t, m, s, c, x in REGISTRO.dados()):
+        maximo_apenas = metrica in METRICAS_MAXIMO
+        nome = f"cripto_{metrica}" if maximo_apenas else f"cripto_{metrica}_total"
+        if nome not in tipos:
+            tipos.add(nome)
+            linhas.append(f"# TYPE {nome} {'gauge' if maximo_apenas else 'counter'}")
+        rotulos = f'etapa="{_rotulo(etapa)}",ticker="{_rotulo(ticker)}"'
+        linhas.append(f"{nome}{{{rotulos}}} {maximo if maximo_apenas else soma}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(linhas) + "\n")
+
+
+def exportar_jsonl(path: str) -> None:
+    agora = time.time()
+    with open(path, "a", encoding="utf-8") as f:
+        for etapa, ticker, metrica, soma, contagem, maximo in REGISTRO.dados():
+            f.write(json.dumps({"ts": agora, "etapa": etapa, "ticker": ticker, "metrica": metrica,
+                                "soma": soma, "contagem": contagem, "maximo": maximo}) + "\n")
+
+
+def adicionar_argumentos_metricas(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--metricas", action="store_true", help="Imprime o resumo de tempo, memória e contadores ao final")
+    parser.add_argument("--metricas_saida", type=str, default=None, help="Grava as métricas em .prom (Prometheus) ou .jsonl")
+
+
+def configurar_metricas(args: argparse.Namespace) -> None:
+    """
+    Registra a impressão/exportação das métricas na saída do script, conforme os argumentos.
+    """
+    saida = getattr(args, "metricas_saida", None)
+
+    def finalizar():
+        if getattr(args, "metricas", False):
+            imprimir_resumo()
+        if saida:
+            os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+            (exportar_jsonl if saida.endswith(".jsonl") else exportar_prometheus)(saida)
+            print(f"[✅ SALVO] Métricas em: {saida}")
+
+    atexit.register(finalizar)
@@ -4,6 +4,9 @@ import numpy as np
 import logging
 import argparse
 from typing import Literal
+import storage
+from execucao import adicionar_argumento_workers, executar_por_ticker, registrar_erros
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -15,8 +18,7 @@ def create_labels(df: pd.DataFrame, horizon: int, strategy: Literal['binary', 't
     - triple: 1 se retorno > th, -1 se < -th, 0 caso contrário
     - continuous: retorna o valor contínuo do retorno futuro
     """
-    df = df.copy()
-    df = df.sort_index()  # Garante ordenação temporal
+    df = df.sort_index()  # Garante ordenação temporal (retorna um novo DataFrame, sem alterar o original)
     #future_return = df['close'].pct_change(periods=horizon).shift(-horizon)
     future_return = df['close'].pct_change(periods=horizon, fill_method=None).shift(-horizon)
 
@@ -46,45 +48,109 @@ def calculate_dynamic_threshold(df: pd.DataFrame, horizon: int, multiplier: floa
     std_daily = daily_return.std()
     return std_daily * np.sqrt(horizon) * multiplier
 
-def gerar_labels_para_arquivo(path: str, output_dir: str, horizons: list[int], strategy: str, threshold: float, use_dynamic: bool = False):
+def create_labels_multi(close: np.ndarray, horizons: list[int], strategy: Literal['binary', 'triple', 'continuous'], thresholds: dict[int, float]) -> dict[str, np.ndarray]:
     """
-    Lê um arquivo de features e gera labels salvos em CSV.
+    Calcula retorno futuro e label de todos os horizontes em uma única passada sobre o array de
+    fechamentos (já em ordem temporal). Equivalente a chamar create_labels para cada horizonte.
+    Retorna colunas 'future_return_{h}d' e 'label_{h}d'.
     """
-    try:
-        df = pd.read_csv(path, parse_dates=["date"])
-        df.set_index("date", inplace=True)
-        ticker = os.path.basename(path).replace("_feat.csv", "")
+    close = np.asarray(close, dtype=float)
+    colunas = {}
+    for h in horizons:
+        future_return = np.full(len(close), np.nan)
+        if h < len(close):
+            future_return[:-h] = close[h:] / close[:-h] - 1
+        th = thresholds[h]
 
-        for h in horizons:
-            th = calculate_dynamic_threshold(df, h) if use_dynamic else threshold
-            labels_df = create_labels(df, horizon=h, strategy=strategy, threshold=th)
-            output_path = os.path.join(output_dir, f"{ticker}_label_{h}d.csv")
-            labels_df.to_csv(output_path)
-            logging.info(f"[OK] Labels {h}d salvos para {ticker} (threshold={th:.4f})")
-    except Exception as e:
-        logging.error(f"[ERRO] {path}: {e}")
+        if strategy == 'binary':
+            label = (future_return > th).astype(int)
+        elif strategy == 'triple':
+            label = np.select([future_return > th, future_return < -th], [1, -1], default=0)
+        elif strategy == 'continuous':
+            label = future_return
+        else:
+            raise ValueError(f"Estratégia inválida: {strategy}")
+
+        colunas[f'future_return_{h}d'] = future_return
+        colunas[f'label_{h}d'] = label
+    return colunas
+
+def colunas_nao_features(columns) -> list[str]:
+    """
+    Colunas que não podem entrar no modelo: data, target e qualquer label/retorno futuro.
+    """
+    return [c for c in columns if c in ("date", "target") or c.startswith("label_") or c.startswith("future_return")]
+
+def coluna_retorno_futuro(coluna_label: str) -> str:
+    """
+    Coluna de retorno futuro que acompanha o label: 'future_return' para 'target' (merge de um
+    horizonte) e future_return_{h}d para label_{h}d (dataset combinado).
+    """
+    return "future_return" if coluna_label == "target" else coluna_label.replace("label_", "future_return_", 1)
+
+def sem_retorno_futuro(df: pd.DataFrame, coluna_label: str) -> np.ndarray:
+    """
+    Linhas cujo label não é conhecido: sem retorno futuro no horizonte do próprio label. Os labels
+    binário e triplo gravam 0 nessas linhas, então o label em si não é NaN.
+    """
+    coluna = coluna_retorno_futuro(coluna_label)
+    if coluna not in df.columns:
+        raise KeyError(f"Coluna '{coluna}' não encontrada: refaça o merge de features e labels")
+    return df[coluna].isna().to_numpy()
+
+def separar_features_target(df: pd.DataFrame, horizon: int) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Separa X e y de um dataset processado. Usa 'target' (merge de um horizonte) quando existir,
+    senão a coluna label_{horizon}d do dataset com todos os horizontes.
+    """
+    coluna = "target" if "target" in df.columns else f"label_{horizon}d"
+    if coluna not in df.columns:
+        raise KeyError(f"Coluna de label não encontrada: esperado 'target' ou 'label_{horizon}d'")
+    return df.drop(columns=colunas_nao_features(df.columns)), df[coluna]
+
+def gerar_labels_para_arquivo(ticker: str, input_dir: str, output_dir: str, horizons: list[int], strategy: str, threshold: float, use_dynamic: bool = False):
+    """
+    Lê as features de um ticker e gera labels salvos no formato de armazenamento do pipeline.
+    Retorna os caminhos gravados; erros são propagados para que executar_por_ticker os registre.
+    """
+    # Os labels dependem apenas do preço de fechamento
+    df = storage.ler(input_dir, f"{ticker}_feat", columns=["close"])
+
+    salvos = []
+    for h in horizons:
+        th = calculate_dynamic_threshold(df, h) if use_dynamic else threshold
+        labels_df = create_labels(df, horizon=h, strategy=strategy, threshold=th)
+        salvos.append(storage.salvar(labels_df, output_dir, f"{ticker}_label_{h}d"))
+        logging.info(f"[OK] Labels {h}d salvos para {ticker} (threshold={th:.4f})")
+    return salvos
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Gerador de labels para ML financeiro")
-    parser.add_argument("--input_dir", type=str, default="data/features", help="Diretório de entrada com arquivos _feat.csv")
+    parser.add_argument("--input_dir", type=str, default="data/features", help="Diretório de entrada com as tabelas _feat")
     parser.add_argument("--output_dir", type=str, default="data/labels", help="Diretório de saída")
     parser.add_argument("--horizons", type=int, nargs="+", default=[3, 5, 10], help="Horizontes em dias")
     parser.add_argument("--strategy", type=str, choices=["binary", "triple", "continuous"], default="binary", help="Tipo de label")
     parser.add_argument("--threshold", type=float, default=0.02, help="Threshold fixo (%)")
     parser.add_argument("--dynamic", action="store_true", help="Usar threshold dinâmico baseado na volatilidade")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
 
     args = parser.parse_args()
+    configurar_metricas(args)
 
     os.makedirs(args.output_dir, exist_ok=True)
 
-    arquivos = [f for f in os.listdir(args.input_dir) if f.endswith("_feat.csv")]
-    for arquivo in arquivos:
-        path = os.path.join(args.input_dir, arquivo)
-        gerar_labels_para_arquivo(
-            path=path,
-            output_dir=args.output_dir,
-            horizons=args.horizons,
-            strategy=args.strategy,
-            threshold=args.threshold,
-            use_dynamic=args.dynamic
-        )
+    tickers = [nome.replace("_feat", "") for nome in storage.listar(args.input_dir, "_feat")]
+    _, erros = executar_por_ticker(
+        gerar_labels_para_arquivo,
+        tickers,
+        workers=args.workers,
+        etapa="labels",
+        input_dir=args.input_dir,
+        output_dir=args.output_dir,
+        horizons=args.horizons,
+        strategy=args.strategy,
+        threshold=args.threshold,
+        use_dynamic=args.dynamic
+    )
+    registrar_erros(erros, "labels")
@@ -0,0 +1,185 @@
+"""
+Feature store de treino: para cada ticker e horizonte, a matriz de features float32 contígua,
+o vetor de labels, as datas e o esquema de colunas, gravados em .npy e abertos com memory map.
+A matriz completa vira uma QuantileDMatrix uma única vez (treino final); os folds da validação
+cruzada são faixas de linhas (visões, sem cópia) quantizadas uma vez e reaproveitadas por todos
+os candidatos da busca.
+"""
+
+import os
+import json
+import logging
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+import storage
+from label_completo import colunas_nao_features, sem_retorno_futuro
+from memoria_externa import faixas_time_series
+
+PROCESSED_DIR = "data/processed"
+MATRIZ_DIR = "data/matrizes"
+META = "meta.json"
+# Incrementada quando o conteúdo gravado muda; matrizes de versões anteriores são reconstruídas
+VERSAO = 3
+
+
+class MatrizFeatures:
+    """
+    Dataset de treino de um ticker: X (linhas × features, float32 C-contíguo), y (float32,
+    NaN sem label), datas (int64, segundos desde a época) e nomes das colunas.
+    """
+
+    def __init__(self, X: np.ndarray, y: np.ndarray, datas: np.ndarray, colunas: list[str], coluna_label: str):
+        self.X = X
+        self.y = y
+        self.datas = datas
+        self.colunas = colunas
+        self.coluna_label = coluna_label
+        self._completa: Optional[xgb.QuantileDMatrix] = None
+        self._folds: dict[int, list] = {}
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    @property
+    def indice(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(pd.to_datetime(self.datas, unit="s"), name=storage.INDEX_COL)
+
+    def quadro(self) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        (X, y) como no separar_features_target, sobre os mesmos arrays (sem cópia).
+        """
+        indice = self.indice
+        X = pd.DataFrame(self.X, index=indice, columns=self.colunas, copy=False)
+        return X, pd.Series(self.y, index=indice, name=self.coluna_label)
+
+    def fatia(self, inicio: int = 0, fim: Optional[int] = None) -> "MatrizFeatures":
+        """
+        Linhas [inicio, fim) como visões dos mesmos arrays.
+        """
+        return MatrizFeatures(self.X[inicio:fim], self.y[inicio:fim], self.datas[inicio:fim],
+                              self.colunas, self.coluna_label)
+
+    def rotulados(self) -> "MatrizFeatures":
+        """
+        Apenas as linhas com label (a própria matriz, se todas têm).
+        """
+        com_label = ~np.isnan(self.y)
+        if com_label.all():
+            return self
+        return MatrizFeatures(np.ascontiguousarray(self.X[com_label]), self.y[com_label], self.datas[com_label],
+                              self.colunas, self.coluna_label)
+
+    def dmatrix(self, inicio: int = 0, fim: Optional[int] = None,
+                ref: Optional[xgb.QuantileDMatrix] = None) -> xgb.QuantileDMatrix:
+        """
+        QuantileDMatrix das linhas [inicio, fim). Com 'ref', reaproveita os cortes de quantis
+        de outra matriz em vez de calculá-los de novo.
+        """
+        return xgb.QuantileDMatrix(self.X[inicio:fim], label=self.y[inicio:fim], ref=ref,
+                                   feature_names=self.colunas)
+
+    def completa(self) -> xgb.QuantileDMatrix:
+        """
+        Todas as linhas, quantizadas uma única vez (treino final).
+        """
+        if self._completa is None:
+            self._completa = self.dmatrix()
+        return self._completa
+
+    def folds(self, n_splits: int = 5) -> list:
+        """
+        Folds do TimeSeriesSplit [(dtrain, dval, y_val), ...], montados uma vez por n_splits.
+        Os cortes de quantis de cada fold vêm só das suas linhas de treino, como no GridSearchCV,
+        em que a validação não influencia o ajuste.
+        """
+        if n_splits not in self._folds:
+            folds = []
+            for (t_ini, t_fim), (v_ini, v_fim) in faixas_time_series(len(self), n_splits):
+                dtrain = self.dmatrix(t_ini, t_fim)
+                folds.append((dtrain, self.dmatrix(v_ini, v_fim, ref=dtrain), self.y[v_ini:v_fim]))
+            self._folds[n_splits] = folds
+        return self._folds[n_splits]
+
+
+def _pasta(destino: str, ticker: str, horizon: int) -> str:
+    return os.path.join(destino, f"{ticker}_h{horizon}")
+
+
+def _assinatura(path: str) -> list[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def construir_matriz(ticker: str, processed_dir: str = PROCESSED_DIR, destino: str = MATRIZ_DIR,
+                     horizon: int = 5) -> MatrizFeatures:
+    """
+    Lê o dataset processado uma vez e grava X, y, datas e o esquema de colunas.
+    Linhas sem retorno futuro ficam com y = NaN (fora do treino e do retreino incremental).
+    """
+    origem = storage.localizar(processed_dir, f"{ticker}_merged")
+    if origem is None:
+        raise FileNotFoundError(f"Dataset processado não encontrado: {ticker}_merged")
+    df = storage.ler_arquivo(origem)
+    coluna_label = "target" if "target" in df.columns else f"label_{horizon}d"
+    if coluna_label not in df.columns:
+        raise KeyError(f"Coluna de label não encontrada: esperado 'target' ou 'label_{horizon}d'")
+    colunas = [c for c in df.columns if c not in colunas_nao_features(df.columns)]
+
+    pasta = _pasta(destino, ticker, horizon)
+    os.makedirs(pasta, exist_ok=True)
+    # Sem meta.json a matriz é tratada como inexistente até a gravação terminar
+    if os.path.exists(os.path.join(pasta, META)):
+        os.remove(os.path.join(pasta, META))
+    np.save(os.path.join(pasta, "X.npy"), np.ascontiguousarray(df[colunas].to_numpy(dtype=np.float32)))
+    y = df[coluna_label].to_numpy(dtype=np.float32)
+    y[sem_retorno_futuro(df, coluna_label)] = np.nan
+    np.save(os.path.join(pasta, "y.npy"), y)
+    np.save(os.path.join(pasta, "datas.npy"), df.index.to_numpy(dtype="datetime64[s]").astype(np.int64))
+    with open(os.path.join(pasta, META), "w", encoding="utf-8") as f:
+        json.dump({"versao": VERSAO, "colunas": colunas, "coluna_label": coluna_label, "horizon": horizon,
+                   "origem": origem, "assinatura": _assinatura(origem)}, f)
+    logging.info(f"[OK] Matriz de treino {ticker} h{horizon}: {len(df)} linhas × {len(colunas)} features → {pasta}")
+    return abrir_matriz(pasta)
+
+
+def abrir_matriz(pasta: str) -> MatrizFeatures:
+    with open(os.path.join(pasta, META), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    X, y, datas = (np.load(os.path.join(pasta, nome), mmap_mode="r") for nome in ("X.npy", "y.npy", "datas.npy"))
+    return MatrizFeatures(X, y, datas, meta["colunas"], meta["coluna_label"])
+
+
+def carregar_matriz(ticker: str, processed_dir: str = PROCESSED_DIR, destino: str = MATRIZ_DIR,
+                    horizon: int = 5) -> MatrizFeatures:
+    """
+    Abre a matriz salva se o dataset processado não mudou desde a gravação; senão, reconstrói.
+    """
+    pasta = _pasta(destino, ticker, horizon)
+    origem = storage.localizar(processed_dir, f"{ticker}_merged")
+    try:
+        with open(os.path.join(pasta, META), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (origem is not None and meta.get("versao") == VERSAO and meta["origem"] == origem
+                and meta["assinatura"] == _assinatura(origem)):
+            return abrir_matriz(pasta)
+    except (OSError, ValueError, KeyError):
+        pass
+    return construir_matriz(ticker, processed_dir, destino, horizon)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Monta as matrizes float32 de treino (feature store)")
+    parser.add_argument("--processed_dir", type=str, default=PROCESSED_DIR, help="Diretório dos datasets _merged")
+    parser.add_argument("--destino", type=str, default=MATRIZ_DIR, help="Diretório das matrizes")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte do label (datasets com todos os horizontes)")
+    args = parser.parse_args()
+
+    for nome in storage.listar(args.processed_dir, "_merged"):
+        construir_matriz(nome.replace("_merged", ""), args.processed_dir, args.destino, args.horizon)
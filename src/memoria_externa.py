@@ -0,0 +1,145 @@
+import os
+import shutil
+from typing import List, Optional, Tuple
+
+import numpy as np
+import xgboost as xgb
+import pyarrow.parquet as pq
+
+import storage
+from label_completo import colunas_nao_features, coluna_retorno_futuro
+
+# Linhas convertidas para float32 por lote; limita a memória usada pelo iterador
+LINHAS_POR_LOTE = 65536
+CACHE_DIR = os.path.join("data", "cache", "xgb")
+
+
+def faixas_time_series(n: int, n_splits: int = 5) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """
+    Mesmas divisões do TimeSeriesSplit, como faixas de linhas [inicio, fim) em vez de índices copiados.
+    """
+    tamanho_val = n // (n_splits + 1)
+    faixas = []
+    for i in range(n_splits):
+        fim_treino = n - (n_splits - i) * tamanho_val
+        faixas.append(((0, fim_treino), (fim_treino, fim_treino + tamanho_val)))
+    return faixas
+
+
+class IteradorParquet(xgb.DataIter):
+    """
+    Entrega ao XGBoost as linhas [inicio, fim) de uma tabela Parquet em lotes float32, lendo
+    apenas os row groups que cobrem a faixa. Linhas sem label são descartadas em cada lote.
+    """
+
+    def __init__(self, path: str, colunas: List[str], coluna_label: str, inicio: int, fim: int,
+                 cache_prefix: str):
+        self.arquivo = pq.ParquetFile(path)
+        self.colunas = colunas
+        self.coluna_label = coluna_label
+        self._lotes = self._planejar(inicio, fim)
+        self._i = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def _planejar(self, inicio: int, fim: int) -> list:
+        """
+        Agrupa row groups consecutivos em lotes de até LINHAS_POR_LOTE linhas.
+        Cada lote é (row groups, fatia inicial, fatia final) relativos ao início do lote.
+        """
+        lotes, grupos, base, linhas_lote = [], [], 0, 0
+        pos = 0
+        for g in range(self.arquivo.num_row_groups):
+            n = self.arquivo.metadata.row_group(g).num_rows
+            g_ini, g_fim = pos, pos + n
+            pos = g_fim
+            if g_fim <= inicio or g_ini >= fim:
+                continue
+            if not grupos:
+                base = g_ini
+            grupos.append(g)
+            linhas_lote += n
+            if linhas_lote >= LINHAS_POR_LOTE:
+                lotes.append((grupos, max(inicio - base, 0), min(fim, g_fim) - base))
+                grupos, linhas_lote = [], 0
+        if grupos:
+            lotes.append((grupos, max(inicio - base, 0), min(fim, pos) - base))
+        return lotes
+
+    def next(self, input_data) -> bool:
+        if self._i == len(self._lotes):
+            return False
+        grupos, a, b = self._lotes[self._i]
+        tabela = self.arquivo.read_row_groups(grupos, columns=self.colunas + [self.coluna_label]).slice(a, b - a)
+
+        X = np.empty((tabela.num_rows, len(self.colunas)), dtype=np.float32)
+        for j, coluna in enumerate(self.colunas):
+            X[:, j] = tabela.column(coluna).to_numpy(zero_copy_only=False)
+        y = tabela.column(self.coluna_label).to_numpy(zero_copy_only=False).astype(np.float32)
+        rotulados = ~np.isnan(y)
+
+        input_data(data=X[rotulados], label=y[rotulados], feature_names=self.colunas)
+        self._i += 1
+        return True
+
+    def reset(self) -> None:
+        self._i = 0
+
+
+class TabelaExterna:
+    """
+    Dataset processado de um ticker lido direto do Parquet, sem carregar a tabela em memória.
+    """
+
+    def __init__(self, processed_dir: str, nome: str, horizon: int, cache_dir: str = CACHE_DIR):
+        self.path = storage.localizar(processed_dir, nome)
+        if self.path is None or not self.path.endswith(storage.EXTENSOES["parquet"]):
+            raise ValueError(f"{nome}: o treino em memória externa requer a tabela em Parquet")
+        arquivo = pq.ParquetFile(self.path)
+        nomes = [c for c in arquivo.schema_arrow.names if c != storage.INDEX_COL]
+        self.coluna_label = "target" if "target" in nomes else f"label_{horizon}d"
+        if self.coluna_label not in nomes:
+            raise KeyError(f"Coluna de label não encontrada: esperado 'target' ou 'label_{horizon}d'")
+        self.colunas = [c for c in nomes if c not in colunas_nao_features(nomes)]
+        # As linhas finais sem retorno futuro no horizonte do label (labels binário e triplo
+        # gravam 0 nelas) ficam fora do treino
+        coluna_retorno = coluna_retorno_futuro(self.coluna_label)
+        if coluna_retorno not in nomes:
+            raise KeyError(f"Coluna '{coluna_retorno}' não encontrada: refaça o merge de features e labels")
+        retorno = pq.read_table(self.path, columns=[coluna_retorno]).column(0).to_numpy()
+        conhecidos = np.flatnonzero(~np.isnan(retorno))
+        self.linhas = int(conhecidos[-1]) + 1 if len(conhecidos) else 0
+        self.cache_dir = os.path.join(cache_dir, nome)
+        self._matrizes = 0
+
+    def ler_colunas(self, colunas: List[str]):
+        """
+        Lê apenas algumas colunas (ex: data e label) das linhas de treino, sem carregar as features.
+        """
+        return pq.read_table(self.path, columns=colunas).slice(0, self.linhas).to_pandas()
+
+    def matriz(self, inicio: int = 0, fim: Optional[int] = None,
+               ref: Optional[xgb.DMatrix] = None) -> xgb.DMatrix:
+        """
+        ExtMemQuantileDMatrix das linhas [inicio, fim): as páginas quantizadas ficam em disco
+        e só uma é mantida em memória por vez. 'ref' reaproveita os cortes de quantis do treino.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._matrizes += 1
+        iterador = IteradorParquet(self.path, self.colunas, self.coluna_label, inicio,
+                                   self.linhas if fim is None else fim,
+                                   os.path.join(self.cache_dir, f"m{self._matrizes}"))
+        return xgb.ExtMemQuantileDMatrix(iterador, ref=ref)
+
+    def folds(self, n_splits: int = 5) -> list:
+        """
+        Folds temporais [(dtrain, dval, y_val), ...] definidos por faixas de linhas.
+        """
+        folds = []
+        for (t_ini, t_fim), (v_ini, v_fim) in faixas_time_series(self.linhas, n_splits):
+            dtrain = self.matriz(t_ini, t_fim)
+            dval = self.matriz(v_ini, v_fim, ref=dtrain)
+            folds.append((dtrain, dval, dval.get_label()))
+        return folds
+
+    def limpar_cache(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -1,5 +1,10 @@
 import os
+import argparse
 import pandas as pd
+import storage
+from execucao import adicionar_argumento_workers, executar_por_ticker
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas
+from label_completo import create_labels_multi, calculate_dynamic_threshold
 
 FEATURE_DIR = "data/features"
 LABEL_DIR = "data/labels"
@@ -8,44 +13,85 @@ HORIZON = "5d"  # Pode ser "3d", "10d", etc.
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def merge_features_labels(ticker):
-    feat_path = os.path.join(FEATURE_DIR, f"{ticker}_feat.csv")
-    label_path = os.path.join(LABEL_DIR, f"{ticker}_label_{HORIZON}.csv")
-
-    if not os.path.exists(feat_path):
-        print(f"❌ Features não encontradas: {feat_path}")
-        return
-    if not os.path.exists(label_path):
-        print(f"❌ Labels não encontradas: {label_path}")
-        return
-
-    df_feat = pd.read_csv(feat_path, parse_dates=["date"])
-    df_label = pd.read_csv(label_path, parse_dates=["date"])
-
-    # Detecta automaticamente a coluna de label correta
-    label_cols = [col for col in df_label.columns if col.startswith("label_")]
-    expected_label = f"label_{HORIZON}"
-    if expected_label not in label_cols:
-        print(f"⚠️ Coluna esperada '{expected_label}' não encontrada em {label_path}. Colunas disponíveis: {label_cols}")
-        return
-
-    # Merge e renomeação
-    df_merged = pd.merge(df_feat, df_label[["date", expected_label]], on="date", how="left")
+def merge_features_labels(ticker, horizon=HORIZON, feature_dir=FEATURE_DIR, label_dir=LABEL_DIR,
+                          output_dir=OUTPUT_DIR):
+    """
+    Junta features e labels de um ticker. Arquivos ou coluna de label ausentes geram
+    FileNotFoundError/KeyError, registrados por ticker em executar_por_ticker.
+    """
+    feat_nome = f"{ticker}_feat"
+    label_nome = f"{ticker}_label_{horizon}"
+
+    if not storage.existe(feature_dir, feat_nome):
+        raise FileNotFoundError(f"Features não encontradas: {os.path.join(feature_dir, feat_nome)}")
+    if not storage.existe(label_dir, label_nome):
+        raise FileNotFoundError(f"Labels não encontradas: {os.path.join(label_dir, label_nome)}")
+
+    df_feat = storage.ler(feature_dir, feat_nome)
+
+    # Detecta automaticamente a coluna de label correta. O retorno futuro acompanha o label:
+    # marca as linhas sem label conhecido (os labels binário e triplo gravam 0 nelas)
+    expected_label = f"label_{horizon}"
+    try:
+        df_label = storage.ler(label_dir, label_nome, columns=["future_return", expected_label])
+    except (KeyError, ValueError) as e:
+        raise KeyError(f"Coluna esperada '{expected_label}' não encontrada em {label_nome}: {e}") from e
+
+    # Junção pelo índice de datas e renomeação
+    df_merged = df_feat.join(df_label, how="left")
     df_merged = df_merged.rename(columns={expected_label: "target"})
 
-    output_path = os.path.join(OUTPUT_DIR, f"{ticker}_merged.csv")
-    df_merged.to_csv(output_path, index=False)
+    output_path = storage.salvar(df_merged, output_dir, f"{ticker}_merged")
     print(f"✅ Merge salvo: {output_path}")
+    return output_path
 
-def main():
-    files = [f for f in os.listdir(FEATURE_DIR) if f.endswith("_feat.csv")]
-    tickers = [f.replace("_feat.csv", "") for f in files]
+def gerar_dataset_combinado(ticker, horizons=(3, 5, 10), strategy="binary", threshold=0.02, use_dynamic=False):
+    """
+    Etapa combinada de labels + merge: calcula retorno futuro e label de todos os horizontes
+    em uma passada sobre o fechamento e anexa as colunas à própria tabela de features,
+    sem gravar labels intermediários nem fazer junção por data.
+    O horizonte do treino é escolhido na leitura (coluna label_{h}d).
+    """
+    feat_nome = f"{ticker}_feat"
+    if not storage.existe(FEATURE_DIR, feat_nome):
+        raise FileNotFoundError(f"Features não encontradas: {os.path.join(FEATURE_DIR, feat_nome)}")
+
+    df = storage.ler(FEATURE_DIR, feat_nome).sort_index()
+    thresholds = {h: calculate_dynamic_threshold(df, h) if use_dynamic else threshold for h in horizons}
+    colunas = create_labels_multi(df["close"].to_numpy(), list(horizons), strategy, thresholds)
+    df_merged = df.assign(**colunas)
+
+    output_path = storage.salvar(df_merged, OUTPUT_DIR, f"{ticker}_merged")
+    print(f"✅ Dataset com labels {', '.join(f'{h}d' for h in horizons)} salvo: {output_path}")
+    return output_path
+
+def main(workers=1, combinado=False, **opcoes_labels):
+    tickers = [nome.replace("_feat", "") for nome in storage.listar(FEATURE_DIR, "_feat")]
 
     print(f"🔍 Iniciando merge para {len(tickers)} ativos...")
-    for ticker in tickers:
-        merge_features_labels(ticker)
+    if combinado:
+        _, erros = executar_por_ticker(gerar_dataset_combinado, tickers, workers=workers, etapa="merge", **opcoes_labels)
+    else:
+        _, erros = executar_por_ticker(merge_features_labels, tickers, workers=workers, etapa="merge")
+    for ticker, erro in erros.items():
+        print(f"❌ Erro no merge de {ticker}: {erro}")
 
     print("🏁 Processo finalizado.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Merge de features e labels")
+    parser.add_argument("--combinado", action="store_true", help="Gera labels de todos os horizontes direto na tabela de features (dispensa label_completo.py)")
+    parser.add_argument("--horizons", type=int, nargs="+", default=[3, 5, 10], help="Horizontes em dias (modo combinado)")
+    parser.add_argument("--strategy", type=str, choices=["binary", "triple", "continuous"], default="binary", help="Tipo de label (modo combinado)")
+    parser.add_argument("--threshold", type=float, default=0.02, help="Threshold fixo (modo combinado)")
+    parser.add_argument("--dynamic", action="store_true", help="Threshold dinâmico baseado na volatilidade (modo combinado)")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    if args.combinado:
+        main(workers=args.workers, combinado=True, horizons=args.horizons, strategy=args.strategy,
+             threshold=args.threshold, use_dynamic=args.dynamic)
+    else:
+        main(workers=args.workers)
@@ -0,0 +1,198 @@
+"""
+Servidor local que imita o endpoint /api/v3/klines da Binance para testar o coletor assíncrono
+sem rede: serve o OHLCV salvo (ou um histórico sintético determinístico por símbolo),
+informa o peso usado em X-MBX-USED-WEIGHT-1M, responde 429/418 quando o limite é excedido
+e pode injetar falhas 5xx e latência.
+Também responde ao WebSocket /stream (streams combinados de kline) reproduzindo candles
+gravados, para testar a ingestão contínua (streaming.py).
+"""
+
+import json
+import time
+import random
+import asyncio
+import zlib
+import logging
+import argparse
+from collections import deque
+
+import numpy as np
+from aiohttp import web
+
+import storage
+from fetch_all_ohlcv_salva_todos import intervalo_em_ms, KLINES_LIMIT
+from fetch_async import START_MS, PESO_KLINES
+
+
+class ServidorKlinesMock:
+
+    def __init__(self, dados_dir: str = None, peso_maximo: int = 6000, taxa_falhas: float = 0.0,
+                 latencia_ms: float = 0.0, seed: int = 0, replay_ultimos: int = 10,
+                 replay_intervalo: float = 1.0, replay_arquivo: str = None, retry_after: float = 2):
+        self.dados_dir = dados_dir
+        self.retry_after = retry_after
+        self.replay_ultimos = replay_ultimos
+        self.replay_intervalo = replay_intervalo
+        self.replay_arquivo = replay_arquivo
+        self.peso_maximo = peso_maximo
+        self.taxa_falhas = taxa_falhas
+        self.latencia = latencia_ms / 1000
+        self.random = random.Random(seed)
+        self.requisicoes = deque()  # (instante, peso) no último minuto
+        self.excedidas = 0
+        self.total_requisicoes = 0
+        self._cache = {}
+
+    def _peso_usado(self) -> int:
+        limite = time.monotonic() - 60
+        while self.requisicoes and self.requisicoes[0][0] < limite:
+            self.requisicoes.popleft()
+        return sum(p for _, p in self.requisicoes)
+
+    def _serie(self, symbol: str, interval: str) -> np.ndarray:
+        """
+        Matriz (n × 6) com open_time, open, high, low, close, volume do símbolo.
+        """
+        chave = (symbol, interval)
+        if chave in self._cache:
+            return self._cache[chave]
+
+        passo = intervalo_em_ms(interval)
+        if self.dados_dir and storage.existe(self.dados_dir, symbol):
+            df = storage.ler(self.dados_dir, symbol)
+            tempos = df.index.asi8 // 1_000_000
+            serie = np.column_stack([tempos, df[['open', 'high', 'low', 'close', 'volume']].to_numpy()])
+        else:
+            # Histórico sintético (movimento browniano geométrico) reproduzível por símbolo
+            rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+            tempos = np.arange(START_MS, int(time.time() * 1000), passo)
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(tempos))))
+            open_ = np.r_[close[0], close[:-1]]
+            high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, len(tempos))))
+            low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, len(tempos))))
+            volume = rng.lognormal(10, 1, len(tempos))
+            serie = np.column_stack([tempos, open_, high, low, close, volume])
+        self._cache[chave] = serie
+        return serie
+
+    async def klines(self, request: web.Request) -> web.Response:
+        self.total_requisicoes += 1
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+
+        usado = self._peso_usado()
+        if usado + PESO_KLINES > self.peso_maximo:
+            # Insistir após um 429 leva ao banimento temporário (418), como na Binance
+            self.excedidas += 1
+            status = 418 if self.excedidas > 3 else 429
+            return web.json_response({"code": -1003, "msg": "Too many requests"}, status=status,
+                                     headers={"Retry-After": str(self.retry_after), "X-MBX-USED-WEIGHT-1M": str(usado)})
+        self.excedidas = 0
+        self.requisicoes.append((time.monotonic(), PESO_KLINES))
+        cabecalhos = {"X-MBX-USED-WEIGHT-1M": str(usado + PESO_KLINES)}
+
+        if self.random.random() < self.taxa_falhas:
+            return web.json_response({"code": -1001, "msg": "Internal error"}, status=503, headers=cabecalhos)
+
+        q = request.query
+        interval = q.get("interval", "1d")
+        serie = self._serie(q["symbol"], interval)
+        inicio = int(q.get("startTime", 0))
+        fim = int(q.get("endTime", 2 ** 62))
+        limite = min(int(q.get("limit", 500)), KLINES_LIMIT)
+
+        ini = np.searchsorted(serie[:, 0], inicio, side="left")
+        fim_idx = np.searchsorted(serie[:, 0], fim, side="right")
+        passo = intervalo_em_ms(interval)
+        linhas = serie[ini:min(fim_idx, ini + limite)]
+        corpo = [
+            [int(t), repr(o), repr(h), repr(l), repr(c), repr(v), int(t) + passo - 1, "0", 0, "0", "0", "0"]
+            for t, o, h, l, c, v in linhas.tolist()
+        ]
+        return web.json_response(corpo, headers=cabecalhos)
+
+    def _eventos_ohlcv(self, symbols: list[str], interval: str):
+        """
+        Eventos de kline dos últimos 'replay_ultimos' candles de cada símbolo, barra a barra:
+        uma atualização parcial (candle aberto) e o candle fechado. None marca o fim de uma barra.
+        """
+        passo = intervalo_em_ms(interval)
+        series = {s: self._serie(s, interval)[-self.replay_ultimos:] for s in symbols}
+        for i in range(max(len(serie) for serie in series.values())):
+            for symbol, serie in series.items():
+                if i >= len(serie):
+                    continue
+                t, o, h, l, c, v = serie[i].tolist()
+                k = {"t": int(t), "T": int(t) + passo - 1, "s": symbol, "i": interval,
+                     "o": repr(o), "h": repr(h), "l": repr(l), "v": repr(v)}
+                yield {"stream": f"{symbol.lower()}@kline_{interval}",
+                       "data": {"e": "kline", "s": symbol, "k": {**k, "c": repr((o + c) / 2), "x": False}}}
+                yield {"stream": f"{symbol.lower()}@kline_{interval}",
+                       "data": {"e": "kline", "s": symbol, "k": {**k, "c": repr(c), "x": True}}}
+            yield None
+
+    def _eventos_gravados(self, streams: set):
+        """
+        Mensagens gravadas pelo streaming.py --gravar; cada troca de candle vira o fim de uma barra.
+        """
+        anterior = None
+        with open(self.replay_arquivo, "r", encoding="utf-8") as f:
+            for linha in f:
+                evento = json.loads(linha)
+                if evento.get("stream") not in streams:
+                    continue
+                t = evento["data"]["k"]["t"]
+                if anterior is not None and t != anterior:
+                    yield None
+                anterior = t
+                yield evento
+        yield None
+
+    async def stream(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        streams = set(request.query.get("streams", "").split("/")) - {""}
+        symbols = sorted({s.split("@")[0].upper() for s in streams})
+        intervalos = {s.split("_", 1)[1] for s in streams if "@kline_" in s}
+        if not symbols or len(intervalos) != 1:
+            await ws.close(message=b"streams invalidos")
+            return ws
+
+        eventos = (self._eventos_gravados(streams) if self.replay_arquivo
+                   else self._eventos_ohlcv(symbols, intervalos.pop()))
+        for evento in eventos:
+            if ws.closed:
+                break
+            if evento is None:
+                await asyncio.sleep(self.replay_intervalo)
+            else:
+                await ws.send_str(json.dumps(evento))
+        await ws.close()
+        return ws
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v3/klines", self.klines)
+        app.router.add_get("/stream", self.stream)
+        return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Servidor mock de klines da Binance")
+    parser.add_argument("--porta", type=int, default=8081)
+    parser.add_argument("--dados_dir", type=str, default=None, help="Serve o OHLCV salvo neste diretório (padrão: sintético)")
+    parser.add_argument("--peso_maximo", type=int, default=6000, help="Peso máximo por minuto antes de responder 429")
+    parser.add_argument("--taxa_falhas", type=float, default=0.0, help="Fração de requisições que respondem 503")
+    parser.add_argument("--latencia_ms", type=float, default=0.0, help="Latência artificial por requisição")
+    parser.add_argument("--replay_ultimos", type=int, default=10, help="Candles finais de cada símbolo reproduzidos no /stream")
+    parser.add_argument("--replay_intervalo", type=float, default=1.0, help="Segundos entre barras no /stream")
+    parser.add_argument("--replay_arquivo", type=str, default=None, help="Reproduz mensagens gravadas (JSONL do streaming.py --gravar)")
+    parser.add_argument("--retry_after", type=float, default=2, help="Segundos informados no Retry-After das respostas 429/418")
+    args = parser.parse_args()
+
+    servidor = ServidorKlinesMock(args.dados_dir, args.peso_maximo, args.taxa_falhas, args.latencia_ms,
+                                  replay_ultimos=args.replay_ultimos, replay_intervalo=args.replay_intervalo,
+                                  replay_arquivo=args.replay_arquivo, retry_after=args.retry_after)
+    web.run_app(servidor.app(), port=args.porta)
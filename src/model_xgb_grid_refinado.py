@@ -1,105 +1,380 @@
 import os
+import json
+import time
 import pandas as pd
 import numpy as np
 import joblib
+import xgboost as xgb
 from xgboost import XGBClassifier
-from sklearn.model_selection import TimeSeriesSplit, GridSearchCV
-from sklearn.metrics import f1_score, make_scorer, roc_auc_score, precision_score, recall_score
+from sklearn.metrics import f1_score, roc_auc_score, precision_score, recall_score
+import argparse
+import storage
+from execucao import adicionar_argumento_workers, cores_por_worker, executar_por_ticker
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, contar
+from busca_xgb import buscar_grade, buscar_halving, halving_em_folds, modelo_final, params_nativos
+from matriz_features import carregar_matriz
 
-print("🧠 Iniciando treinamento refinado dos modelos XGBoost...")
+# Grade de parâmetros refinada
+PARAM_GRID = {
+    "max_depth": [3, 5],
+    "learning_rate": [0.01, 0.1],
+    "n_estimators": [100, 200],
+    "subsample": [0.8],
+    "colsample_bytree": [0.8],
+    "gamma": [0, 1]
+}
+N_SPLITS = 5
 
-processed_dir = "data/processed"
-model_dir = "data/models"
-os.makedirs(model_dir, exist_ok=True)
+# Retreino incremental
+LIMITE_DRIFT = 0.05         # queda máxima de F1 nas linhas novas antes de refazer a busca
+MIN_LINHAS_NOVAS = 20       # linhas novas com label necessárias para continuar o booster
+RODADAS_INCREMENTAIS = 20   # árvores adicionadas a cada continuação
+JANELA_CONTINUACAO = 250    # linhas recentes (incluindo as novas) usadas na continuação
+MAX_FATOR_RODADAS = 3       # acima de 3× o n_estimators original, a busca completa é refeita
 
-resultados = []
+def parametros_base(scale_pos_weight, n_jobs_xgb=None):
+    return {
+        "objective": "binary:logistic",
+        "eval_metric": "logloss",
+        "scale_pos_weight": scale_pos_weight,
+        "random_state": 42,
+        "verbosity": 0,
+        "n_jobs": n_jobs_xgb
+    }
+
+def buscar_grid(matriz, params_base, sementes=None):
+    """
+    Busca exaustiva: todas as combinações da grade em todos os folds temporais, como o
+    GridSearchCV, mas sobre os folds QuantileDMatrix da matriz de treino, quantizados uma vez
+    e compartilhados por todas as combinações. As sementes (parâmetros do treino anterior)
+    também são avaliadas e vencem os empates.
+    Retorna (melhor modelo, melhores parâmetros, F1 médio de validação).
+    """
+    best_params, best_score = buscar_grade(matriz.folds(N_SPLITS), params_base, PARAM_GRID, sementes)
+    return modelo_final(matriz, params_base, best_params), best_params, best_score
+
+def calcular_scale_pos_weight(y):
+    # Cálculo do peso para lidar com desbalanceamento
+    ratio = (y == 0).sum() / max((y == 1).sum(), 1)
+    return round(ratio, 2)
 
-for file in os.listdir(processed_dir):
-    if not file.endswith("_merged.csv"):
-        continue
+def buscar_melhor_modelo(matriz, busca="grid", n_jobs=-1, sementes=None):
+    """
+    Busca de hiperparâmetros 'grid' (exaustiva) ou 'halving' (successive halving com early stopping)
+    sobre as linhas com label de uma MatrizFeatures. 'sementes' (melhores parâmetros do treino
+    anterior) são candidatos extras nas duas buscas.
+    """
+    scale_pos_weight = calcular_scale_pos_weight(matriz.y)
 
-    ticker = file.replace("_merged.csv", "")
-    df = pd.read_csv(os.path.join(processed_dir, file))
+    # As duas buscas treinam um candidato por vez, então o XGBoost recebe todos os núcleos do ticker
+    params_base = parametros_base(scale_pos_weight, None if n_jobs == -1 else n_jobs)
+    if busca == "halving":
+        modelo, melhores, score_cv = buscar_halving(matriz, params_base, PARAM_GRID, n_splits=N_SPLITS, sementes=sementes)
+    else:
+        modelo, melhores, score_cv = buscar_grid(matriz, params_base, sementes)
+    return modelo, melhores, score_cv, scale_pos_weight
 
-    if "target" not in df.columns:
-        print(f"⚠️  {ticker}: coluna 'target' não encontrada.")
-        continue
+def caminho_historico(model_dir, ticker):
+    return os.path.join(model_dir, f"{ticker}_treino.json")
 
-    # Definir X e y
-    X = df.drop(columns=["date", "target"], errors="ignore")
-    y = df["target"]
+def carregar_historico(model_dir, ticker):
+    path = caminho_historico(model_dir, ticker)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-    if y.nunique() < 2:
+def salvar_historico(model_dir, ticker, historico):
+    with open(caminho_historico(model_dir, ticker), "w", encoding="utf-8") as f:
+        json.dump(historico, f)
+
+def continuar_treino(ticker, X, y, model_path, historico, limite_drift=LIMITE_DRIFT, n_jobs=-1):
+    """
+    Retreino incremental: continua o booster salvo com as linhas chegadas desde o último treino
+    (mais uma janela recente), usando os melhores parâmetros anteriores.
+    Retorna (modelo, parâmetros, drift), o modelo anterior com drift None quando ainda não há
+    linhas novas suficientes, ou None quando é preciso refazer a busca completa.
+    """
+    novos = (X.index > pd.Timestamp(historico["ultima_data"])) & y.notna().to_numpy()
+    modelo = joblib.load(model_path)
+    params = historico["melhores_parametros"]
+    if novos.sum() < MIN_LINHAS_NOVAS:
+        return modelo, params, None
+
+    X_novos, y_novos = X[novos], y[novos]
+    # Drift: queda do F1 do modelo atual nas linhas novas em relação ao F1 de validação da última busca
+    drift = historico["f1_referencia"] - f1_score(y_novos, modelo.predict(X_novos), zero_division=0)
+    if drift > limite_drift:
+        print(f"🔁 {ticker}: drift de {drift:.4f} acima do limite {limite_drift} — refazendo a busca completa.")
+        return None
+    # Continuações sucessivas não podem crescer o modelo indefinidamente
+    if modelo.get_booster().num_boosted_rounds() + RODADAS_INCREMENTAIS > MAX_FATOR_RODADAS * max(params["n_estimators"], RODADAS_INCREMENTAIS):
+        print(f"🔁 {ticker}: limite de rodadas incrementais atingido — refazendo a busca completa.")
+        return None
+
+    # As árvores novas ajustam o booster às linhas novas, junto de uma janela recente do histórico
+    # para que poucas linhas não dominem a continuação
+    rotulados = y.notna().to_numpy()
+    janela = max(JANELA_CONTINUACAO, int(novos.sum()))
+    X_janela, y_janela = X[rotulados].iloc[-janela:], y[rotulados].iloc[-janela:]
+    n_jobs_xgb = None if n_jobs == -1 else n_jobs
+    novo = XGBClassifier(**{**parametros_base(calcular_scale_pos_weight(y_janela), n_jobs_xgb), **params,
+                            "n_estimators": RODADAS_INCREMENTAIS})
+    novo.fit(X_janela, y_janela, xgb_model=modelo.get_booster())
+    contar("ajustes")
+    return novo, params, drift
+
+def treinar_ticker_memoria_externa(ticker, processed_dir="data/processed", model_dir="data/models", n_jobs=-1, horizon=5):
+    """
+    Treino para históricos grandes (candles intradiários): os lotes de features float32 são lidos
+    do Parquet por um DataIter e quantizados em páginas no disco (ExtMemQuantileDMatrix).
+    Os folds são faixas de linhas, sem cópias da tabela. Usa sempre o successive halving.
+    """
+    from memoria_externa import TabelaExterna
+
+    try:
+        tabela = TabelaExterna(processed_dir, f"{ticker}_merged", horizon)
+    except KeyError:
+        print(f"⚠️  {ticker}: coluna 'target' (ou 'label_{horizon}d') não encontrada.")
+        return None
+
+    # Só data e label são carregados por inteiro
+    rotulos = tabela.ler_colunas([storage.INDEX_COL, tabela.coluna_label]).dropna(subset=[tabela.coluna_label])
+    y_total = rotulos[tabela.coluna_label]
+    if y_total.nunique() < 2:
         print(f"⚠️  {ticker}: apenas uma classe presente no target.")
-        continue
+        return None
 
-    # Cálculo do peso para lidar com desbalanceamento
-    ratio = (y == 0).sum() / max((y == 1).sum(), 1)
-    scale_pos_weight = round(ratio, 2)
-
-    # Definir modelo base
-    xgb = XGBClassifier(
-        objective="binary:logistic",
-        use_label_encoder=False,
-        eval_metric="logloss",
-        scale_pos_weight=scale_pos_weight,
-        random_state=42,
-        verbosity=0
-    )
+    scale_pos_weight = calcular_scale_pos_weight(y_total)
+    params_base = {**parametros_base(scale_pos_weight, None if n_jobs == -1 else n_jobs), "tree_method": "hist"}
+    historico = carregar_historico(model_dir, ticker)
+    sementes = [historico["melhores_parametros"]] if historico else None
 
-    # Grade de parâmetros refinada
-    param_grid = {
-        "max_depth": [3, 5],
-        "learning_rate": [0.01, 0.1],
-        "n_estimators": [100, 200],
-        "subsample": [0.8],
-        "colsample_bytree": [0.8],
-        "gamma": [0, 1]
+    try:
+        best_params, f1_referencia = halving_em_folds(tabela.folds(N_SPLITS), params_base, PARAM_GRID, sementes)
+        dfull = tabela.matriz()
+        booster = xgb.train(params_nativos({**params_base, **best_params}), dfull,
+                            num_boost_round=best_params["n_estimators"])
+        contar("ajustes")
+        proba = booster.predict(dfull)
+        y = dfull.get_label()
+    finally:
+        tabela.limpar_cache()
+
+    # Salvo como XGBClassifier, como no treino em memória (inferência e retreino incremental)
+    best_model = XGBClassifier(**{**params_base, **best_params})
+    best_model.load_model(bytearray(booster.save_raw("json")))
+
+    y_pred = (proba >= 0.5).astype(int)
+    f1 = f1_score(y, y_pred)
+    roc = roc_auc_score(y, proba)
+    model_path = os.path.join(model_dir, f"{ticker}_xgb_model_refinado.pkl")
+    joblib.dump(best_model, model_path)
+    salvar_historico(model_dir, ticker, {
+        "ultima_data": str(rotulos[storage.INDEX_COL].max()),
+        "horizon": horizon,
+        "melhores_parametros": best_params,
+        "f1_referencia": float(f1_referencia)
+    })
+    print(f"✅ Modelo treinado (memória externa) e salvo para {ticker} — F1: {f1:.4f} ROC AUC: {roc:.4f}")
+
+    return {
+        "ticker": ticker,
+        "f1_score": round(f1, 4),
+        "roc_auc": round(roc, 4),
+        "precision": round(precision_score(y, y_pred), 4),
+        "recall": round(recall_score(y, y_pred), 4),
+        "scale_pos_weight": scale_pos_weight,
+        "melhores_parametros": best_params,
+        "busca": "halving",
+        "modo": "memoria_externa"
     }
 
-    # Validação temporal
-    tscv = TimeSeriesSplit(n_splits=5)
-    scorer = make_scorer(f1_score)
-
-    grid_search = GridSearchCV(
-        xgb,
-        param_grid,
-        scoring=scorer,
-        cv=tscv,
-        n_jobs=-1,
-        verbose=0
-    )
+def treinar_ticker(ticker, processed_dir="data/processed", model_dir="data/models", n_jobs=-1, horizon=5, busca="grid",
+                   incremental=False, limite_drift=LIMITE_DRIFT, memoria_externa=False):
+    """
+    Executa a busca de hiperparâmetros de um ticker, salva o melhor modelo e retorna as métricas (None se ignorado).
+    n_jobs é a quantidade de núcleos disponível para o ticker (-1 = todos).
+    horizon escolhe a coluna label_{h}d em datasets gerados no modo combinado.
+    incremental continua o modelo salvo com as linhas novas e só refaz a busca quando o drift
+    de validação passa de limite_drift.
+    memoria_externa usa o treino em lotes a partir do disco (treinar_ticker_memoria_externa).
+    """
+    if memoria_externa:
+        return treinar_ticker_memoria_externa(ticker, processed_dir, model_dir, n_jobs, horizon)
 
+    # Matriz float32 do feature store, reconstruída só quando o dataset processado muda
     try:
-        grid_search.fit(X, y)
-        best_model = grid_search.best_estimator_
+        matriz = carregar_matriz(ticker, processed_dir, horizon=horizon)
+    except KeyError:
+        print(f"⚠️  {ticker}: coluna 'target' (ou 'label_{horizon}d') não encontrada.")
+        return None
+    X, y = matriz.quadro()
+
+    if y.nunique() < 2:
+        print(f"⚠️  {ticker}: apenas uma classe presente no target.")
+        return None
 
-        # Avaliação no conjunto completo
-        y_pred = best_model.predict(X)
-        f1 = f1_score(y, y_pred)
-        roc = roc_auc_score(y, best_model.predict_proba(X)[:, 1])
-        precision = precision_score(y, y_pred)
-        recall = recall_score(y, y_pred)
+    model_path = os.path.join(model_dir, f"{ticker}_xgb_model_refinado.pkl")
+    historico = carregar_historico(model_dir, ticker) if incremental and os.path.exists(model_path) else None
+    continuado = None
+    if historico is not None and historico.get("horizon") == horizon:
+        continuado = continuar_treino(ticker, X, y, model_path, historico, limite_drift, n_jobs)
 
-        joblib.dump(best_model, os.path.join(model_dir, f"{ticker}_xgb_model_refinado.pkl"))
+    if continuado is not None:
+        best_model, best_params, drift = continuado
+        if drift is None:
+            print(f"⏭️  {ticker}: menos de {MIN_LINHAS_NOVAS} linhas novas desde o último treino — modelo mantido.")
+            return None
+        modo = "incremental"
+        scale_pos_weight = calcular_scale_pos_weight(y)
+        f1_referencia = historico["f1_referencia"]
+    else:
+        sementes = [historico["melhores_parametros"]] if historico else None
+        best_model, best_params, f1_referencia, scale_pos_weight = buscar_melhor_modelo(matriz.rotulados(), busca, n_jobs, sementes)
+        modo = "completo"
 
-        print(f"✅ Modelo treinado e salvo para {ticker} — F1: {f1:.4f} ROC AUC: {roc:.4f}")
+    # Avaliação no conjunto completo (linhas com label conhecido)
+    rotulados = y.notna().to_numpy()
+    X, y = X[rotulados], y[rotulados]
+    y_pred = best_model.predict(X)
+    f1 = f1_score(y, y_pred)
+    roc = roc_auc_score(y, best_model.predict_proba(X)[:, 1])
+    precision = precision_score(y, y_pred)
+    recall = recall_score(y, y_pred)
 
-        resultados.append({
-            "ticker": ticker,
-            "f1_score": round(f1, 4),
-            "roc_auc": round(roc, 4),
-            "precision": round(precision, 4),
-            "recall": round(recall, 4),
-            "scale_pos_weight": scale_pos_weight,
-            "melhores_parametros": grid_search.best_params_
-        })
+    joblib.dump(best_model, model_path)
+    salvar_historico(model_dir, ticker, {
+        "ultima_data": str(X.index.max()),
+        "horizon": horizon,
+        "melhores_parametros": best_params,
+        "f1_referencia": float(f1_referencia)
+    })
+
+    print(f"✅ Modelo treinado ({modo}) e salvo para {ticker} — F1: {f1:.4f} ROC AUC: {roc:.4f}")
 
-    except Exception as e:
-        print(f"❌ Erro ao treinar {ticker}: {e}")
+    return {
+        "ticker": ticker,
+        "f1_score": round(f1, 4),
+        "roc_auc": round(roc, 4),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "scale_pos_weight": scale_pos_weight,
+        "melhores_parametros": best_params,
+        "busca": busca,
+        "modo": modo
+    }
 
-# Salvar resultados
-if resultados:
+def salvar_resultados(resultados, model_dir="data/models", atualizar=False):
+    """
+    Grava as métricas em modelo_refinado_resultados.csv.
+    Com atualizar=True mantém as linhas dos tickers que não foram retreinados nesta execução.
+    """
+    path = os.path.join(model_dir, "modelo_refinado_resultados.csv")
     df_resultados = pd.DataFrame(resultados)
-    df_resultados.to_csv(os.path.join(model_dir, "modelo_refinado_resultados.csv"), index=False)
+    if atualizar and os.path.exists(path):
+        anteriores = pd.read_csv(path)
+        anteriores = anteriores[~anteriores["ticker"].isin(df_resultados["ticker"])]
+        df_resultados = pd.concat([anteriores, df_resultados], ignore_index=True).sort_values("ticker")
+    df_resultados.to_csv(path, index=False)
     print("📄 Resultados salvos em modelo_refinado_resultados.csv")
+
+def comparar_buscas(ticker, processed_dir="data/processed", n_jobs=-1, horizon=5, fracao_teste=0.2):
+    """
+    Roda as buscas 'grid' e 'halving' nos primeiros (1 - fracao_teste) do histórico e avalia
+    os dois modelos no trecho final, que nenhuma das buscas viu. Retorna uma linha por busca.
+    """
+    matriz = carregar_matriz(ticker, processed_dir, horizon=horizon).rotulados()
+    corte = int(len(matriz) * (1 - fracao_teste))
+    treino, teste = matriz.fatia(0, corte), matriz.fatia(corte)
+    X_teste, y_teste = teste.quadro()
+    if len(np.unique(treino.y)) < 2 or y_teste.nunique() < 2:
+        return []
+
+    linhas = []
+    for busca in ["grid", "halving"]:
+        inicio = time.perf_counter()
+        modelo, melhores, score_cv, _ = buscar_melhor_modelo(treino, busca, n_jobs)
+        duracao = time.perf_counter() - inicio
+        proba = modelo.predict_proba(X_teste)[:, 1]
+        linhas.append({
+            "ticker": ticker,
+            "busca": busca,
+            "tempo_s": round(duracao, 2),
+            "f1_cv": round(score_cv, 4),
+            "f1_teste": round(f1_score(y_teste, proba >= 0.5, zero_division=0), 4),
+            "roc_auc_teste": round(roc_auc_score(y_teste, proba), 4),
+            "melhores_parametros": melhores
+        })
+    return linhas
+
+def main_comparacao(workers=1, horizon=5):
+    print("⚖️  Comparando busca em grade e successive halving...")
+    processed_dir = "data/processed"
+    model_dir = "data/models"
+    os.makedirs(model_dir, exist_ok=True)
+    n_jobs = -1 if workers <= 1 else cores_por_worker(workers)
+
+    tickers = [nome.replace("_merged", "") for nome in storage.listar(processed_dir, "_merged")]
+    saidas, erros = executar_por_ticker(comparar_buscas, tickers, workers=workers, etapa="comparacao",
+                                        processed_dir=processed_dir, n_jobs=n_jobs, horizon=horizon)
+    for ticker, erro in erros.items():
+        print(f"❌ Erro ao comparar {ticker}: {erro}")
+
+    df = pd.DataFrame([linha for _, linhas in saidas for linha in linhas])
+    if df.empty:
+        print("📭 Nenhum ticker com classes suficientes para a comparação.")
+        return df
+    path = os.path.join(model_dir, "comparacao_busca.csv")
+    df.to_csv(path, index=False)
+
+    resumo = df.groupby("busca")[["tempo_s", "f1_cv", "f1_teste", "roc_auc_teste"]].mean()
+    print(resumo.round(4).to_string())
+    tempos = df.pivot(index="ticker", columns="busca", values="tempo_s")
+    print(f"🚀 Speedup mediano do halving: {(tempos['grid'] / tempos['halving']).median():.1f}x")
+    print(f"📄 Comparação salva em {path}")
+    return df
+
+def main(workers=1, horizon=5, busca="grid", incremental=False, limite_drift=LIMITE_DRIFT, memoria_externa=False):
+    print("🧠 Iniciando treinamento refinado dos modelos XGBoost...")
+
+    processed_dir = "data/processed"
+    model_dir = "data/models"
+    os.makedirs(model_dir, exist_ok=True)
+
+    # Em paralelo, cada worker recebe apenas a sua fatia dos núcleos para não sobrecarregar a CPU
+    n_jobs = -1 if workers <= 1 else cores_por_worker(workers)
+
+    tickers = [nome.replace("_merged", "") for nome in storage.listar(processed_dir, "_merged")]
+    saidas, erros = executar_por_ticker(
+        treinar_ticker, tickers, workers=workers, etapa="train",
+        processed_dir=processed_dir, model_dir=model_dir, n_jobs=n_jobs, horizon=horizon, busca=busca,
+        incremental=incremental, limite_drift=limite_drift, memoria_externa=memoria_externa
+    )
+    for ticker, erro in erros.items():
+        print(f"❌ Erro ao treinar {ticker}: {erro}")
+
+    resultados = [r for _, r in saidas if r is not None]
+
+    # Salvar resultados
+    if resultados:
+        salvar_resultados(resultados, model_dir, atualizar=incremental)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treinamento XGBoost com busca em grade refinada")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte do label (datasets com todos os horizontes)")
+    parser.add_argument("--busca", type=str, choices=["grid", "halving"], default="grid", help="Estratégia de busca de hiperparâmetros")
+    parser.add_argument("--comparar", action="store_true", help="Compara grid e halving em um trecho final de teste (não salva modelos)")
+    parser.add_argument("--incremental", action="store_true", help="Continua os modelos salvos com as linhas novas (busca completa só com drift)")
+    parser.add_argument("--limite_drift", type=float, default=LIMITE_DRIFT, help="Queda de F1 nas linhas novas que dispara a busca completa")
+    parser.add_argument("--memoria_externa", action="store_true", help="Treina em lotes lidos do Parquet (históricos intradiários grandes)")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+    if args.comparar:
+        main_comparacao(workers=args.workers, horizon=args.horizon)
+    else:
+        main(workers=args.workers, horizon=args.horizon, busca=args.busca,
+             incremental=args.incremental, limite_drift=args.limite_drift,
+             memoria_externa=args.memoria_externa)
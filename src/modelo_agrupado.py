@@ -0,0 +1,159 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import f1_score, roc_auc_score, precision_score, recall_score
+
+import storage
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, contar, cronometrado
+from label_completo import separar_features_target, sem_retorno_futuro
+
+PROCESSED_DIR = "data/processed"
+MODEL_DIR = "data/models"
+MODELO_AGRUPADO = "agrupado_xgb.json"
+METADADOS_AGRUPADO = "agrupado_xgb_meta.json"
+COLUNA_SIMBOLO = "symbol"
+
+PARAMS_AGRUPADO = {
+    "objective": "binary:logistic",
+    "eval_metric": "logloss",
+    "tree_method": "hist",
+    "max_depth": 5,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "max_cat_to_onehot": 1,
+    "seed": 42,
+    "verbosity": 0,
+}
+MAX_RODADAS = 1000
+EARLY_STOPPING = 50
+FRACAO_VALIDACAO = 0.2
+
+
+def empilhar_datasets(processed_dir: str = PROCESSED_DIR, horizon: int = 5):
+    """
+    Empilha os datasets de todos os tickers em uma única tabela ordenada pela data, com o
+    símbolo como feature categórica. Retorna (X, y, datas, categorias).
+    """
+    partes = []
+    for nome in storage.listar(processed_dir, "_merged"):
+        ticker = nome.replace("_merged", "")
+        df = storage.ler(processed_dir, nome)
+        try:
+            X, y = separar_features_target(df, horizon)
+            # Os labels binário e triplo gravam 0 nas linhas sem retorno futuro: ficam fora do treino
+            rotulados = y.notna().to_numpy() & ~sem_retorno_futuro(df, y.name)
+        except KeyError as e:
+            print(f"⚠️  {ticker}: {e.args[0]}")
+            continue
+        X = X[rotulados].astype(np.float32)
+        X.insert(0, COLUNA_SIMBOLO, ticker)
+        X["__y"] = y[rotulados].to_numpy()
+        partes.append(X)
+
+    if not partes:
+        raise ValueError(f"Nenhum dataset com label em {processed_dir}")
+
+    df = pd.concat(partes)
+    categorias = sorted(df[COLUNA_SIMBOLO].unique())
+    df[COLUNA_SIMBOLO] = pd.Categorical(df[COLUNA_SIMBOLO], categories=categorias)
+    # Ordenação estável pela data: a validação usa sempre o trecho mais recente de todos os ativos
+    df = df.sort_index(kind="stable")
+    y = df.pop("__y")
+    return df, y, df.index, categorias
+
+
+def preparar_features(X: pd.DataFrame, tickers, categorias: list[str]) -> pd.DataFrame:
+    """
+    Acrescenta a coluna categórica do símbolo com as mesmas categorias do treino
+    (símbolos novos viram valor ausente).
+    """
+    X = X.astype(np.float32)
+    X.insert(0, COLUNA_SIMBOLO, pd.Categorical(list(tickers), categories=categorias))
+    return X
+
+
+@cronometrado("agrupado")
+def treinar_agrupado(processed_dir: str = PROCESSED_DIR, model_dir: str = MODEL_DIR, horizon: int = 5) -> dict:
+    """
+    Treina um único modelo para todos os ativos. As rodadas são escolhidas por early stopping
+    no trecho final (por data) e o modelo final é treinado em todo o histórico.
+    QuantileDMatrix guarda apenas os índices dos bins do hist, não a matriz float original.
+    """
+    X, y, datas, categorias = empilhar_datasets(processed_dir, horizon)
+    corte = datas[int(len(datas) * (1 - FRACAO_VALIDACAO))]
+    treino = (datas < corte)
+    ratio = (y[treino] == 0).sum() / max((y[treino] == 1).sum(), 1)
+    params = {**PARAMS_AGRUPADO, "scale_pos_weight": round(ratio, 2)}
+
+    dtrain = xgb.QuantileDMatrix(X[treino], label=y[treino], enable_categorical=True)
+    dval = xgb.QuantileDMatrix(X[~treino], label=y[~treino], enable_categorical=True, ref=dtrain)
+    booster = xgb.train(params, dtrain, num_boost_round=MAX_RODADAS, evals=[(dval, "val")],
+                        early_stopping_rounds=EARLY_STOPPING, verbose_eval=False)
+    contar("ajustes")
+    rodadas = booster.best_iteration + 1
+
+    # Métricas fora da amostra, no geral e por ativo
+    proba = booster.predict(dval, iteration_range=(0, rodadas))
+    y_val = y[~treino].to_numpy()
+    pred = proba >= 0.5
+    metricas = {
+        "f1_score": round(f1_score(y_val, pred, zero_division=0), 4),
+        "roc_auc": round(roc_auc_score(y_val, proba), 4) if len(np.unique(y_val)) > 1 else None,
+        "precision": round(precision_score(y_val, pred, zero_division=0), 4),
+        "recall": round(recall_score(y_val, pred, zero_division=0), 4),
+    }
+    por_ticker = []
+    simbolos_val = X.loc[~treino, COLUNA_SIMBOLO].to_numpy()
+    for ticker in categorias:
+        m = simbolos_val == ticker
+        if m.sum() and len(np.unique(y_val[m])) > 1:
+            por_ticker.append({
+                "ticker": ticker,
+                "f1_score": round(f1_score(y_val[m], pred[m], zero_division=0), 4),
+                "roc_auc": round(roc_auc_score(y_val[m], proba[m]), 4),
+                "linhas_validacao": int(m.sum()),
+            })
+
+    dfull = xgb.QuantileDMatrix(X, label=y, enable_categorical=True)
+    final = xgb.train(params, dfull, num_boost_round=rodadas)
+    contar("ajustes")
+
+    os.makedirs(model_dir, exist_ok=True)
+    final.save_model(os.path.join(model_dir, MODELO_AGRUPADO))
+    with open(os.path.join(model_dir, METADADOS_AGRUPADO), "w", encoding="utf-8") as f:
+        json.dump({"horizon": horizon, "categorias": categorias, "rodadas": rodadas,
+                   "linhas": len(X), "validacao": metricas}, f)
+    pd.DataFrame(por_ticker).to_csv(os.path.join(model_dir, "modelo_agrupado_resultados.csv"), index=False)
+
+    print(f"✅ Modelo agrupado: {len(categorias)} ativos, {len(X)} linhas, {rodadas} rodadas — "
+          f"F1 validação: {metricas['f1_score']:.4f} ROC AUC: {metricas['roc_auc']}")
+    return metricas
+
+
+def carregar_agrupado(model_dir: str = MODEL_DIR):
+    """
+    Retorna (booster, metadados) do modelo agrupado, ou None se ainda não foi treinado.
+    """
+    path = os.path.join(model_dir, MODELO_AGRUPADO)
+    if not os.path.exists(path):
+        return None
+    booster = xgb.Booster()
+    booster.load_model(path)
+    with open(os.path.join(model_dir, METADADOS_AGRUPADO), "r", encoding="utf-8") as f:
+        return booster, json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treina um único modelo XGBoost com os dados de todos os ativos")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte do label (datasets com todos os horizontes)")
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    print("🧠 Treinando modelo agrupado (todos os ativos)...")
+    treinar_agrupado(horizon=args.horizon)
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import storage
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, cronometrado
+
+FEATURE_DIR = "data/features"
+OHLCV_DIR = "data/ohlcv"
+PAINEL_DIR = "data/painel"
+# Painel só com o fechamento, montado direto das tabelas OHLCV (backtest, varredura e avaliação)
+PAINEL_FECHAMENTOS_DIR = "data/painel_fechamentos"
+META = "meta.json"
+INDICE = "indice.npy"
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+
+def _epoch(datas: pd.DatetimeIndex) -> np.ndarray:
+    return datas.to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+def _mtime(diretorio: str, nome: str) -> Optional[int]:
+    path = storage.localizar(diretorio, nome)
+    return os.stat(path).st_mtime_ns if path else None
+
+
+class Painel:
+    """
+    Painel (datas × tickers) gravado em disco: um arquivo .npy float32 contíguo por campo
+    e o índice de datas como int64 (segundos desde a época). Os arquivos são abertos com
+    memory map somente leitura, sem cópia: processos diferentes compartilham as mesmas páginas.
+    """
+
+    def __init__(self, diretorio: str = PAINEL_DIR):
+        with open(os.path.join(diretorio, META), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.diretorio = diretorio
+        self.tickers: list[str] = self.meta["tickers"]
+        self.campos: list[str] = self.meta["campos"]
+        self.indice = np.load(os.path.join(diretorio, INDICE), mmap_mode="r")
+        self._posicoes = {t: j for j, t in enumerate(self.tickers)}
+        self._arrays: dict[str, np.ndarray] = {}
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.indice), len(self.tickers)
+
+    @property
+    def datas(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(pd.to_datetime(self.indice, unit="s"), name=storage.INDEX_COL)
+
+    def campo(self, nome: str) -> np.ndarray:
+        """
+        Matriz (datas × tickers) de um campo, mapeada do disco.
+        """
+        if nome not in self._arrays:
+            if nome not in self.campos:
+                raise KeyError(f"Campo '{nome}' não existe no painel {self.diretorio}")
+            self._arrays[nome] = np.load(os.path.join(self.diretorio, f"{nome}.npy"), mmap_mode="r")
+        return self._arrays[nome]
+
+    def quadro(self, nome: str, tickers: Optional[list[str]] = None) -> pd.DataFrame:
+        """
+        DataFrame (datas × tickers) de um campo. Sem 'tickers', é uma visão do memory map
+        (somente leitura); com 'tickers', as colunas escolhidas são copiadas.
+        """
+        dados = self.campo(nome)
+        if tickers is None:
+            return pd.DataFrame(dados, index=self.datas, columns=self.tickers, copy=False)
+        return pd.DataFrame(dados[:, [self._posicoes[t] for t in tickers]], index=self.datas, columns=tickers)
+
+    def tabela(self, ticker: str, campos: Optional[list[str]] = None) -> pd.DataFrame:
+        """
+        Todos os campos de um ticker, nas datas em que ele tem dados.
+        """
+        j = self._posicoes[ticker]
+        campos = campos or self.campos
+        df = pd.DataFrame({c: self.campo(c)[:, j] for c in campos}, index=self.datas)
+        return df[df.notna().any(axis=1).to_numpy()]
+
+    def atualizado(self, origem_dir: str, sufixo: str = "") -> bool:
+        """
+        True se nenhuma tabela de origem foi criada, removida ou alterada desde a montagem.
+        """
+        nomes = storage.listar(origem_dir, sufixo)
+        if [n[:len(n) - len(sufixo)] if sufixo else n for n in nomes] != self.tickers:
+            return False
+        return all(_mtime(origem_dir, n) == m for n, m in zip(nomes, self.meta["mtimes"]))
+
+
+@cronometrado("painel")
+def construir_painel(origem_dir: str = FEATURE_DIR, destino: str = PAINEL_DIR, sufixo: str = "_feat",
+                     campos: Optional[list[str]] = None) -> Painel:
+    """
+    Monta o painel a partir das tabelas de um diretório (ex: data/features, sufixo _feat).
+    As datas são a união das datas de todos os tickers; ausências ficam NaN.
+    Cada tabela é lida uma única vez e escrita direto nos arquivos mapeados, então o pico de
+    memória é o de uma tabela, não o do painel inteiro.
+    """
+    nomes = storage.listar(origem_dir, sufixo)
+    if not nomes:
+        raise ValueError(f"Nenhuma tabela em {origem_dir} com sufixo '{sufixo}'")
+    tickers = [n[:len(n) - len(sufixo)] if sufixo else n for n in nomes]
+    mtimes = [_mtime(origem_dir, n) for n in nomes]
+
+    # Índice: união das datas, lendo só a coluna de data de cada tabela
+    indice = np.unique(np.concatenate([_epoch(storage.ler(origem_dir, n, columns=[]).index) for n in nomes]))
+    if campos is None:
+        amostra = storage.ler(origem_dir, nomes[0], tail=1)
+        campos = [c for c in amostra.columns if pd.api.types.is_numeric_dtype(amostra[c])]
+
+    os.makedirs(destino, exist_ok=True)
+    # Sem meta.json o painel é tratado como inexistente até a montagem terminar
+    if os.path.exists(os.path.join(destino, META)):
+        os.remove(os.path.join(destino, META))
+    T, N = len(indice), len(nomes)
+    arrays = {}
+    for campo in campos:
+        arrays[campo] = np.lib.format.open_memmap(os.path.join(destino, f"{campo}.npy"), mode="w+",
+                                                  dtype=np.float32, shape=(T, N))
+        arrays[campo][:] = np.nan
+
+    for j, nome in enumerate(nomes):
+        df = storage.ler(origem_dir, nome, columns=campos)
+        linhas = np.searchsorted(indice, _epoch(df.index))
+        for campo in campos:
+            arrays[campo][linhas, j] = df[campo].to_numpy(dtype=np.float32)
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    np.save(os.path.join(destino, INDICE), indice)
+    with open(os.path.join(destino, META), "w", encoding="utf-8") as f:
+        json.dump({"tickers": tickers, "campos": campos, "mtimes": mtimes,
+                   "origem": origem_dir, "sufixo": sufixo}, f)
+    logging.info(f"[OK] Painel {T} datas × {N} tickers × {len(campos)} campos → {destino}")
+    return Painel(destino)
+
+
+def abrir_painel(origem_dir: str = FEATURE_DIR, destino: str = PAINEL_DIR, sufixo: str = "_feat") -> Optional[Painel]:
+    """
+    Abre o painel se ele existir, tiver sido montado a partir de origem_dir e estiver em dia com
+    as tabelas de origem; senão retorna None.
+    """
+    if not os.path.exists(os.path.join(destino, META)):
+        return None
+    painel = Painel(destino)
+    if os.path.abspath(painel.meta["origem"]) != os.path.abspath(origem_dir):
+        return None
+    return painel if painel.atualizado(origem_dir, sufixo) else None
+
+
+def construir_painel_fechamentos(ohlcv_dir: str = OHLCV_DIR, destino: str = PAINEL_FECHAMENTOS_DIR) -> Painel:
+    """
+    Painel só com o fechamento, montado das tabelas OHLCV (usado por carregar_fechamentos).
+    """
+    return construir_painel(ohlcv_dir, destino, "", ["close"])
+
+
+def carregar_fechamentos(tickers: list[str], ohlcv_dir: str = OHLCV_DIR,
+                         painel_dir: str = PAINEL_FECHAMENTOS_DIR) -> pd.DataFrame:
+    """
+    Fechamentos (datas × tickers) para as etapas que precisam só do preço (backtest, varredura,
+    avaliação da carteira). Tickers do painel de fechamentos vêm do memory map, sem reler as
+    tabelas, quando ele foi montado de ohlcv_dir e está em dia com elas; senão (ou para tickers
+    fora do painel), da tabela OHLCV em float64. Tickers sem dados ficam de fora.
+    """
+    painel = abrir_painel(ohlcv_dir, painel_dir, "")
+    do_painel = [t for t in tickers if t in set(painel.tickers)] if painel is not None else []
+    partes = []
+    if do_painel:
+        close = painel.quadro("close", do_painel)
+        partes.append(close[close.notna().any(axis=1).to_numpy()])
+    tabelas = {t: storage.ler(ohlcv_dir, t, columns=["close"])["close"]
+               for t in tickers if t not in do_painel and storage.existe(ohlcv_dir, t)}
+    if tabelas:
+        partes.append(pd.concat(tabelas, axis=1))
+    if not partes:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name=storage.INDEX_COL))
+    close = pd.concat(partes, axis=1).sort_index()
+    return close[[t for t in tickers if t in close.columns]]
+
+
+def comparar_carga(painel: Painel, origem_dir: str, sufixo: str) -> None:
+    """
+    Compara tempo e memória de carregar o fechamento de todos os tickers pelas tabelas
+    (DataFrames float64) e pelo painel mapeado.
+    """
+    inicio = time.perf_counter()
+    tabelas = {t: storage.ler(origem_dir, f"{t}{sufixo}", columns=["close"])["close"] for t in painel.tickers}
+    quadro = pd.concat(tabelas, axis=1).sort_index()
+    tempo_tabelas = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    mapeado = Painel(painel.diretorio).quadro("close")
+    tempo_painel = time.perf_counter() - inicio
+    print(f"⏱️  Tabelas: {tempo_tabelas * 1000:.1f} ms, {quadro.memory_usage(deep=True).sum() / 2**20:.1f} MB | "
+          f"Painel mapeado: {tempo_painel * 1000:.1f} ms, {mapeado.memory_usage(index=False).sum() / 2**20:.1f} MB "
+          f"(páginas lidas sob demanda)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monta o painel float32 mapeado em memória (datas × tickers)")
+    parser.add_argument("--origem", type=str, default=FEATURE_DIR, help="Diretório das tabelas de origem")
+    parser.add_argument("--sufixo", type=str, default="_feat", help="Sufixo dos nomes das tabelas de origem")
+    parser.add_argument("--destino", type=str, default=PAINEL_DIR, help="Diretório do painel")
+    parser.add_argument("--campos", type=str, nargs="+", default=None, help="Campos a incluir (padrão: todas as colunas numéricas)")
+    parser.add_argument("--comparar", action="store_true", help="Compara a carga pelo painel com a leitura das tabelas")
+    parser.add_argument("--fechamentos", action="store_true", help="Monta também o painel de fechamentos a partir do OHLCV")
+    parser.add_argument("--ohlcv_dir", type=str, default=OHLCV_DIR, help="Diretório das tabelas OHLCV (painel de fechamentos)")
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    painel = construir_painel(args.origem, args.destino, args.sufixo, args.campos)
+    if args.fechamentos:
+        construir_painel_fechamentos(args.ohlcv_dir)
+    if args.comparar:
+        comparar_carga(painel, args.origem, args.sufixo)
@@ -0,0 +1,415 @@
+import os
+import ast
+import json
+import hashlib
+import argparse
+import functools
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Optional
+
+import storage
+from execucao import adicionar_argumento_workers, cores_por_worker, executar_por_ticker
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OHLCV_DIR = "data/ohlcv"
+FEATURE_DIR = "data/features"
+LABEL_DIR = "data/labels"
+PROCESSED_DIR = "data/processed"
+MODEL_DIR = "data/models"
+PAINEL_DIR = "data/painel"
+PAINEL_FECHAMENTOS_DIR = "data/painel_fechamentos"
+MANIFESTO_PATH = "data/.pipeline/manifesto.json"
+# Mesmo diretório de inference_xgb_refinado.SIGNALS_PATH (o módulo só é importado se a etapa rodar)
+SIGNALS_DIR = os.path.join(os.path.dirname(SRC_DIR), "data", "signals")
+
+
+@dataclass
+class Etapa:
+    """
+    Nó do DAG do pipeline.
+    - entradas/saidas: caminhos dos artefatos de um ticker (ou da etapa inteira, se por_ticker=False)
+    - parametros: nomes dos argumentos da linha de comando que influenciam o resultado
+    - codigo: scripts da etapa; eles e os módulos de src/ que importam (direta ou indiretamente)
+      fazem parte da impressão digital
+    """
+    nome: str
+    dependencias: list[str]
+    codigo: list[str]
+    entradas: Callable[[Optional[str], dict], list[str]]
+    saidas: Callable[[Optional[str], dict], list[str]]
+    executar: Callable
+    parametros: list[str] = field(default_factory=list)
+    por_ticker: bool = True
+    sempre: bool = False
+
+
+def _caminho_tabela(diretorio: str, nome: str) -> str:
+    return storage.localizar(diretorio, nome) or storage.caminho(diretorio, nome)
+
+
+def _tickers_processados() -> list[str]:
+    return [n.replace("_merged", "") for n in storage.listar(PROCESSED_DIR, "_merged")]
+
+
+# ---------------------------------------------------------------------------
+# Execução de cada etapa (imports tardios: cada script só é carregado se a etapa rodar)
+# ---------------------------------------------------------------------------
+
+def _executar_fetch(tickers, args, manifesto):
+    from fetch_all_ohlcv_salva_todos import atualizar_ohlcv_incremental
+    return executar_por_ticker(atualizar_ohlcv_incremental, tickers, workers=args.workers, etapa="fetch",
+                               output_dir=OHLCV_DIR)
+
+
+def _executar_features(tickers, args, manifesto):
+    from features_completo import processar_arquivo_ohlcv
+    return executar_por_ticker(processar_arquivo_ohlcv, tickers, workers=args.workers, etapa="features",
+                               input_dir=OHLCV_DIR, output_dir=FEATURE_DIR)
+
+
+def _executar_painel(_, args, manifesto):
+    from painel import construir_painel, construir_painel_fechamentos, META
+    construir_painel(FEATURE_DIR, PAINEL_DIR, "_feat")
+    construir_painel_fechamentos(OHLCV_DIR, PAINEL_FECHAMENTOS_DIR)
+    return [(None, os.path.join(PAINEL_DIR, META))], {}
+
+
+def _executar_labels(tickers, args, manifesto):
+    from label_completo import gerar_labels_para_arquivo
+    return executar_por_ticker(gerar_labels_para_arquivo, tickers, workers=args.workers, etapa="labels",
+                               input_dir=FEATURE_DIR, output_dir=LABEL_DIR, horizons=args.horizons,
+                               strategy=args.strategy, threshold=args.threshold, use_dynamic=args.dynamic)
+
+
+def _executar_merge(tickers, args, manifesto):
+    from merge_features_labels import merge_features_labels
+    return executar_por_ticker(merge_features_labels, tickers, workers=args.workers, etapa="merge",
+                               horizon=f"{args.horizon}d")
+
+
+def _executar_train(tickers, args, manifesto):
+    from model_xgb_grid_refinado import treinar_ticker, salvar_resultados
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    n_jobs = -1 if args.workers <= 1 else cores_por_worker(args.workers)
+    resultados, erros = executar_por_ticker(treinar_ticker, tickers, workers=args.workers, etapa="train",
+                                            processed_dir=PROCESSED_DIR, model_dir=MODEL_DIR, n_jobs=n_jobs,
+                                            horizon=args.horizon, busca=args.busca,
+                                            incremental=args.retreino_incremental, limite_drift=args.limite_drift,
+                                            memoria_externa=args.memoria_externa)
+    metricas = [r for _, r in resultados if r is not None]
+    if metricas:
+        salvar_resultados(metricas, MODEL_DIR, atualizar=True)
+    return resultados, erros
+
+
+def _sinais_do_dia() -> str:
+    return os.path.join(SIGNALS_DIR, f"signals_ranked_{datetime.now().date()}.csv")
+
+
+def _executar_inference(_, args, manifesto):
+    from inference_xgb_refinado import prever_e_rankear
+    prever_e_rankear(threshold=args.prob_threshold)
+    sinais = _sinais_do_dia()
+    return [(None, sinais if os.path.exists(sinais) else None)], {}
+
+
+def _executar_simulation(_, args, manifesto):
+    from simulation_xgb_refinado import simulate_purchase_from_csv
+    simulate_purchase_from_csv(args.capital, _sinais_atuais(manifesto), offline=args.offline)
+    return [(None, None)], {}
+
+
+def _sinais_atuais(manifesto: dict) -> str:
+    saidas = manifesto["nos"].get("inference", {}).get("saidas", [])
+    return saidas[0] if saidas else ""
+
+
+def _modelo(ticker: str) -> str:
+    return os.path.join(MODEL_DIR, f"{ticker}_xgb_model_refinado.pkl")
+
+
+ETAPAS = [
+    Etapa(
+        nome="fetch", dependencias=[], sempre=True,
+        codigo=["fetch_all_ohlcv_salva_todos.py"],
+        entradas=lambda t, a: [],
+        saidas=lambda t, a: [_caminho_tabela(OHLCV_DIR, t)],
+        executar=_executar_fetch,
+    ),
+    Etapa(
+        nome="features", dependencias=["fetch"],
+        codigo=["features_completo.py"],
+        entradas=lambda t, a: [_caminho_tabela(OHLCV_DIR, t)],
+        saidas=lambda t, a: [_caminho_tabela(FEATURE_DIR, f"{t}_feat")],
+        executar=_executar_features,
+    ),
+    Etapa(
+        nome="painel", dependencias=["features"], por_ticker=False,
+        codigo=["painel.py"],
+        entradas=lambda t, a: sorted(_caminho_tabela(FEATURE_DIR, n) for n in storage.listar(FEATURE_DIR, "_feat"))
+        + sorted(_caminho_tabela(OHLCV_DIR, n) for n in storage.listar(OHLCV_DIR)),
+        saidas=lambda t, a: [os.path.join(PAINEL_DIR, "meta.json"), os.path.join(PAINEL_FECHAMENTOS_DIR, "meta.json")],
+        executar=_executar_painel,
+    ),
+    Etapa(
+        nome="labels", dependencias=["features"],
+        codigo=["label_completo.py"],
+        parametros=["horizons", "strategy", "threshold", "dynamic"],
+        entradas=lambda t, a: [_caminho_tabela(FEATURE_DIR, f"{t}_feat")],
+        saidas=lambda t, a: [_caminho_tabela(LABEL_DIR, f"{t}_label_{h}d") for h in a.horizons],
+        executar=_executar_labels,
+    ),
+    Etapa(
+        nome="merge", dependencias=["features", "labels"],
+        codigo=["merge_features_labels.py"],
+        parametros=["horizon"],
+        entradas=lambda t, a: [_caminho_tabela(FEATURE_DIR, f"{t}_feat"),
+                               _caminho_tabela(LABEL_DIR, f"{t}_label_{a.horizon}d")],
+        saidas=lambda t, a: [_caminho_tabela(PROCESSED_DIR, f"{t}_merged")],
+        executar=_executar_merge,
+    ),
+    Etapa(
+        nome="train", dependencias=["merge"],
+        codigo=["model_xgb_grid_refinado.py", "busca_xgb.py", "memoria_externa.py", "matriz_features.py"],
+        parametros=["horizon", "busca", "retreino_incremental", "limite_drift", "memoria_externa"],
+        entradas=lambda t, a: [_caminho_tabela(PROCESSED_DIR, f"{t}_merged")],
+        saidas=lambda t, a: [_modelo(t)],
+        executar=_executar_train,
+    ),
+    Etapa(
+        nome="inference", dependencias=["merge", "train"], por_ticker=False,
+        codigo=["inference_xgb_refinado.py"],
+        parametros=["prob_threshold"],
+        entradas=lambda t, a: sorted(
+            p for ticker in _tickers_processados()
+            for p in (_caminho_tabela(PROCESSED_DIR, f"{ticker}_merged"), _modelo(ticker))
+        ),
+        # Arquivo de sinais do dia: em outro dia a etapa roda de novo em vez de repassar o anterior
+        saidas=lambda t, a: [_sinais_do_dia()],
+        executar=_executar_inference,
+    ),
+    Etapa(
+        nome="simulation", dependencias=["inference"], por_ticker=False,
+        codigo=["simulation_xgb_refinado.py", "precos.py"],
+        parametros=["capital", "offline"],
+        entradas=lambda t, a: [a.sinais] if a.sinais else [],
+        saidas=lambda t, a: [],
+        executar=_executar_simulation,
+    ),
+]
+
+
+def ordenar_etapas(etapas: list[Etapa]) -> list[Etapa]:
+    """
+    Ordenação topológica das etapas pelo campo dependencias.
+    """
+    por_nome = {e.nome: e for e in etapas}
+    ordem, visitando, visitadas = [], set(), set()
+
+    def visitar(nome):
+        if nome in visitadas:
+            return
+        if nome in visitando:
+            raise ValueError(f"Ciclo no pipeline envolvendo a etapa '{nome}'")
+        visitando.add(nome)
+        for dep in por_nome[nome].dependencias:
+            visitar(dep)
+        visitando.discard(nome)
+        visitadas.add(nome)
+        ordem.append(por_nome[nome])
+
+    for etapa in etapas:
+        visitar(etapa.nome)
+    return ordem
+
+
+# ---------------------------------------------------------------------------
+# Impressões digitais e manifesto
+# ---------------------------------------------------------------------------
+
+def carregar_manifesto() -> dict:
+    if os.path.exists(MANIFESTO_PATH):
+        with open(MANIFESTO_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"nos": {}, "arquivos": {}}
+
+
+def salvar_manifesto(manifesto: dict) -> None:
+    os.makedirs(os.path.dirname(MANIFESTO_PATH), exist_ok=True)
+    temporario = MANIFESTO_PATH + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=1, sort_keys=True)
+    os.replace(temporario, MANIFESTO_PATH)
+
+
+def hash_arquivo(path: str, manifesto: dict) -> str:
+    """
+    Hash do conteúdo de um arquivo e das partes anexadas a ele (storage.anexar). O resultado
+    fica em cache no manifesto pela chave (tamanho, mtime), evitando reler arquivos que não
+    mudaram desde a última execução; anexar atualiza o mtime do arquivo principal.
+    """
+    if not os.path.exists(path):
+        return "ausente"
+    st = os.stat(path)
+    chave = f"{st.st_size}:{st.st_mtime_ns}"
+    cache = manifesto["arquivos"].get(path)
+    if cache and cache["chave"] == chave:
+        return cache["hash"]
+
+    h = hashlib.sha256()
+    for arquivo in [path] + storage.partes(path):
+        with open(arquivo, "rb") as f:
+            for bloco in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloco)
+    manifesto["arquivos"][path] = {"chave": chave, "hash": h.hexdigest()}
+    return manifesto["arquivos"][path]["hash"]
+
+
+@functools.lru_cache(maxsize=None)
+def modulos_locais(arquivos: tuple[str, ...]) -> list[str]:
+    """
+    Arquivos de src/ alcançados pelos imports dos scripts, incluindo os imports tardios dentro
+    de funções (ex: features_completo → indicadores_incrementais → storage → instrumentacao).
+    Calculado uma vez por execução do pipeline.
+    """
+    visitados, pendentes = set(), list(arquivos)
+    while pendentes:
+        arquivo = pendentes.pop()
+        if arquivo in visitados:
+            continue
+        visitados.add(arquivo)
+        with open(os.path.join(SRC_DIR, arquivo), "r", encoding="utf-8") as f:
+            arvore = ast.parse(f.read(), filename=arquivo)
+        for no in ast.walk(arvore):
+            if isinstance(no, ast.Import):
+                nomes = [a.name for a in no.names]
+            elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+                nomes = [no.module]
+            else:
+                continue
+            for nome in nomes:
+                modulo = f"{nome.split('.')[0]}.py"
+                if os.path.exists(os.path.join(SRC_DIR, modulo)):
+                    pendentes.append(modulo)
+    return sorted(visitados)
+
+
+def impressao_digital(etapa: Etapa, ticker: Optional[str], args, manifesto: dict) -> str:
+    h = hashlib.sha256(etapa.nome.encode())
+    for arquivo in modulos_locais(tuple(etapa.codigo)):
+        h.update(arquivo.encode())
+        h.update(hash_arquivo(os.path.join(SRC_DIR, arquivo), manifesto).encode())
+    parametros = {p: getattr(args, p) for p in etapa.parametros}
+    h.update(json.dumps(parametros, sort_keys=True).encode())
+    for entrada in etapa.entradas(ticker, args):
+        h.update(entrada.encode())
+        h.update(hash_arquivo(entrada, manifesto).encode())
+    return h.hexdigest()
+
+
+def _desatualizado(etapa: Etapa, no: str, digital: str, ticker: Optional[str], args, manifesto: dict) -> bool:
+    if args.forcar or etapa.sempre:
+        return True
+    registro = manifesto["nos"].get(no)
+    if registro is None or registro["digital"] != digital:
+        return True
+    return not all(os.path.exists(p) for p in etapa.saidas(ticker, args) + registro.get("saidas", []) if p)
+
+
+# ---------------------------------------------------------------------------
+# Execução do DAG
+# ---------------------------------------------------------------------------
+
+def executar_pipeline(args) -> dict:
+    manifesto = carregar_manifesto()
+    etapas = ordenar_etapas(ETAPAS)
+    if args.ate:
+        nomes = [e.nome for e in etapas]
+        etapas = etapas[:nomes.index(args.ate) + 1]
+    etapas = [e for e in etapas if e.nome not in args.pular]
+
+    resumo = {}
+    for etapa in etapas:
+        if etapa.nome == "simulation":
+            args.sinais = _sinais_atuais(manifesto)
+            if not args.sinais or not os.path.exists(args.sinais):
+                print("📭 Nenhum arquivo de sinais disponível. Simulação não executada.")
+                continue
+
+        if etapa.por_ticker:
+            tickers = args.tickers or (_tickers_ohlcv() if etapa.nome != "fetch" else _pares_fetch())
+        else:
+            tickers = [None]
+
+        digitais = {t: impressao_digital(etapa, t, args, manifesto) for t in tickers}
+        nos = {t: etapa.nome if t is None else f"{etapa.nome}:{t}" for t in tickers}
+        pendentes = [t for t in tickers if _desatualizado(etapa, nos[t], digitais[t], t, args, manifesto)]
+
+        print(f"▶️  {etapa.nome}: {len(pendentes)} de {len(tickers)} nó(s) desatualizado(s)")
+        if not pendentes:
+            resumo[etapa.nome] = (0, len(tickers))
+            continue
+
+        resultados, erros = etapa.executar(pendentes if etapa.por_ticker else None, args, manifesto)
+        for ticker, erro in erros.items():
+            print(f"❌ {etapa.nome} {ticker}: {erro}")
+
+        for ticker, saida in resultados:
+            # Tickers ignorados ou com falha tratada (ex: target ausente) retornam None e não ficam em cache
+            if etapa.por_ticker and saida in (None, []):
+                continue
+            no = nos[ticker]
+            # A impressão digital é recalculada após a execução: o fetch altera a própria saída
+            manifesto["nos"][no] = {
+                "digital": impressao_digital(etapa, ticker, args, manifesto),
+                "saidas": [saida] if isinstance(saida, str) else [],
+                "executado_em": datetime.now().isoformat(timespec="seconds"),
+            }
+        salvar_manifesto(manifesto)
+        resumo[etapa.nome] = (len(pendentes), len(tickers))
+
+    return resumo
+
+
+def _tickers_ohlcv() -> list[str]:
+    return storage.listar(OHLCV_DIR)
+
+
+def _pares_fetch() -> list[str]:
+    from fetch_all_ohlcv_salva_todos import CRYPTO_PAIRS
+    return CRYPTO_PAIRS
+
+
+if __name__ == "__main__":
+    nomes = [e.nome for e in ETAPAS]
+    parser = argparse.ArgumentParser(description="Executa o pipeline completo, refazendo apenas os nós desatualizados")
+    parser.add_argument("--ate", type=str, choices=nomes, default=None, help="Última etapa a executar")
+    parser.add_argument("--pular", type=str, nargs="*", choices=nomes, default=[], help="Etapas a ignorar (ex: fetch para rodar offline)")
+    parser.add_argument("--tickers", type=str, nargs="*", default=None, help="Restringe a execução a estes tickers")
+    parser.add_argument("--forcar", action="store_true", help="Ignora o cache e refaz todas as etapas")
+    parser.add_argument("--horizons", type=int, nargs="+", default=[3, 5, 10], help="Horizontes dos labels em dias")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte usado no merge/treinamento")
+    parser.add_argument("--strategy", type=str, choices=["binary", "triple", "continuous"], default="binary", help="Tipo de label")
+    parser.add_argument("--threshold", type=float, default=0.02, help="Threshold fixo dos labels")
+    parser.add_argument("--dynamic", action="store_true", help="Threshold dinâmico baseado na volatilidade")
+    parser.add_argument("--busca", type=str, choices=["grid", "halving"], default="grid", help="Busca de hiperparâmetros do treinamento")
+    parser.add_argument("--retreino_incremental", action="store_true", help="Continua os modelos salvos em vez de refazer a busca")
+    parser.add_argument("--limite_drift", type=float, default=0.05, help="Queda de F1 que dispara a busca completa no retreino incremental")
+    parser.add_argument("--memoria_externa", action="store_true", help="Treino em lotes lidos do disco (candles intradiários)")
+    parser.add_argument("--prob_threshold", type=float, default=0.3, help="Probabilidade mínima para gerar sinal")
+    parser.add_argument("--capital", type=float, default=10000.0, help="Capital da simulação")
+    parser.add_argument("--offline", action="store_true", help="Simulação com o último fechamento salvo em vez do preço da Binance")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    if args.horizon not in args.horizons:
+        parser.error("--horizon precisa estar entre os --horizons gerados")
+    args.sinais = ""
+
+    resumo = executar_pipeline(args)
+    print("🏁 Pipeline finalizado: " + ", ".join(f"{k} {v[0]}/{v[1]}" for k, v in resumo.items()))
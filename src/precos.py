@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Dict, Iterable
+
+import storage
+from instrumentacao import chamada_api
+
+# Preços de um snapshot são reaproveitados por este tempo (segundos)
+TTL_PADRAO = 30.0
+CACHE_PATH = "data/cache/precos.json"
+OHLCV_DIR = "data/ohlcv"
+
+# Último snapshot em memória: {"timestamp": epoch, "precos": {symbol: preço}}
+_snapshot: Dict = {}
+_client = None
+
+
+def _obter_client():
+    # Importado sob demanda: o modo offline não precisa do python-binance nem de rede
+    global _client
+    if _client is None:
+        from binance.client import Client
+        from config import API_KEY, API_SECRET
+        _client = Client(API_KEY, API_SECRET)
+    return _client
+
+
+def _ler_cache_disco(cache_path: str) -> Dict:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _salvar_cache_disco(snapshot: Dict, cache_path: str) -> None:
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp = f"{cache_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, cache_path)
+
+
+def _snapshot_valido(snapshot: Dict, ttl: float) -> bool:
+    """
+    O snapshot traz todos os pares negociados: vale pelo tempo, e um símbolo ausente nele
+    (deslistado ou inexistente) é informado como sem preço em vez de forçar nova consulta.
+    """
+    return bool(snapshot) and time.time() - snapshot.get("timestamp", 0) <= ttl
+
+
+def buscar_snapshot_binance() -> Dict:
+    """
+    Uma única chamada a /api/v3/ticker/price sem símbolo traz o preço de todos os pares.
+    """
+    with chamada_api("ticker_preco"):
+        tickers = _obter_client().get_symbol_ticker()
+    return {"timestamp": time.time(), "precos": {t["symbol"]: float(t["price"]) for t in tickers}}
+
+
+def precos_offline(symbols: Iterable[str], ohlcv_dir: str = OHLCV_DIR) -> Dict[str, float]:
+    """
+    Último fechamento salvo de cada símbolo, para execuções sem rede.
+    """
+    precos = {}
+    for symbol in symbols:
+        try:
+            precos[symbol] = float(storage.ler(ohlcv_dir, symbol, columns=["close"], tail=1)["close"].iloc[-1])
+        except (FileNotFoundError, IndexError) as e:
+            logging.warning(f"[{symbol}] Sem preço offline: {e}")
+    return precos
+
+
+def obter_precos(symbols: Iterable[str], offline: bool = False, ttl: float = TTL_PADRAO,
+                 cache_path: str = CACHE_PATH, ohlcv_dir: str = OHLCV_DIR) -> Dict[str, float]:
+    """
+    Preço atual de cada símbolo pedido. Consulta primeiro o snapshot em memória, depois o cache
+    em disco, e só então faz uma única requisição em lote à Binance.
+    Símbolos sem preço ficam fora do dicionário retornado.
+    """
+    global _snapshot
+    symbols = set(symbols)
+    if offline:
+        return precos_offline(sorted(symbols), ohlcv_dir)
+
+    if not _snapshot_valido(_snapshot, ttl):
+        disco = _ler_cache_disco(cache_path)
+        if _snapshot_valido(disco, ttl):
+            _snapshot = disco
+        else:
+            _snapshot = buscar_snapshot_binance()
+            _salvar_cache_disco(_snapshot, cache_path)
+
+    precos = _snapshot["precos"]
+    for symbol in symbols - precos.keys():
+        logging.warning(f"[{symbol}] Par não encontrado no ticker da Binance")
+    return {s: precos[s] for s in symbols if s in precos}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Snapshot de preços atuais (uma requisição para todos os pares)")
+    parser.add_argument("symbols", type=str, nargs="+", help="Pares (ex: BTCUSDT ETHUSDT)")
+    parser.add_argument("--offline", action="store_true", help="Usa o último fechamento salvo em data/ohlcv")
+    parser.add_argument("--ttl", type=float, default=TTL_PADRAO, help="Validade do cache de preços em segundos")
+    args = parser.parse_args()
+
+    for symbol, preco in sorted(obter_precos(args.symbols, offline=args.offline, ttl=args.ttl).items()):
+        print(f"{symbol:<12} {preco:.8f}")
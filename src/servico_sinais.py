@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import storage
+from inference_xgb_refinado import MotorInferencia, PROCESSED_PATH, MODEL_PATH
+from instrumentacao import REGISTRO, adicionar_argumentos_metricas, amostrar, configurar_metricas, medir
+
+PORTA = 8080
+OHLCV_DIR = "data/ohlcv"
+FEATURE_DIR = "data/features"
+LABEL_DIR = "data/labels"
+# Intervalo entre verificações de novos candles/modelos (segundos)
+INTERVALO_ATUALIZACAO = 30.0
+# Etapa das latências das requisições no registro de instrumentacao
+ETAPA_HTTP = "http"
+
+
+def resumo_metricas() -> dict:
+    """
+    Latência (p50/p99) de cada rota e tempo das etapas de atualização (dados por ticker e pontuação),
+    a partir do registro compartilhado de instrumentacao.
+    """
+    rotas = {
+        metrica[len("latencia_"):-len("_s")]: {
+            "requisicoes": valores["contagem"],
+            "p50_ms": round(1000 * valores["p50"], 3),
+            "p99_ms": round(1000 * valores["p99"], 3),
+        }
+        for metrica, valores in REGISTRO.percentis(ETAPA_HTTP).items()
+    }
+    etapas = {}
+    for etapa, _, metrica, soma, contagem, maximo in REGISTRO.dados():
+        if metrica == "segundos" and etapa in ("dados", "atualizacao"):
+            item = etapas.setdefault(etapa, {"execucoes": 0, "segundos": 0.0, "maximo_s": 0.0})
+            item["execucoes"] += contagem
+            item["segundos"] = round(item["segundos"] + soma, 3)
+            item["maximo_s"] = round(max(item["maximo_s"], maximo), 3)
+    return {"rotas": rotas, "etapas": etapas}
+
+
+class ServicoSinais:
+    """
+    Mantém o MotorInferencia carregado e um snapshot dos scores de todos os ativos.
+    Uma thread refaz o snapshot periodicamente. Antes de pontuar, os candles novos do OHLCV
+    (coletados por outro processo: fetch --incremental ou streaming.py) passam pelas features
+    incrementais, labels e merge; com atualizar_dados=False, essa atualização fica a cargo de
+    outro processo (ex: pipeline.py). Como o motor invalida modelos e datasets pelo mtime, só os
+    ativos com candles ou modelos novos são relidos. As requisições apenas leem o snapshot atual.
+    Os merges são gravados em motor.processed_dir, de onde o motor lê os datasets.
+    """
+
+    def __init__(self, motor: MotorInferencia = None, intervalo: float = INTERVALO_ATUALIZACAO,
+                 atualizar_dados: bool = True, horizon: int = 5, strategy: str = "binary", threshold: float = 0.02,
+                 ohlcv_dir: str = OHLCV_DIR, feature_dir: str = FEATURE_DIR, label_dir: str = LABEL_DIR):
+        self.motor = motor or MotorInferencia()
+        self.intervalo = intervalo
+        self.atualizar_dados = atualizar_dados
+        self.horizon = horizon
+        self.strategy = strategy
+        self.threshold = threshold
+        self.ohlcv_dir = ohlcv_dir
+        self.feature_dir = feature_dir
+        self.label_dir = label_dir
+        self._mtimes_ohlcv = {}  # ticker -> mtime do OHLCV na última atualização dos dados
+        self.scores = pd.Series(dtype=float, name="score")
+        self._snapshot = ([], np.empty(0), {})
+        self.atualizado_em = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def atualizar_datasets(self) -> list[str]:
+        """
+        Leva os candles novos do OHLCV até os datasets processados lidos pelo motor.
+        Retorna os tickers atualizados; um ticker com falha é tentado de novo na próxima rodada.
+        """
+        from indicadores_incrementais import atualizar_features_incremental
+        from label_completo import gerar_labels_para_arquivo
+        from merge_features_labels import merge_features_labels
+
+        atualizados = []
+        for ticker in storage.listar(self.ohlcv_dir):
+            mtime = os.stat(storage.localizar(self.ohlcv_dir, ticker)).st_mtime_ns
+            if self._mtimes_ohlcv.get(ticker) == mtime:
+                continue
+            try:
+                # merge_features_labels e as etapas anteriores levantam exceção em vez de retornar None
+                with medir("dados", ticker):
+                    atualizar_features_incremental(ticker, self.ohlcv_dir, self.feature_dir)
+                    gerar_labels_para_arquivo(ticker, self.feature_dir, self.label_dir, [self.horizon],
+                                              self.strategy, self.threshold)
+                    merge_features_labels(ticker, f"{self.horizon}d", self.feature_dir, self.label_dir,
+                                          self.motor.processed_dir)
+                self._mtimes_ohlcv[ticker] = mtime
+                atualizados.append(ticker)
+            except Exception as e:
+                logging.error(f"Falha ao atualizar os dados de {ticker}: {e}")
+        return atualizados
+
+    def atualizar(self) -> None:
+        if self.atualizar_dados:
+            atualizados = self.atualizar_datasets()
+            if atualizados:
+                logging.info(f"Datasets atualizados com candles novos: {', '.join(atualizados)}")
+        with self._lock, medir("atualizacao"):
+            scores = self.motor.pontuar().sort_values(ascending=False)
+        # Respostas já prontas em ordem decrescente: /signals só corta a lista pelo threshold.
+        # Troca de referência: leitores veem o snapshot antigo ou o novo, nunca um parcial
+        sinais = [{"ticker": t, "score": float(v)} for t, v in scores.items()]
+        self._snapshot = (sinais, -scores.to_numpy(), {s["ticker"]: s["score"] for s in sinais})
+        self.scores = scores
+        self.atualizado_em = pd.Timestamp.now().isoformat(timespec="seconds")
+
+    def _loop(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.atualizar()
+            except Exception as e:
+                logging.error(f"Falha ao atualizar os scores: {e}")
+
+    def iniciar_atualizacao(self) -> None:
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def parar(self) -> None:
+        self._parar.set()
+
+    def sinais(self, threshold: float) -> list[dict]:
+        sinais, negativos, _ = self._snapshot
+        return sinais[:int(np.searchsorted(negativos, -threshold, side="right"))]
+
+    def score(self, ticker: str):
+        return self._snapshot[2].get(ticker)
+
+
+def criar_handler(servico: ServicoSinais):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _responder(self, status: int, corpo) -> None:
+            dados = json.dumps(corpo).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            inicio = time.perf_counter()
+            url = urlparse(self.path)
+            partes = url.path.strip("/").split("/")
+            rota = partes[0]
+
+            if url.path == "/signals":
+                try:
+                    threshold = float(parse_qs(url.query).get("threshold", ["0.3"])[0])
+                except ValueError:
+                    self._responder(400, {"erro": "threshold inválido"})
+                    return
+                self._responder(200, {"atualizado_em": servico.atualizado_em, "sinais": servico.sinais(threshold)})
+            elif rota == "score" and len(partes) == 2:
+                valor = servico.score(partes[1].upper())
+                if valor is None:
+                    self._responder(404, {"erro": f"ticker {partes[1]} sem score"})
+                else:
+                    self._responder(200, {"ticker": partes[1].upper(), "score": valor, "atualizado_em": servico.atualizado_em})
+            elif url.path == "/metrics":
+                self._responder(200, resumo_metricas())
+            else:
+                self._responder(404, {"erro": "rota não encontrada"})
+                return
+            amostrar(f"latencia_{rota}_s", time.perf_counter() - inicio, etapa=ETAPA_HTTP)
+
+        def log_message(self, format, *args):
+            # Log por requisição desligado: distorceria o teste de carga
+            pass
+
+    return Handler
+
+
+def iniciar_servidor(servico: ServicoSinais, porta: int = PORTA) -> ThreadingHTTPServer:
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), criar_handler(servico))
+    servidor.daemon_threads = True
+    return servidor
+
+
+def teste_carga(porta: int, requisicoes: int, concorrencia: int, tickers: list[str]) -> dict:
+    """
+    Dispara requisições alternando /signals e /score/{ticker} e mede a latência no cliente.
+    """
+    rotas = ["/signals?threshold=0.3"] + [f"/score/{t}" for t in tickers]
+
+    def chamar(i):
+        inicio = time.perf_counter()
+        with urllib.request.urlopen(f"http://127.0.0.1:{porta}{rotas[i % len(rotas)]}") as resp:
+            resp.read()
+        return time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        latencias = np.array(list(executor.map(chamar, range(requisicoes))))
+    duracao = time.perf_counter() - inicio
+    return {
+        "requisicoes": requisicoes,
+        "req_por_s": round(requisicoes / duracao, 1),
+        "p50_ms": round(1000 * float(np.percentile(latencias, 50)), 3),
+        "p99_ms": round(1000 * float(np.percentile(latencias, 99)), 3),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Serviço HTTP local de sinais ranqueados")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_ATUALIZACAO, help="Segundos entre atualizações dos scores")
+    parser.add_argument("--agrupado", action="store_true", help="Pontua com o modelo único de todos os ativos")
+    parser.add_argument("--sem_atualizar_dados", action="store_true",
+                        help="Não processa os candles novos do OHLCV (features, labels e merge feitos por outro processo)")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte do label no merge dos candles novos")
+    parser.add_argument("--strategy", type=str, choices=["binary", "triple", "continuous"], default="binary", help="Tipo de label (como no pipeline)")
+    parser.add_argument("--threshold", type=float, default=0.02, help="Threshold fixo dos labels (como no pipeline)")
+    parser.add_argument("--ohlcv_dir", type=str, default=OHLCV_DIR, help="Diretório do OHLCV atualizado pelo fetch/streaming")
+    parser.add_argument("--feature_dir", type=str, default=FEATURE_DIR, help="Diretório das features")
+    parser.add_argument("--label_dir", type=str, default=LABEL_DIR, help="Diretório dos labels")
+    parser.add_argument("--processed_dir", type=str, default=PROCESSED_PATH, help="Diretório dos datasets pontuados")
+    parser.add_argument("--model_dir", type=str, default=MODEL_PATH, help="Diretório dos modelos")
+    parser.add_argument("--carga", type=int, default=0, help="Executa um teste de carga com N requisições e encerra")
+    parser.add_argument("--concorrencia", type=int, default=8, help="Clientes simultâneos no teste de carga")
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    motor = MotorInferencia(args.processed_dir, args.model_dir, agrupado=args.agrupado)
+    servico = ServicoSinais(motor, intervalo=args.intervalo, atualizar_dados=not args.sem_atualizar_dados,
+                            horizon=args.horizon, strategy=args.strategy, threshold=args.threshold,
+                            ohlcv_dir=args.ohlcv_dir, feature_dir=args.feature_dir, label_dir=args.label_dir)
+    inicio = time.perf_counter()
+    servico.atualizar()
+    logging.info(f"{len(servico.scores)} ativos pontuados em {time.perf_counter() - inicio:.2f}s")
+    servico.iniciar_atualizacao()
+
+    servidor = iniciar_servidor(servico, args.porta)
+    if args.carga:
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        resultado = teste_carga(args.porta, args.carga, args.concorrencia, list(servico.scores.index))
+        logging.info(f"Teste de carga (cliente): {resultado}")
+        logging.info(f"Métricas do servidor: {resumo_metricas()}")
+        servidor.shutdown()
+    else:
+        logging.info(f"Servindo em http://127.0.0.1:{args.porta} (/signals?threshold=, /score/<ticker>, /metrics)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    servico.parar()
@@ -3,26 +3,14 @@ import math
 import csv
 import argparse
 from datetime import datetime
-from tabulate import tabulate
-from binance.client import Client
 from config import API_KEY as API_KEY
 from config import API_SECRET as API_SECRET
+from precos import obter_precos
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, cronometrado
 
 
-# Inicializa o cliente da Binance
-client = Client(API_KEY, API_SECRET)
-
-def fetch_price_binance(symbol: str) -> float:
-    """
-    Busca o preço atual de um par de criptomoedas na Binance.
-    """
-    try:
-        ticker_info = client.get_symbol_ticker(symbol=symbol)
-        return float(ticker_info["price"])
-    except Exception as e:
-        raise Exception(f"Falha ao obter preço de {symbol} da Binance: {e}")
-
-def simulate_purchase_from_csv(capital_total: float, signals_csv: str):
+@cronometrado("simulation")
+def simulate_purchase_from_csv(capital_total: float, signals_csv: str, offline: bool = False):
     if not os.path.exists(signals_csv):
         print(f"[ERRO] Arquivo {signals_csv} não encontrado.")
         return
@@ -40,11 +28,17 @@ def simulate_purchase_from_csv(capital_total: float, signals_csv: str):
     resultados = []
     total_investido = 0.0
 
+    # Uma única requisição traz o preço de todos os ativos sinalizados
+    try:
+        precos = obter_precos(tickers, offline=offline)
+    except Exception as e:
+        print(f"[ERRO] Falha ao obter preços: {e}")
+        return
+
     for ticker in tickers:
-        try:
-            preco_atual = fetch_price_binance(ticker)
-        except Exception as e:
-            print(f"[ERRO] {e}")
+        preco_atual = precos.get(ticker)
+        if preco_atual is None:
+            print(f"[ERRO] Preço de {ticker} indisponível")
             continue
 
         # Calcular a quantidade fracionária com base no capital alocado
@@ -87,13 +81,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--capital", type=float, default=10000.0, help="Capital total disponível para investimento")
     parser.add_argument("--signals_csv", type=str, required=True, help="Caminho para o arquivo de sinais CSV")
+    parser.add_argument("--offline", action="store_true", help="Usa o último fechamento salvo em data/ohlcv em vez do preço da Binance")
+    adicionar_argumentos_metricas(parser)
     args = parser.parse_args()
+    configurar_metricas(args)
 
     # Certifique-se de configurar suas chaves de API da Binance
-    if 'SUA_API_KEY' in API_KEY or 'SUA_API_SECRET' in API_SECRET:
+    if not args.offline and ('SUA_API_KEY' in API_KEY or 'SUA_API_SECRET' in API_SECRET):
         print("\n[AVISO] Por favor, configure suas chaves de API da Binance no arquivo ou variáveis de ambiente para obter preços reais.\n")
         # Para simulação offline sem chaves, pode-se mockar a função fetch_price_binance ou usar dados históricos.
         # Como o objetivo é usar dados da Binance, a configuração das chaves é necessária para preços atuais.
     
-    simulate_purchase_from_csv(args.capital, args.signals_csv)
+    simulate_purchase_from_csv(args.capital, args.signals_csv, offline=args.offline)
 
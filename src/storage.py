@@ -0,0 +1,320 @@
+import os
+import shutil
+import logging
+import argparse
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from instrumentacao import contar
+
+# Formato padrão das tabelas do pipeline: "parquet", "feather" (Arrow IPC) ou "csv"
+FORMATO_PADRAO = os.environ.get("CRIPTO_STORAGE_FORMAT", "parquet")
+
+EXTENSOES = {
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "csv": ".csv",
+}
+
+# Linhas por row group no Parquet: permite ler só o fim do arquivo sem decodificar o histórico todo
+ROW_GROUP_SIZE = 256
+
+# Anexos em formatos colunares viram arquivos-parte ao lado da tabela ({arquivo}.partes/), sem
+# regravar o histórico; acima deste número de partes, a tabela é compactada em um único arquivo
+MAX_PARTES = 64
+
+INDEX_COL = "date"
+
+
+def caminho(diretorio: str, nome: str, formato: Optional[str] = None) -> str:
+    """
+    Monta o caminho de uma tabela (ex: data/features, BTCUSDT_feat) no formato informado.
+    """
+    formato = formato or FORMATO_PADRAO
+    if formato not in EXTENSOES:
+        raise ValueError(f"Formato de armazenamento inválido: {formato}")
+    return os.path.join(diretorio, f"{nome}{EXTENSOES[formato]}")
+
+
+def localizar(diretorio: str, nome: str) -> Optional[str]:
+    """
+    Retorna o caminho existente da tabela, priorizando o formato padrão e depois os colunares.
+    """
+    ordem = [FORMATO_PADRAO] + [f for f in EXTENSOES if f != FORMATO_PADRAO]
+    for formato in ordem:
+        path = caminho(diretorio, nome, formato)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def existe(diretorio: str, nome: str) -> bool:
+    return localizar(diretorio, nome) is not None
+
+
+def listar(diretorio: str, sufixo: str = "") -> list[str]:
+    """
+    Lista os nomes das tabelas de um diretório (sem extensão), independente do formato.
+    """
+    if not os.path.isdir(diretorio):
+        return []
+    nomes = set()
+    for arquivo in os.listdir(diretorio):
+        base, ext = os.path.splitext(arquivo)
+        if ext in EXTENSOES.values() and base.endswith(sufixo):
+            nomes.add(base)
+    return sorted(nomes)
+
+
+def partes(path: str) -> list[str]:
+    """
+    Arquivos-parte anexados a uma tabela colunar, em ordem de gravação.
+    """
+    diretorio = path + ".partes"
+    if not os.path.isdir(diretorio):
+        return []
+    return [os.path.join(diretorio, a) for a in sorted(os.listdir(diretorio))]
+
+
+def _formato_do_caminho(path: str) -> str:
+    ext = os.path.splitext(path)[1]
+    for formato, extensao in EXTENSOES.items():
+        if extensao == ext:
+            return formato
+    raise ValueError(f"Extensão não suportada: {path}")
+
+
+def _normalizar(df: pd.DataFrame, float32: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Garante índice datetime chamado 'date' e converte as colunas pedidas para float32.
+    """
+    if INDEX_COL in df.columns:
+        df = df.set_index(INDEX_COL)
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df.index = pd.to_datetime(df.index)
+    df.index.name = INDEX_COL
+
+    if float32:
+        colunas = [c for c in float32 if c in df.columns]
+        df = df.astype({c: "float32" for c in colunas})
+    return df
+
+
+def salvar(df: pd.DataFrame, diretorio: str, nome: str, formato: Optional[str] = None,
+           float32: Optional[Iterable[str]] = None) -> str:
+    """
+    Salva uma tabela indexada por data. Colunas listadas em float32 são gravadas em precisão simples.
+    """
+    formato = formato or FORMATO_PADRAO
+    os.makedirs(diretorio, exist_ok=True)
+    path = caminho(diretorio, nome, formato)
+    df = _normalizar(df, float32)
+    _gravar(df, path, formato)
+
+    # Remove cópias antigas em outros formatos e partes anexadas, já incluídas na tabela gravada
+    for outro in EXTENSOES:
+        antigo = caminho(diretorio, nome, outro)
+        if outro != formato and os.path.exists(antigo):
+            os.remove(antigo)
+        shutil.rmtree(antigo + ".partes", ignore_errors=True)
+    return path
+
+
+def _gravar(df: pd.DataFrame, path: str, formato: str) -> None:
+    if formato == "csv":
+        df.to_csv(path)
+    elif formato == "parquet":
+        df.reset_index().to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+    else:
+        df.reset_index().to_feather(path)
+    contar("linhas_gravadas", len(df))
+
+
+def _ler_parquet(path: str, columns: Optional[list[str]], tail: Optional[int]) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(path)
+    cols = None if columns is None else [INDEX_COL] + [c for c in columns if c != INDEX_COL]
+    if tail is None:
+        return arquivo.read(columns=cols).to_pandas()
+
+    # Lê apenas os últimos row groups necessários para cobrir 'tail' linhas
+    grupos, linhas = [], 0
+    for i in range(arquivo.num_row_groups - 1, -1, -1):
+        grupos.insert(0, i)
+        linhas += arquivo.metadata.row_group(i).num_rows
+        if linhas >= tail:
+            break
+    if not grupos:
+        return arquivo.schema_arrow.empty_table().to_pandas()
+    return arquivo.read_row_groups(grupos, columns=cols).to_pandas().tail(tail)
+
+
+def ler(diretorio: str, nome: str, columns: Optional[list[str]] = None,
+        tail: Optional[int] = None) -> pd.DataFrame:
+    """
+    Lê uma tabela indexada por data.
+    - columns: projeção de colunas (o índice 'date' é sempre incluído)
+    - tail: quantidade de linhas finais a retornar
+    """
+    path = localizar(diretorio, nome)
+    if path is None:
+        raise FileNotFoundError(f"Tabela não encontrada: {os.path.join(diretorio, nome)}")
+    return ler_arquivo(path, columns=columns, tail=tail)
+
+
+def ler_arquivo(path: str, columns: Optional[list[str]] = None,
+                tail: Optional[int] = None) -> pd.DataFrame:
+    """
+    Lê a tabela e as partes anexadas a ela. Com 'tail', as partes são lidas do fim para o
+    começo e o arquivo principal só é aberto se elas não cobrirem as linhas pedidas.
+    """
+    blocos, linhas = [], 0
+    for parte in reversed(partes(path)):
+        if tail is not None and linhas >= tail:
+            break
+        blocos.insert(0, _ler_um(parte, columns, None if tail is None else tail - linhas))
+        linhas += len(blocos[0])
+    if tail is None or linhas < tail or not blocos:
+        blocos.insert(0, _ler_um(path, columns, None if tail is None else max(tail - linhas, 0)))
+    df = blocos[0] if len(blocos) == 1 else pd.concat(blocos)
+
+    # Bytes em memória após a leitura (não o tamanho comprimido no disco)
+    contar("linhas_lidas", len(df))
+    contar("bytes_lidos", int(df.memory_usage(index=True).sum()))
+    return df
+
+
+def _ler_um(path: str, columns: Optional[list[str]], tail: Optional[int]) -> pd.DataFrame:
+    formato = _formato_do_caminho(path)
+
+    if formato == "parquet":
+        df = _ler_parquet(path, columns, tail)
+    elif formato == "feather":
+        cols = None if columns is None else [INDEX_COL] + [c for c in columns if c != INDEX_COL]
+        df = pd.read_feather(path, columns=cols)
+    else:
+        usecols = None if columns is None else [INDEX_COL] + [c for c in columns if c != INDEX_COL]
+        df = pd.read_csv(path, usecols=usecols, parse_dates=[INDEX_COL])
+
+    df = _normalizar(df)
+    if tail is not None and formato != "parquet":
+        df = df.tail(tail)
+    return df
+
+
+def _esquema(path: str, formato: str) -> pd.DataFrame:
+    """
+    Tabela vazia com as colunas e tipos do arquivo, lida só dos metadados.
+    """
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+        esquema = pq.read_schema(path)
+    else:
+        import pyarrow.ipc as ipc
+        esquema = ipc.open_file(path).schema
+    return _normalizar(esquema.empty_table().to_pandas())
+
+
+def num_linhas(diretorio: str, nome: str) -> int:
+    """
+    Quantidade de linhas da tabela, incluindo as partes anexadas (no Parquet, lida dos metadados).
+    """
+    path = localizar(diretorio, nome)
+    if path is None:
+        raise FileNotFoundError(f"Tabela não encontrada: {os.path.join(diretorio, nome)}")
+    total = 0
+    for arquivo in [path] + partes(path):
+        if _formato_do_caminho(arquivo) == "parquet":
+            import pyarrow.parquet as pq
+            total += pq.ParquetFile(arquivo).metadata.num_rows
+        else:
+            total += len(_ler_um(arquivo, [], None))
+    return total
+
+
+def _descartar_cauda(path: str, formato: str, corte: pd.Timestamp) -> bool:
+    """
+    Remove das partes anexadas as linhas com data >= corte. Retorna False se o arquivo
+    principal também tem linhas a remover (a tabela precisa ser regravada).
+    """
+    for parte in reversed(partes(path)):
+        indice = _ler_um(parte, [], None).index
+        if len(indice) and indice.max() < corte:
+            return True
+        if (indice < corte).any():
+            restante = _ler_um(parte, None, None)
+            _gravar(restante[restante.index < corte], parte, formato)
+            return True
+        os.remove(parte)
+    ultimo = _ler_um(path, [], 1).index
+    return len(ultimo) == 0 or ultimo[-1] < corte
+
+
+def anexar(df: pd.DataFrame, diretorio: str, nome: str, substituir_desde=None) -> str:
+    """
+    Acrescenta linhas ao fim de uma tabela existente, sem regravar o histórico.
+    CSV é anexado no próprio arquivo; nos formatos colunares as linhas vão para um novo
+    arquivo-parte (com os tipos da tabela), e o mtime do arquivo principal é atualizado para
+    quem detecta mudanças por ele. Acima de MAX_PARTES partes, a tabela é compactada.
+    - substituir_desde: descarta antes as linhas a partir desta data (ex: o último candle, que
+      é recalculado); só regrava a tabela se elas estiverem no arquivo principal
+    """
+    path = localizar(diretorio, nome)
+    if path is None:
+        return salvar(df, diretorio, nome)
+
+    formato = _formato_do_caminho(path)
+    novos = _normalizar(df)
+    if substituir_desde is not None and not _descartar_cauda(path, formato, pd.Timestamp(substituir_desde)):
+        existente = ler_arquivo(path)
+        existente = existente[existente.index < pd.Timestamp(substituir_desde)]
+        float32 = [c for c, t in existente.dtypes.items() if t == "float32"]
+        return salvar(pd.concat([existente, novos]), diretorio, nome, formato, float32=float32)
+
+    if formato == "csv":
+        novos.to_csv(path, mode="a", header=False)
+        contar("linhas_gravadas", len(novos))
+        return path
+
+    esquema = _esquema(path, formato)
+    float32 = [c for c, t in esquema.dtypes.items() if t == "float32"]
+    if list(novos.columns) != list(esquema.columns):
+        # Colunas diferentes: a tabela precisa ser regravada com o novo esquema
+        return salvar(pd.concat([ler_arquivo(path), novos]), diretorio, nome, formato, float32=float32)
+
+    existentes = partes(path)
+    if len(existentes) >= MAX_PARTES:
+        return salvar(pd.concat([ler_arquivo(path), novos]), diretorio, nome, formato, float32=float32)
+
+    numero = int(os.path.splitext(os.path.basename(existentes[-1]))[0]) + 1 if existentes else 0
+    os.makedirs(path + ".partes", exist_ok=True)
+    _gravar(novos.astype(esquema.dtypes.to_dict()), os.path.join(path + ".partes", f"{numero:06d}{EXTENSOES[formato]}"), formato)
+    os.utime(path)
+    return path
+
+
+def exportar_csv(diretorio: str, nome: str, destino: str) -> str:
+    """
+    Exporta uma tabela colunar para CSV legível em outro diretório, sem alterar o original.
+    """
+    os.makedirs(destino, exist_ok=True)
+    path = os.path.join(destino, f"{nome}.csv")
+    ler(diretorio, nome).to_csv(path)
+    return path
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Exporta tabelas do pipeline para CSV")
+    parser.add_argument("diretorio", type=str, help="Diretório da etapa (ex: data/features)")
+    parser.add_argument("--nome", type=str, nargs="*", help="Tabelas a exportar (padrão: todas)")
+    parser.add_argument("--destino", type=str, default=None, help="Diretório de saída dos CSVs (padrão: data/export/<etapa>)")
+    args = parser.parse_args()
+
+    destino = args.destino or os.path.join("data", "export", os.path.basename(os.path.normpath(args.diretorio)))
+    for nome in args.nome or listar(args.diretorio):
+        path = exportar_csv(args.diretorio, nome, destino)
+        logging.info(f"[OK] {nome} → {path}")
@@ -0,0 +1,264 @@
+"""
+Ingestão contínua de candles pelo WebSocket de klines da Binance. Cada candle fechado passa por
+uma cadeia de geradores assíncronos: lote → OHLCV → features incrementais → pontuação → sinais.
+Uma fila limitada separa a leitura do socket do processamento: se o processamento atrasar, a
+fila enche, o leitor para de consumir o socket e o TCP segura o envio (backpressure).
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+import aiohttp
+import numpy as np
+import pandas as pd
+
+import storage
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, contar, cronometrado, medir
+from fetch_all_ohlcv_salva_todos import CRYPTO_PAIRS, INTERVAL, OUTPUT_DIR, intervalo_em_ms
+from indicadores_incrementais import atualizar_features_incremental
+
+WS_URL = "wss://stream.binance.com:9443"
+FEATURE_DIR = "data/features"
+MODEL_DIR = "data/models"
+SIGNALS_DIR = "data/signals"
+
+# Candles fechados aguardando processamento; cheia, a leitura do socket é suspensa
+TAMANHO_FILA = 1000
+# Candles de todos os pares fecham juntos: espera este tempo para processá-los em um só lote
+JANELA_LOTE = 0.5
+RECONEXAO_MAXIMA = 30.0
+
+
+def url_streams(ws_url: str, symbols: list[str], interval: str) -> str:
+    streams = "/".join(f"{s.lower()}@kline_{interval}" for s in symbols)
+    return f"{ws_url}/stream?streams={streams}"
+
+
+def kline_para_candle(k: dict) -> dict:
+    """
+    Converte o campo 'k' de um evento de kline em um candle OHLCV.
+    """
+    return {
+        "symbol": k["s"],
+        "date": pd.Timestamp(k["t"], unit="ms"),
+        "open": float(k["o"]), "high": float(k["h"]), "low": float(k["l"]),
+        "close": float(k["c"]), "volume": float(k["v"]),
+        "recebido": time.perf_counter(),
+    }
+
+
+async def receber_candles(url: str, fila: asyncio.Queue, reconectar: bool = True,
+                          gravar: Optional[str] = None) -> None:
+    """
+    Lê o stream combinado e coloca na fila apenas os candles fechados (k['x'] = true).
+    Reconecta com backoff exponencial; sem 'reconectar', termina quando o servidor fecha.
+    Com 'gravar', as mensagens brutas são anexadas em JSONL (para replay posterior).
+    """
+    espera = 1.0
+    arquivo = open(gravar, "a", encoding="utf-8") if gravar else None
+    try:
+        while True:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(url, heartbeat=30) as ws:
+                        logging.info(f"[WS] Conectado: {url[:80]}{'...' if len(url) > 80 else ''}")
+                        espera = 1.0
+                        async for msg in ws:
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                continue
+                            if arquivo:
+                                arquivo.write(msg.data + "\n")
+                            k = json.loads(msg.data).get("data", {}).get("k")
+                            if k and k["x"]:
+                                await fila.put(kline_para_candle(k))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"[WS] Conexão perdida: {e}")
+            if not reconectar:
+                break
+            logging.info(f"[WS] Reconectando em {espera:.0f}s...")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, RECONEXAO_MAXIMA)
+        # Fim do stream: o consumidor encerra a cadeia ao receber None
+        await fila.put(None)
+    finally:
+        if arquivo:
+            arquivo.close()
+
+
+async def lotes(fila: asyncio.Queue, janela: float = JANELA_LOTE) -> AsyncIterator[list[dict]]:
+    """
+    Agrupa os candles que chegam juntos (mesmo fechamento para vários pares) em um lote.
+    """
+    while True:
+        candle = await fila.get()
+        if candle is None:
+            return
+        lote = [candle]
+        limite = time.monotonic() + janela
+        while (restante := limite - time.monotonic()) > 0:
+            try:
+                candle = await asyncio.wait_for(fila.get(), restante)
+            except asyncio.TimeoutError:
+                break
+            if candle is None:
+                yield lote
+                return
+            lote.append(candle)
+        yield lote
+
+
+class Ingestao:
+    """
+    Estado do pipeline de streaming: último candle gravado por par, modelos em cache e scores.
+    """
+
+    def __init__(self, ohlcv_dir: str = OUTPUT_DIR, feature_dir: str = FEATURE_DIR, model_dir: str = MODEL_DIR,
+                 signals_dir: str = SIGNALS_DIR, interval: str = INTERVAL, threshold: float = 0.3):
+        from inference_xgb_refinado import RegistroModelos
+
+        self.ohlcv_dir = ohlcv_dir
+        self.feature_dir = feature_dir
+        self.signals_dir = signals_dir
+        self.passo = pd.Timedelta(milliseconds=intervalo_em_ms(interval))
+        self.threshold = threshold
+        self.registro = RegistroModelos(model_dir)
+        self.ultimo: dict[str, Optional[pd.Timestamp]] = {}
+        self.scores: dict[str, float] = {}
+
+    def _ultimo_gravado(self, symbol: str) -> Optional[pd.Timestamp]:
+        if symbol not in self.ultimo:
+            existente = storage.ler(self.ohlcv_dir, symbol, columns=[], tail=1) if storage.existe(self.ohlcv_dir, symbol) else None
+            self.ultimo[symbol] = existente.index[-1] if existente is not None and len(existente) else None
+        return self.ultimo[symbol]
+
+    @cronometrado("stream_ohlcv")
+    def gravar_ohlcv(self, lote: list[dict]) -> list[str]:
+        """
+        Anexa os candles novos ao OHLCV. Candles repetidos (ex: reenvio após reconexão) são ignorados.
+        """
+        atualizados = []
+        df = pd.DataFrame(lote).sort_values("date")
+        for symbol, grupo in df.groupby("symbol", sort=False):
+            ultimo = self._ultimo_gravado(symbol)
+            if ultimo is not None:
+                grupo = grupo[grupo["date"] > ultimo]
+                if len(grupo) and grupo["date"].iloc[0] - ultimo > self.passo:
+                    logging.warning(f"[{symbol}] Lacuna desde {ultimo}: execute o fetch para completar o histórico")
+            if grupo.empty:
+                continue
+            novos = grupo.set_index("date")[["open", "high", "low", "close", "volume"]]
+            storage.anexar(novos, self.ohlcv_dir, symbol)
+            self.ultimo[symbol] = novos.index[-1]
+            atualizados.append(symbol)
+        return atualizados
+
+    def atualizar_features(self, symbols: list[str]) -> list[str]:
+        prontos = []
+        for symbol in symbols:
+            try:
+                with medir("stream_features", symbol):
+                    atualizar_features_incremental(symbol, self.ohlcv_dir, self.feature_dir)
+                prontos.append(symbol)
+            except Exception as e:
+                logging.error(f"[ERRO] features {symbol}: {e}")
+        return prontos
+
+    @cronometrado("stream_sinais")
+    def pontuar(self, symbols: list[str]) -> pd.DataFrame:
+        """
+        Pontua o candle recém-fechado de cada par e regrava o ranking de sinais do dia,
+        no mesmo formato de prever_e_rankear.
+        """
+        for symbol in symbols:
+            modelo = self.registro.obter(symbol)
+            if modelo is None:
+                continue
+            booster, iteration_range = modelo
+            linha = storage.ler(self.feature_dir, f"{symbol}_feat", tail=1)
+            X = linha[booster.feature_names] if booster.feature_names else linha
+            proba = booster.inplace_predict(X.to_numpy(dtype=np.float32), iteration_range=iteration_range)
+            self.scores[symbol] = float(proba[0, 1] if proba.ndim == 2 else proba[0])
+
+        sinais = pd.DataFrame({"ticker": list(self.scores), "score": list(self.scores.values())})
+        sinais = sinais[sinais["score"] >= self.threshold].sort_values("score", ascending=False)
+        if not sinais.empty:
+            os.makedirs(self.signals_dir, exist_ok=True)
+            sinais.to_csv(os.path.join(self.signals_dir, f"signals_ranked_{datetime.now().date()}.csv"), index=False)
+        return sinais
+
+
+async def gravados(ingestao: Ingestao, entrada: AsyncIterator[list[dict]]) -> AsyncIterator[tuple[list[str], float]]:
+    async for lote in entrada:
+        # Etapas com disco e CPU rodam em thread: o loop continua lendo o socket enquanto isso
+        symbols = await asyncio.to_thread(ingestao.gravar_ohlcv, lote)
+        if symbols:
+            yield symbols, min(c["recebido"] for c in lote)
+
+
+async def com_features(ingestao: Ingestao, entrada: AsyncIterator) -> AsyncIterator[tuple[list[str], float]]:
+    async for symbols, recebido in entrada:
+        prontos = await asyncio.to_thread(ingestao.atualizar_features, symbols)
+        if prontos:
+            yield prontos, recebido
+
+
+async def sinais(ingestao: Ingestao, entrada: AsyncIterator) -> AsyncIterator[pd.DataFrame]:
+    async for symbols, recebido in entrada:
+        ranking = await asyncio.to_thread(ingestao.pontuar, symbols)
+        latencia = time.perf_counter() - recebido
+        contar("latencia_sinal_s", latencia, etapa="streaming")
+        contar("lotes", etapa="streaming")
+        logging.info(f"[SINAIS] {len(symbols)} par(es) atualizados, {len(ranking)} sinal(is) — "
+                     f"{1000 * latencia:.0f} ms após o recebimento")
+        yield ranking
+
+
+async def executar(symbols: list[str], interval: str = INTERVAL, ws_url: str = WS_URL, reconectar: bool = True,
+                   max_lotes: Optional[int] = None, gravar: Optional[str] = None, **kwargs) -> int:
+    """
+    Liga o leitor do WebSocket à cadeia de geradores. Retorna a quantidade de lotes processados.
+    """
+    ingestao = Ingestao(interval=interval, **kwargs)
+    fila: asyncio.Queue = asyncio.Queue(maxsize=TAMANHO_FILA)
+    leitor = asyncio.create_task(receber_candles(url_streams(ws_url, symbols, interval), fila, reconectar, gravar))
+    processados = 0
+    try:
+        async for _ in sinais(ingestao, com_features(ingestao, gravados(ingestao, lotes(fila)))):
+            processados += 1
+            if max_lotes and processados >= max_lotes:
+                break
+    finally:
+        leitor.cancel()
+    return processados
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    parser = argparse.ArgumentParser(description="Ingestão contínua de candles via WebSocket com atualização de sinais")
+    parser.add_argument("--symbols", type=str, nargs="*", default=CRYPTO_PAIRS, help="Pares assinados")
+    parser.add_argument("--interval", type=str, default=INTERVAL, help="Intervalo dos candles (ex: 1d, 1h, 1m)")
+    parser.add_argument("--ws_url", type=str, default=WS_URL, help="URL do WebSocket (ex: ws://localhost:8081 para o replay)")
+    parser.add_argument("--threshold", type=float, default=0.3, help="Probabilidade mínima para gerar sinal")
+    parser.add_argument("--ohlcv_dir", type=str, default=OUTPUT_DIR, help="Diretório da tabela OHLCV")
+    parser.add_argument("--feature_dir", type=str, default=FEATURE_DIR, help="Diretório das features")
+    parser.add_argument("--signals_dir", type=str, default=SIGNALS_DIR, help="Diretório dos sinais")
+    parser.add_argument("--max_lotes", type=int, default=None, help="Encerra após N lotes de candles (testes)")
+    parser.add_argument("--sem_reconexao", action="store_true", help="Encerra quando o servidor fechar a conexão")
+    parser.add_argument("--gravar", type=str, default=None, help="Anexa as mensagens recebidas neste arquivo JSONL")
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    lotes_processados = asyncio.run(executar(
+        args.symbols, args.interval, args.ws_url, reconectar=not args.sem_reconexao, max_lotes=args.max_lotes,
+        gravar=args.gravar, ohlcv_dir=args.ohlcv_dir, feature_dir=args.feature_dir, signals_dir=args.signals_dir,
+        threshold=args.threshold,
+    ))
+    logging.info(f"{lotes_processados} lote(s) processados")
@@ -0,0 +1,170 @@
+import os
+import time
+import itertools
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import storage
+from painel import carregar_fechamentos
+from execucao import adicionar_argumento_workers, cores_por_worker, executar_por_ticker, registrar_erros
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, contar, cronometrado
+from label_completo import create_labels_multi, calculate_dynamic_threshold
+from backtest import BACKTEST_DIR, TAXA, SLIPPAGE, executar_backtest, resumir
+from walk_forward import (PARAMS_PADRAO, PASSO_WALK_FORWARD, MIN_TREINO, assinatura_origens, registrar_origens,
+                          tabela_atualizada, walk_forward)
+
+FEATURE_DIR = "data/features"
+VARREDURA_DIR = os.path.join(BACKTEST_DIR, "varredura")
+# Combinações enviadas de uma vez a cada worker
+COMBINACOES_POR_TAREFA = 64
+
+
+def nome_probabilidades_labels(horizon: int, strategy: str, threshold: float, dynamic: bool,
+                               passo: int, min_treino: int) -> str:
+    sufixo = "dyn" if dynamic else f"th{threshold}"
+    return f"probabilidades_h{horizon}_{strategy}_{sufixo}_p{passo}_t{min_treino}"
+
+
+def walk_forward_labels(ticker: str, feature_dir: str = FEATURE_DIR, horizon: int = 5, strategy: str = "binary",
+                        threshold: float = 0.02, dynamic: bool = False, passo: int = PASSO_WALK_FORWARD,
+                        min_treino: int = MIN_TREINO, n_jobs: int = -1) -> pd.Series:
+    """
+    Walk-forward com labels recalculados a partir das features para uma configuração de label.
+    O classificador prevê o label positivo (1): alta acima do threshold em 'binary' e 'triple'.
+    """
+    X = storage.ler(feature_dir, f"{ticker}_feat").sort_index()
+    th = calculate_dynamic_threshold(X, horizon) if dynamic else threshold
+    colunas = create_labels_multi(X["close"].to_numpy(), [horizon], strategy, {horizon: th})
+    retorno = colunas[f"future_return_{horizon}d"]
+    y = pd.Series(np.where(np.isnan(retorno), np.nan, colunas[f"label_{horizon}d"] == 1), index=X.index)
+    proba = walk_forward(X, y, PARAMS_PADRAO, horizon, passo, min_treino, n_jobs)
+    return pd.Series(proba, index=X.index, name=ticker)
+
+
+def gerar_painel_labels(config: dict, tickers: list[str], workers: int, passo: int, min_treino: int) -> pd.DataFrame:
+    """
+    Painel de probabilidades (datas × tickers) de uma configuração de label, reaproveitado enquanto
+    as features dos tickers não mudarem (novos candles refazem o walk-forward).
+    """
+    nome = nome_probabilidades_labels(**config, passo=passo, min_treino=min_treino)
+    origens = assinatura_origens(FEATURE_DIR, [f"{t}_feat" for t in tickers])
+    if tabela_atualizada(BACKTEST_DIR, nome, origens):
+        return storage.ler(BACKTEST_DIR, nome)
+
+    n_jobs = -1 if workers <= 1 else cores_por_worker(workers)
+    resultados, erros = executar_por_ticker(walk_forward_labels, tickers, workers=workers, etapa="walk_forward", **config,
+                                            passo=passo, min_treino=min_treino, n_jobs=n_jobs)
+    registrar_erros(erros, f"walk-forward {nome}")
+    painel = pd.concat([serie for _, serie in resultados], axis=1).sort_index()
+    painel.index.name = storage.INDEX_COL
+    storage.salvar(painel, BACKTEST_DIR, nome, float32=list(painel.columns))
+    registrar_origens(BACKTEST_DIR, nome, origens)
+    print(f"✅ {nome}")
+    return painel
+
+
+def salvar_paineis(configs: list[dict], tickers: list[str], workers: int, passo: int, min_treino: int,
+                   destino: str = VARREDURA_DIR) -> tuple[str, str]:
+    """
+    Grava o painel de preços (T × N, já preenchido para frente, lido do painel compartilhado
+    quando em dia) e a pilha de probabilidades (K × T × N, float32) como .npy, para serem
+    abertos com memory map.
+    """
+    precos = carregar_fechamentos(tickers).reindex(columns=tickers).ffill()
+    probas = np.full((len(configs), *precos.shape), np.nan, dtype=np.float32)
+    for k, config in enumerate(configs):
+        painel = gerar_painel_labels(config, tickers, workers, passo, min_treino)
+        probas[k] = painel.reindex(index=precos.index, columns=precos.columns).to_numpy(dtype=np.float32)
+
+    # Começa na primeira data com alguma previsão
+    inicio = int(np.isfinite(probas).any(axis=(0, 2)).argmax())
+    os.makedirs(destino, exist_ok=True)
+    path_precos = os.path.join(destino, "precos.npy")
+    path_probas = os.path.join(destino, "probabilidades.npy")
+    np.save(path_precos, precos.to_numpy(dtype=float)[inicio:])
+    np.save(path_probas, np.ascontiguousarray(probas[:, inicio:]))
+    return path_precos, path_probas
+
+
+# Painéis abertos uma vez por processo (memory map somente leitura: as páginas do arquivo são
+# compartilhadas pelo cache do sistema operacional, nenhum worker copia os dados)
+_precos = None
+_probas = None
+
+
+def _abrir_paineis(path_precos: str, path_probas: str) -> None:
+    global _precos, _probas
+    _precos = np.load(path_precos, mmap_mode="r")
+    _probas = np.load(path_probas, mmap_mode="r")
+
+
+def _avaliar(combinacoes: list[tuple]) -> list[dict]:
+    linhas = []
+    for k, threshold, rebalanceamento, taxa, slippage in combinacoes:
+        resultado = executar_backtest(_precos, _probas[k], threshold, rebalanceamento, taxa, slippage,
+                                      preencher=False)
+        linhas.append({"config": k, "threshold": threshold, "rebalanceamento": rebalanceamento,
+                       "taxa": taxa, "slippage": slippage, **resumir(resultado)})
+    return linhas
+
+
+@cronometrado("varredura")
+def varrer(configs: list[dict], thresholds: list[float], rebalanceamentos: list[int], taxas: list[float],
+           slippages: list[float], path_precos: str, path_probas: str, workers: int = 1) -> pd.DataFrame:
+    combinacoes = list(itertools.product(range(len(configs)), thresholds, rebalanceamentos, taxas, slippages))
+    lotes = [combinacoes[i:i + COMBINACOES_POR_TAREFA] for i in range(0, len(combinacoes), COMBINACOES_POR_TAREFA)]
+
+    if workers <= 1:
+        _abrir_paineis(path_precos, path_probas)
+        partes = map(_avaliar, lotes)
+        linhas = [linha for parte in partes for linha in parte]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_abrir_paineis,
+                                 initargs=(path_precos, path_probas)) as executor:
+            linhas = [linha for parte in executor.map(_avaliar, lotes) for linha in parte]
+
+    contar("backtests", len(linhas))
+    df = pd.DataFrame(linhas)
+    rotulos = pd.DataFrame(configs).add_prefix("label_")
+    return rotulos.join(df.set_index("config"), how="right").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Varredura paralela de parâmetros do backtest")
+    parser.add_argument("--horizons", type=int, nargs="+", default=[3, 5, 10], help="Horizontes dos labels")
+    parser.add_argument("--strategies", type=str, nargs="+", choices=["binary", "triple"], default=["binary"], help="Estratégias de label")
+    parser.add_argument("--label_thresholds", type=float, nargs="+", default=[0.02], help="Thresholds fixos dos labels")
+    parser.add_argument("--dynamic", type=str, nargs="+", choices=["nao", "sim"], default=["nao", "sim"], help="Threshold dinâmico dos labels")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[round(x, 2) for x in np.arange(0.3, 0.91, 0.05)], help="Probabilidades mínimas de compra")
+    parser.add_argument("--rebalanceamentos", type=int, nargs="+", default=[1, 3, 5, 10, 20], help="Candles entre rebalanceamentos")
+    parser.add_argument("--taxas", type=float, nargs="+", default=[TAXA], help="Taxas por lado")
+    parser.add_argument("--slippages", type=float, nargs="+", default=[SLIPPAGE], help="Slippages por lado")
+    parser.add_argument("--passo", type=int, default=PASSO_WALK_FORWARD, help="Candles entre retreinos do walk-forward")
+    parser.add_argument("--min_treino", type=int, default=MIN_TREINO, help="Candles mínimos do primeiro treino")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    configs = []
+    for h, strategy, dyn in itertools.product(args.horizons, args.strategies, args.dynamic):
+        for th in ([None] if dyn == "sim" else args.label_thresholds):
+            configs.append({"horizon": h, "strategy": strategy, "threshold": th, "dynamic": dyn == "sim"})
+
+    tickers = [n.replace("_feat", "") for n in storage.listar(FEATURE_DIR, "_feat")]
+    print(f"🧮 {len(configs)} configurações de label × {len(tickers)} ativos: gerando probabilidades walk-forward...")
+    path_precos, path_probas = salvar_paineis(configs, tickers, args.workers, args.passo, args.min_treino)
+
+    inicio = time.perf_counter()
+    resultados = varrer(configs, args.thresholds, args.rebalanceamentos, args.taxas, args.slippages,
+                        path_precos, path_probas, args.workers)
+    duracao = time.perf_counter() - inicio
+
+    out_path = os.path.join(BACKTEST_DIR, "varredura_resultados.csv")
+    resultados.to_csv(out_path, index=False)
+    print(f"⏱️  {len(resultados)} combinações em {duracao:.1f}s")
+    print(resultados.sort_values("sharpe", ascending=False).head(10).to_string(index=False))
+    print(f"[✅ SALVO] Resultados da varredura em: {out_path}")
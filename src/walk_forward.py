@@ -0,0 +1,255 @@
+import os
+import json
+import argparse
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import storage
+from execucao import adicionar_argumento_workers, cores_por_worker, executar_por_ticker, registrar_erros
+from instrumentacao import adicionar_argumentos_metricas, configurar_metricas, contar
+from label_completo import separar_features_target, sem_retorno_futuro
+
+PROCESSED_DIR = "data/processed"
+WALK_FORWARD_DIR = "data/walk_forward"
+
+# O modelo é retreinado a cada PASSO candles; o primeiro treino exige MIN_TREINO candles
+PASSO_WALK_FORWARD = 63
+MIN_TREINO = 252
+# Parâmetros fixos em todas as janelas: os melhores_parametros da busca no histórico completo
+# foram escolhidos olhando os próprios períodos previstos (vazamento de informação futura)
+PARAMS_PADRAO = {"max_depth": 3, "learning_rate": 0.1, "n_estimators": 100, "subsample": 0.8, "colsample_bytree": 0.8, "gamma": 0}
+
+
+def nome_previsoes(horizon: int, passo: int, min_treino: int, janela: Optional[int] = None) -> str:
+    """
+    Nome da tabela de previsões de uma configuração do walk-forward (janela crescente ou móvel).
+    """
+    modo = f"m{janela}" if janela else "c"
+    return f"previsoes_h{horizon}_p{passo}_t{min_treino}_{modo}"
+
+
+def assinatura_origens(origem_dir: str, nomes: list[str]) -> dict[str, Optional[int]]:
+    """
+    Data de modificação (ns) de cada tabela de origem, gravada junto das previsões geradas a partir dela.
+    """
+    assinatura = {}
+    for nome in nomes:
+        path = storage.localizar(origem_dir, nome)
+        assinatura[nome] = os.stat(path).st_mtime_ns if path else None
+    return assinatura
+
+
+def _path_origens(output_dir: str, nome: str) -> str:
+    return os.path.join(output_dir, f"{nome}_origens.json")
+
+
+def tabela_atualizada(output_dir: str, nome: str, origens: dict) -> bool:
+    """
+    True se a tabela existe e as origens não foram criadas, removidas ou alteradas desde a geração
+    (novos candles, novos labels). Tabelas sem o registro das origens são tratadas como desatualizadas.
+    """
+    if not storage.existe(output_dir, nome):
+        return False
+    try:
+        with open(_path_origens(output_dir, nome), "r", encoding="utf-8") as f:
+            return json.load(f) == origens
+    except (OSError, ValueError):
+        return False
+
+
+def registrar_origens(output_dir: str, nome: str, origens: dict) -> None:
+    with open(_path_origens(output_dir, nome), "w", encoding="utf-8") as f:
+        json.dump(origens, f)
+
+
+def janelas(n: int, horizon: int = 5, passo: int = PASSO_WALK_FORWARD, min_treino: int = MIN_TREINO,
+            janela: Optional[int] = None) -> list[tuple[int, int, int, int]]:
+    """
+    Faixas de linhas (inicio_treino, fim_treino, inicio_previsao, fim_previsao) de cada retreino.
+    As últimas 'horizon' linhas antes do bloco previsto ficam fora do treino, pois seus labels
+    dependem de preços do próprio bloco. Com 'janela', o treino usa só as últimas 'janela' linhas.
+    """
+    faixas = []
+    for inicio in range(min_treino, n, passo):
+        fim_treino = inicio - horizon
+        inicio_treino = max(0, fim_treino - janela) if janela else 0
+        faixas.append((inicio_treino, fim_treino, inicio, min(inicio + passo, n)))
+    return faixas
+
+
+def _treinar_e_prever(X: pd.DataFrame, y: pd.Series, params: dict, faixa: tuple[int, int, int, int],
+                      n_jobs: int = -1) -> Optional[np.ndarray]:
+    from xgboost import XGBClassifier
+    from model_xgb_grid_refinado import parametros_base, calcular_scale_pos_weight
+
+    inicio_treino, fim_treino, inicio, fim = faixa
+    y_treino = y.iloc[inicio_treino:fim_treino].dropna()
+    if y_treino.nunique() < 2:
+        return None
+    modelo = XGBClassifier(**{**parametros_base(calcular_scale_pos_weight(y_treino),
+                                                None if n_jobs == -1 else n_jobs), **params})
+    modelo.fit(X.loc[y_treino.index], y_treino)
+    contar("ajustes")
+    return modelo.predict_proba(X.iloc[inicio:fim])[:, 1]
+
+
+def walk_forward(X: pd.DataFrame, y: pd.Series, params: dict, horizon: int = 5, passo: int = PASSO_WALK_FORWARD,
+                 min_treino: int = MIN_TREINO, n_jobs: int = -1, janela: Optional[int] = None) -> np.ndarray:
+    """
+    Probabilidades fora da amostra de um ticker, com todas as janelas no processo atual.
+    Linhas antes do primeiro treino (ou de janelas sem as duas classes) ficam NaN.
+    """
+    proba = np.full(len(X), np.nan)
+    for faixa in janelas(len(X), horizon, passo, min_treino, janela):
+        previsto = _treinar_e_prever(X, y, params, faixa, n_jobs)
+        if previsto is not None:
+            proba[faixa[2]:faixa[3]] = previsto
+    return proba
+
+
+@lru_cache(maxsize=4)
+def _dataset(processed_dir: str, ticker: str, horizon: int) -> tuple[pd.DataFrame, pd.Series]:
+    # Cada worker lê o dataset de um ticker uma vez e o reaproveita nas janelas seguintes
+    df = storage.ler(processed_dir, f"{ticker}_merged")
+    X, y = separar_features_target(df, horizon)
+    # Linhas sem retorno futuro ficam com y = NaN: fora do treino e das métricas por threshold
+    return X, y.mask(sem_retorno_futuro(df, y.name))
+
+
+def prever_janela(tarefa: tuple, processed_dir: str = PROCESSED_DIR, horizon: int = 5,
+                  n_jobs: int = -1) -> Optional[pd.DataFrame]:
+    """
+    Treina uma janela (ticker, número, faixa) e devolve as previsões do bloco seguinte
+    no formato longo (date, ticker, janela, proba, y).
+    """
+    ticker, numero, faixa = tarefa
+    X, y = _dataset(processed_dir, ticker, horizon)
+    proba = _treinar_e_prever(X, y, PARAMS_PADRAO, faixa, n_jobs)
+    if proba is None:
+        return None
+    inicio, fim = faixa[2], faixa[3]
+    return pd.DataFrame({
+        "ticker": ticker,
+        "janela": np.int32(numero),
+        "proba": proba.astype(np.float32),
+        "y": y.iloc[inicio:fim].to_numpy(dtype=np.float32),
+    }, index=X.index[inicio:fim])
+
+
+def gerar_previsoes(processed_dir: str = PROCESSED_DIR, output_dir: str = WALK_FORWARD_DIR, horizon: int = 5, passo: int = PASSO_WALK_FORWARD,
+                    min_treino: int = MIN_TREINO, janela: Optional[int] = None, workers: int = 1,
+                    refazer: bool = False) -> str:
+    """
+    Gera a tabela de previsões fora da amostra de todos os tickers, ou a reaproveita se os
+    datasets processados não mudaram desde a geração.
+    Cada par (ticker, janela) é uma tarefa independente do pool de processos.
+    Retorna o nome da tabela em output_dir.
+    """
+    nome = nome_previsoes(horizon, passo, min_treino, janela)
+    tabelas = storage.listar(processed_dir, "_merged")
+    origens = assinatura_origens(processed_dir, tabelas)
+    if not refazer and tabela_atualizada(output_dir, nome, origens):
+        print(f"♻️  Previsões já geradas: {storage.localizar(output_dir, nome)}")
+        return nome
+    if storage.existe(output_dir, nome) and not refazer:
+        print(f"🔄 Datasets processados alterados desde a geração de {nome}: refazendo as previsões...")
+
+    tarefas = []
+    for tabela in tabelas:
+        ticker = tabela.replace("_merged", "")
+        try:
+            n = len(_dataset(processed_dir, ticker, horizon)[0])
+        except KeyError as e:
+            print(f"⚠️  {ticker}: {e.args[0]}")
+            continue
+        tarefas += [(ticker, i, faixa) for i, faixa in enumerate(janelas(n, horizon, passo, min_treino, janela))]
+    _dataset.cache_clear()
+    if not tarefas:
+        raise ValueError(f"Nenhum ticker com histórico suficiente em {processed_dir}")
+
+    print(f"🔁 Walk-forward: {len(tarefas)} janelas de {len({t[0] for t in tarefas})} ticker(s)...")
+    n_jobs = -1 if workers <= 1 else cores_por_worker(workers)
+    resultados, erros = executar_por_ticker(prever_janela, tarefas, workers=workers, etapa="walk_forward",
+                                            processed_dir=processed_dir, horizon=horizon, n_jobs=n_jobs)
+    registrar_erros({f"{t[0]} janela {t[1]}": m for t, m in erros.items()}, "walk-forward")
+
+    previsoes = pd.concat([df for _, df in resultados if df is not None])
+    previsoes["ticker"] = previsoes["ticker"].astype("category")
+    previsoes.index.name = storage.INDEX_COL
+    previsoes = previsoes.sort_values([storage.INDEX_COL, "ticker"])
+    path = storage.salvar(previsoes, output_dir, nome)
+    registrar_origens(output_dir, nome, origens)
+    print(f"✅ {len(previsoes)} previsões fora da amostra salvas em: {path}")
+    return nome
+
+
+def carregar_previsoes(nome: str, output_dir: str = WALK_FORWARD_DIR,
+                       tickers: Optional[list[str]] = None) -> pd.DataFrame:
+    """
+    Previsões no formato longo, indexadas pela data.
+    """
+    previsoes = storage.ler(output_dir, nome)
+    previsoes["ticker"] = previsoes["ticker"].astype(str)
+    if tickers is not None:
+        previsoes = previsoes[previsoes["ticker"].isin(tickers)]
+    return previsoes
+
+
+def painel_probabilidades(nome: str, output_dir: str = WALK_FORWARD_DIR) -> pd.DataFrame:
+    """
+    Painel de probabilidades (datas × tickers) usado pelo backtest.
+    """
+    painel = carregar_previsoes(nome, output_dir).pivot(columns="ticker", values="proba")
+    painel.columns.name = None
+    return painel
+
+
+def analisar_thresholds(previsoes: pd.DataFrame, thresholds: list[float]) -> pd.DataFrame:
+    """
+    Métricas fora da amostra por ticker e threshold de decisão, só com as linhas que têm label.
+    """
+    # O scikit-learn só é carregado aqui: o backtest importa este módulo sem precisar dele
+    from sklearn.metrics import f1_score, precision_score, recall_score, roc_auc_score
+
+    linhas = []
+    for ticker, grupo in previsoes.dropna(subset=["y"]).groupby("ticker"):
+        y, proba = grupo["y"].to_numpy(), grupo["proba"].to_numpy()
+        roc = round(roc_auc_score(y, proba), 4) if len(np.unique(y)) > 1 else None
+        for threshold in thresholds:
+            pred = proba >= threshold
+            linhas.append({
+                "ticker": ticker,
+                "threshold": threshold,
+                "f1_score": round(f1_score(y, pred, zero_division=0), 4),
+                "precision": round(precision_score(y, pred, zero_division=0), 4),
+                "recall": round(recall_score(y, pred, zero_division=0), 4),
+                "roc_auc": roc,
+                "sinais": int(pred.sum()),
+                "linhas": len(y),
+            })
+    return pd.DataFrame(linhas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Previsões walk-forward fora da amostra")
+    parser.add_argument("--horizon", type=int, default=5, help="Horizonte do label")
+    parser.add_argument("--passo", type=int, default=PASSO_WALK_FORWARD, help="Candles entre retreinos")
+    parser.add_argument("--min_treino", type=int, default=MIN_TREINO, help="Candles mínimos do primeiro treino")
+    parser.add_argument("--janela", type=int, default=None, help="Treino em janela móvel com N candles (padrão: janela crescente)")
+    parser.add_argument("--refazer", action="store_true", help="Regera as previsões mesmo se estiverem em dia com os datasets")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.4, 0.5, 0.6, 0.7], help="Thresholds da análise fora da amostra")
+    adicionar_argumento_workers(parser)
+    adicionar_argumentos_metricas(parser)
+    args = parser.parse_args()
+    configurar_metricas(args)
+
+    nome = gerar_previsoes(horizon=args.horizon, passo=args.passo, min_treino=args.min_treino,
+                           janela=args.janela, workers=args.workers, refazer=args.refazer)
+    analise = analisar_thresholds(carregar_previsoes(nome), args.thresholds)
+    out_path = os.path.join(WALK_FORWARD_DIR, f"{nome}_thresholds.csv")
+    analise.to_csv(out_path, index=False)
+    print(analise.to_string(index=False))
+    print(f"[✅ SALVO] Análise de thresholds em: {out_path}")
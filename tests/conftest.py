@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os scripts importam os módulos de src/ pelo nome (ex: import storage), como ao rodar python src/<script>.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
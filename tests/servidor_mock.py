@@ -0,0 +1,14 @@
+from contextlib import asynccontextmanager
+
+from aiohttp.test_utils import TestServer
+
+from mock_binance import ServidorKlinesMock
+
+
+@asynccontextmanager
+async def servidor_local(servidor: ServidorKlinesMock):
+    """
+    Sobe o servidor mock em uma porta livre de localhost e devolve a URL base.
+    """
+    async with TestServer(servidor.app()) as http:
+        yield f"http://{http.host}:{http.port}"
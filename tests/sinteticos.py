@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+import storage
+
+
+def ohlcv_sintetico(n: int = 300, seed: int = 0) -> pd.DataFrame:
+    """
+    Candles diários de um movimento browniano geométrico.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, n))),
+        "low": np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, n))),
+        "close": close,
+        "volume": rng.lognormal(10, 1, n),
+    }, index=pd.date_range("2020-01-01", periods=n, freq="D", name=storage.INDEX_COL))
@@ -0,0 +1,121 @@
+import time
+import asyncio
+
+import aiohttp
+import pandas as pd
+import pytest
+
+import storage
+import fetch_async
+from fetch_async import LimitadorPeso
+from mock_binance import ServidorKlinesMock
+from servidor_mock import servidor_local
+from sinteticos import ohlcv_sintetico
+
+
+def registrar_status(servidor: ServidorKlinesMock) -> list[int]:
+    """
+    Guarda o status HTTP de cada resposta de /api/v3/klines do servidor mock.
+    """
+    status, original = [], servidor.klines
+
+    async def klines(request):
+        resposta = await original(request)
+        status.append(resposta.status)
+        return resposta
+
+    servidor.klines = klines
+    return status
+
+
+def buscar(servidor: ServidorKlinesMock, limitador: LimitadorPeso) -> list:
+    async def rodar():
+        async with servidor_local(servidor) as url, aiohttp.ClientSession() as session:
+            return await fetch_async._get_klines(session, limitador, url, {
+                "symbol": "TESTUSDT", "interval": "1d", "startTime": fetch_async.START_MS, "limit": 5,
+            })
+    return asyncio.run(rodar())
+
+
+def test_limitador_ressincroniza_com_o_peso_informado():
+    servidor = ServidorKlinesMock(peso_maximo=1000)
+    # Peso já consumido no minuto por outro cliente do mesmo IP
+    servidor.requisicoes.extend([(time.monotonic(), 100)] * 5)
+    limitador = LimitadorPeso(capacidade=800)
+
+    assert len(buscar(servidor, limitador)) == 5
+    # O balde local só descontou o peso da própria requisição; o cabeçalho informa 502 usados
+    assert limitador.tokens == pytest.approx(800 - 502, abs=1)
+
+
+def test_429_e_418_pausam_pelo_retry_after():
+    servidor = ServidorKlinesMock(peso_maximo=10, retry_after=0.1)
+    servidor.requisicoes.append((time.monotonic(), 10))
+    status = registrar_status(servidor)
+
+    limitador = LimitadorPeso()
+    pausas, pausar = [], limitador.pausar
+
+    def registrar_pausa(segundos):
+        pausas.append(segundos)
+        if len(pausas) == 4:
+            # Depois do banimento temporário (418), a janela de peso da exchange é liberada
+            servidor.requisicoes.clear()
+        pausar(segundos)
+
+    limitador.pausar = registrar_pausa
+    inicio = time.monotonic()
+
+    assert len(buscar(servidor, limitador)) == 5
+    assert status == [429, 429, 429, 418, 200]
+    assert pausas == [0.1] * 4
+    assert time.monotonic() - inicio >= 0.4
+
+
+def test_erro_5xx_e_repetido(monkeypatch):
+    monkeypatch.setattr(fetch_async, "BACKOFF_BASE", 0.01)
+    servidor = ServidorKlinesMock(taxa_falhas=0.5)
+    # As duas primeiras requisições respondem 503
+    sorteios = iter([0.0, 0.0, 1.0])
+    servidor.random.random = lambda: next(sorteios)
+    status = registrar_status(servidor)
+
+    assert len(buscar(servidor, LimitadorPeso())) == 5
+    assert status == [503, 503, 200]
+
+
+def test_incremental_anexa_candles_novos_e_regrava_se_o_ultimo_mudar(tmp_path):
+    ohlcv = ohlcv_sintetico(120)
+    servidor_dir, output_dir = str(tmp_path / "servidor"), str(tmp_path / "ohlcv")
+    servidor = ServidorKlinesMock(dados_dir=servidor_dir)
+
+    def publicar(df):
+        storage.salvar(df, servidor_dir, "TESTUSDT")
+        servidor._cache.clear()
+
+    def atualizar(incremental=True):
+        async def rodar():
+            async with servidor_local(servidor) as url:
+                return await fetch_async.atualizar_todos(["TESTUSDT"], interval="1d", output_dir=output_dir,
+                                                         incremental=incremental, base_url=url)
+        assert "TESTUSDT" in asyncio.run(rodar())
+
+    publicar(ohlcv.iloc[:100])
+    atualizar(incremental=False)
+    path = storage.localizar(output_dir, "TESTUSDT")
+    conteudo = open(path, "rb").read()
+
+    # Só candles novos: anexados em uma parte, sem regravar o histórico
+    publicar(ohlcv)
+    atualizar()
+    assert open(path, "rb").read() == conteudo
+    assert len(storage.partes(path)) == 1
+    pd.testing.assert_frame_equal(storage.ler(output_dir, "TESTUSDT"), ohlcv, check_freq=False)
+
+    # Último candle revisado: a tabela é regravada com o valor novo
+    revisado = ohlcv.copy()
+    revisado.iloc[-1, revisado.columns.get_loc("close")] *= 1.01
+    publicar(revisado)
+    atualizar()
+    assert storage.partes(path) == []
+    pd.testing.assert_frame_equal(storage.ler(output_dir, "TESTUSDT"), revisado, check_freq=False)
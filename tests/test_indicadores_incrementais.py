@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import storage
+from sinteticos import ohlcv_sintetico
+from instrumentacao import REGISTRO
+from features_completo import add_technical_indicators
+from indicadores_incrementais import COLUNAS, JANELA_CHECKSUM, atualizar_features_incremental, carregar_estado
+
+
+def comparar_com_lote(ohlcv: pd.DataFrame, output_dir) -> None:
+    incremental = storage.ler(str(output_dir), "TESTUSDT_feat")
+    lote = add_technical_indicators(ohlcv)
+    assert incremental.index.equals(lote.index)
+    for col in COLUNAS:
+        # As features são gravadas em float32
+        np.testing.assert_allclose(incremental[col], lote[col].astype(np.float32), rtol=1e-6, atol=1e-3, err_msg=col)
+
+
+@pytest.fixture
+def diretorios(tmp_path):
+    return tmp_path / "ohlcv", tmp_path / "features"
+
+
+def test_incremental_em_lotes_igual_ao_calculo_completo(diretorios):
+    input_dir, output_dir = diretorios
+    ohlcv = ohlcv_sintetico()
+
+    for fim in (120, 121, 200, 260, 300):
+        storage.salvar(ohlcv.iloc[:fim], str(input_dir), "TESTUSDT")
+        atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir))
+
+    assert carregar_estado(str(output_dir), "TESTUSDT")["linhas"] == len(ohlcv) - 1
+    comparar_com_lote(ohlcv, output_dir)
+
+
+def test_ultimo_candle_revisado_e_recalculado(diretorios):
+    input_dir, output_dir = diretorios
+    ohlcv = ohlcv_sintetico()
+
+    storage.salvar(ohlcv, str(input_dir), "TESTUSDT")
+    atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir))
+    # Candle ainda aberto na coleta anterior: o fechamento muda
+    ohlcv.iloc[-1, ohlcv.columns.get_loc("close")] *= 1.05
+    storage.salvar(ohlcv, str(input_dir), "TESTUSDT")
+
+    assert atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir)) == 1
+    comparar_com_lote(ohlcv, output_dir)
+
+
+@pytest.mark.parametrize("alteracao", ["revisao", "lacuna"])
+def test_historico_alterado_reconstroi_as_features(diretorios, alteracao):
+    input_dir, output_dir = diretorios
+    ohlcv = ohlcv_sintetico()
+
+    inicial = ohlcv.iloc[:250]
+    if alteracao == "lacuna":
+        # Lacuna preenchida depois pelo fetch
+        inicial = inicial.drop(inicial.index[100:105])
+    storage.salvar(inicial, str(input_dir), "TESTUSDT")
+    atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir))
+
+    if alteracao == "revisao":
+        # Candle já processado, dentro da janela conferida pelo checksum
+        ohlcv.iloc[230, ohlcv.columns.get_loc("close")] *= 1.1
+    storage.salvar(ohlcv, str(input_dir), "TESTUSDT")
+
+    assert atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir)) == len(ohlcv)
+    comparar_com_lote(ohlcv, output_dir)
+
+
+def test_atualizacao_le_so_a_cauda_e_anexa_as_features(diretorios):
+    input_dir, output_dir = diretorios
+    ohlcv = ohlcv_sintetico()
+
+    storage.salvar(ohlcv.iloc[:250], str(input_dir), "TESTUSDT")
+    atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir))
+    path = storage.localizar(str(output_dir), "TESTUSDT_feat")
+    conteudo = open(path, "rb").read()
+
+    for inicio in range(250, 300, 10):
+        storage.anexar(ohlcv.iloc[inicio:inicio + 10], str(input_dir), "TESTUSDT")
+        REGISTRO.limpar()
+        assert atualizar_features_incremental("TESTUSDT", str(input_dir), str(output_dir)) == 11
+        lidas = sum(soma for _, _, metrica, soma, _, _ in REGISTRO.dados() if metrica == "linhas_lidas")
+        assert lidas <= 11 + JANELA_CHECKSUM + 20
+
+    # O histórico de features não é regravado: as linhas novas ficam em partes anexadas
+    assert open(path, "rb").read() == conteudo
+    comparar_com_lote(ohlcv, output_dir)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+import storage
+from sinteticos import ohlcv_sintetico
+from features_completo import add_technical_indicators
+from indicadores_incrementais import COLUNAS
+from indicadores_painel import processar_painel
+
+
+@pytest.mark.parametrize("comprimentos", [(300, 300), (300, 150, 60)])
+def test_painel_igual_ao_calculo_por_simbolo(tmp_path, comprimentos):
+    input_dir, output_dir = str(tmp_path / "ohlcv"), str(tmp_path / "features")
+    # Símbolos listados em datas diferentes: históricos de tamanhos distintos, terminando no mesmo dia
+    dados = {f"S{i}USDT": ohlcv_sintetico(seed=i).iloc[-n:] for i, n in enumerate(comprimentos)}
+    for ticker, ohlcv in dados.items():
+        storage.salvar(ohlcv, input_dir, ticker)
+
+    assert len(processar_painel(input_dir, output_dir)) == len(dados)
+
+    for ticker, ohlcv in dados.items():
+        painel = storage.ler(output_dir, f"{ticker}_feat")
+        lote = add_technical_indicators(ohlcv)
+        assert painel.index.equals(lote.index), ticker
+        for col in COLUNAS:
+            # As features são gravadas em float32
+            np.testing.assert_allclose(painel[col], lote[col].astype(np.float32), rtol=1e-6, atol=1e-3,
+                                       err_msg=f"{ticker} {col}")
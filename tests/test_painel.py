@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+import storage
+from painel import carregar_fechamentos, construir_painel_fechamentos
+from sinteticos import ohlcv_sintetico
+
+
+def test_fechamentos_do_painel_so_quando_em_dia_com_o_ohlcv(tmp_path):
+    ohlcv_dir, painel_dir = str(tmp_path / "ohlcv"), str(tmp_path / "painel")
+    dados = {f"S{i}USDT": ohlcv_sintetico(seed=i) for i in range(2)}
+    for ticker, ohlcv in dados.items():
+        storage.salvar(ohlcv, ohlcv_dir, ticker)
+    tickers = list(dados)
+
+    construir_painel_fechamentos(ohlcv_dir, painel_dir)
+    close = carregar_fechamentos(tickers, ohlcv_dir, painel_dir)
+    assert (close.dtypes == np.float32).all()
+    np.testing.assert_allclose(close, pd.concat({t: df["close"] for t, df in dados.items()}, axis=1), rtol=1e-6)
+
+    # Candle novo no OHLCV depois da montagem: o painel fica de fora e o fechamento vem da tabela
+    ultimo = dados["S0USDT"].iloc[[-1]].copy()
+    ultimo.index += pd.Timedelta(days=1)
+    storage.anexar(ultimo, ohlcv_dir, "S0USDT")
+    close = carregar_fechamentos(tickers, ohlcv_dir, painel_dir)
+    assert (close.dtypes == np.float64).all()
+    assert close.index[-1] == ultimo.index[0]
+
+    # Painel montado de outro diretório não é usado
+    outro_dir = str(tmp_path / "outro")
+    for ticker, ohlcv in dados.items():
+        storage.salvar(ohlcv, outro_dir, ticker)
+    construir_painel_fechamentos(ohlcv_dir, painel_dir)
+    assert (carregar_fechamentos(tickers, outro_dir, painel_dir).dtypes == np.float64).all()
@@ -0,0 +1,25 @@
+import time
+
+import precos
+
+
+def test_simbolo_ausente_nao_invalida_o_snapshot(tmp_path, monkeypatch):
+    chamadas = []
+
+    def buscar_snapshot():
+        chamadas.append(time.time())
+        return {"timestamp": time.time(), "precos": {"BTCUSDT": 50000.0, "ETHUSDT": 3000.0}}
+
+    monkeypatch.setattr(precos, "buscar_snapshot_binance", buscar_snapshot)
+    monkeypatch.setattr(precos, "_snapshot", {})
+    cache_path = str(tmp_path / "precos.json")
+
+    for _ in range(3):
+        obtidos = precos.obter_precos(["BTCUSDT", "DELISTADOUSDT"], ttl=60, cache_path=cache_path)
+        assert obtidos == {"BTCUSDT": 50000.0}
+    assert len(chamadas) == 1
+
+    # Vencido o TTL, o snapshot é buscado de novo
+    precos._snapshot["timestamp"] -= 120
+    precos.obter_precos(["ETHUSDT"], ttl=60, cache_path=str(tmp_path / "outro.json"))
+    assert len(chamadas) == 2
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import storage
+
+
+def tabela(n: int = 500) -> pd.DataFrame:
+    return pd.DataFrame({
+        "close": np.arange(n, dtype=float),
+        "volume": np.arange(n, dtype=float) * 10,
+    }, index=pd.date_range("2020-01-01", periods=n, freq="D", name=storage.INDEX_COL))
+
+
+@pytest.mark.parametrize("formato", ["parquet", "feather"])
+def test_anexar_grava_partes_sem_regravar_a_tabela(tmp_path, formato):
+    df = tabela()
+    diretorio = str(tmp_path)
+    path = storage.salvar(df.iloc[:400], diretorio, "X", formato, float32=["volume"])
+    conteudo = open(path, "rb").read()
+
+    for inicio in range(400, 500, 20):
+        storage.anexar(df.iloc[inicio:inicio + 20], diretorio, "X")
+
+    assert open(path, "rb").read() == conteudo
+    assert len(storage.partes(path)) == 5
+    esperado = df.astype({"volume": "float32"})
+    pd.testing.assert_frame_equal(storage.ler(diretorio, "X"), esperado, check_freq=False)
+    pd.testing.assert_frame_equal(storage.ler(diretorio, "X", tail=30), esperado.tail(30), check_freq=False)
+    assert storage.listar(diretorio) == ["X"]
+
+
+def test_anexar_compacta_acima_do_limite_de_partes(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "MAX_PARTES", 3)
+    df = tabela()
+    diretorio = str(tmp_path)
+    path = storage.salvar(df.iloc[:400], diretorio, "X")
+
+    for inicio in range(400, 500, 20):
+        storage.anexar(df.iloc[inicio:inicio + 20], diretorio, "X")
+
+    assert len(storage.partes(path)) == 1
+    pd.testing.assert_frame_equal(storage.ler(diretorio, "X"), df, check_freq=False)
+
+    # salvar regrava a tabela inteira e descarta as partes
+    storage.salvar(df, diretorio, "X")
+    assert storage.partes(path) == []
+    assert not os.path.exists(path + ".partes")
@@ -0,0 +1,92 @@
+import os
+import pickle
+import asyncio
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBClassifier
+
+import storage
+import streaming
+from features_completo import add_technical_indicators
+from indicadores_incrementais import COLUNAS, atualizar_features_incremental
+from mock_binance import ServidorKlinesMock
+from servidor_mock import servidor_local
+from sinteticos import ohlcv_sintetico
+
+
+def treinar_modelo(feature_dir: str, model_dir: str, ticker: str) -> None:
+    feat = storage.ler(feature_dir, f"{ticker}_feat")[COLUNAS]
+    y = np.random.default_rng(0).integers(0, 2, len(feat))
+    modelo = XGBClassifier(n_estimators=5, max_depth=2).fit(feat, y)
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, f"{ticker}_xgb_model_refinado.pkl"), "wb") as f:
+        pickle.dump(modelo, f)
+
+
+def test_executar_anexa_candles_fechados_e_regrava_os_sinais(tmp_path, monkeypatch):
+    ticker = "TESTUSDT"
+    ohlcv = ohlcv_sintetico(120)
+    dirs = {nome: str(tmp_path / nome) for nome in ("servidor", "ohlcv", "features", "models", "signals")}
+    sinais_path = os.path.join(dirs["signals"], f"signals_ranked_{datetime.now().date()}.csv")
+
+    # Histórico local até o antepenúltimo candle, com features e modelo
+    storage.salvar(ohlcv.iloc[:-3], dirs["ohlcv"], ticker)
+    atualizar_features_incremental(ticker, dirs["ohlcv"], dirs["features"])
+    treinar_modelo(dirs["features"], dirs["models"], ticker)
+    ohlcv_path = storage.localizar(dirs["ohlcv"], ticker)
+    conteudo = open(ohlcv_path, "rb").read()
+
+    servidor = ServidorKlinesMock(dados_dir=dirs["servidor"], replay_ultimos=3, replay_intervalo=0.2)
+
+    def publicar(df):
+        storage.salvar(df, dirs["servidor"], ticker)
+        servidor._cache.clear()
+
+    # 1ª conexão: candles -4 (repetido), -3 e -2. Reconexão: reenvia -3 e -2 e traz o último
+    conexoes, stream = [], servidor.stream
+
+    async def contar_conexoes(request):
+        conexoes.append(request)
+        if len(conexoes) == 2:
+            publicar(ohlcv)
+        return await stream(request)
+
+    servidor.stream = contar_conexoes
+    publicar(ohlcv.iloc[:-1])
+
+    escritas, pontuar = [], streaming.Ingestao.pontuar
+
+    def registrar_sinais(self, symbols):
+        if os.path.exists(sinais_path):
+            os.remove(sinais_path)
+        ranking = pontuar(self, symbols)
+        escritas.append(pd.read_csv(sinais_path))
+        return ranking
+
+    monkeypatch.setattr(streaming.Ingestao, "pontuar", registrar_sinais)
+    # Cada barra do replay vira um lote próprio
+    monkeypatch.setattr(streaming.lotes, "__defaults__", (0.05,))
+
+    async def rodar():
+        async with servidor_local(servidor) as url:
+            return await asyncio.wait_for(streaming.executar(
+                [ticker], "1d", url, max_lotes=3, ohlcv_dir=dirs["ohlcv"], feature_dir=dirs["features"],
+                model_dir=dirs["models"], signals_dir=dirs["signals"], threshold=0.0), timeout=30)
+
+    assert asyncio.run(rodar()) == 3
+    assert len(conexoes) == 2
+
+    # Cada candle fechado é anexado uma única vez, em uma parte, sem regravar a tabela
+    assert open(ohlcv_path, "rb").read() == conteudo
+    assert len(storage.partes(ohlcv_path)) == 3
+    pd.testing.assert_frame_equal(storage.ler(dirs["ohlcv"], ticker), ohlcv, check_freq=False)
+
+    feat = storage.ler(dirs["features"], f"{ticker}_feat")
+    lote = add_technical_indicators(ohlcv)
+    assert feat.index.equals(lote.index)
+    np.testing.assert_allclose(feat[COLUNAS].tail(3), lote[COLUNAS].tail(3).astype(np.float32), rtol=1e-6, atol=1e-3)
+
+    assert len(escritas) == 3
+    assert all(sinais["ticker"].tolist() == [ticker] for sinais in escritas)